@@ -0,0 +1,240 @@
+"""
+Headless batch analysis of whole directories of .prg files.
+
+Example:
+    python batch_analyzer.py programs/ --output summary.jsonl --g-factor 0.5 --workers 8
+    python batch_analyzer.py programs/ --output summary.csv --annotated-dir annotated/
+
+Every .prg file below the input directory is parsed and analyzed in a process pool. One summary row per
+file (limiting speed, stress event counts by type, parse and analysis times) is written to a JSON Lines
+or CSV file as soon as the file is done. A file that fails to parse or analyze gets a row with
+status "error" and the run carries on with the remaining files, also when it kills its worker process.
+"""
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from concurrent.futures.process import BrokenProcessPool
+
+import web_analyzer_logic as logic
+
+STRESS_TYPES = ('Line-to-Line', 'Line-Arc Stress', 'Arc-to-Arc Stress', 'Path Intersection', 'Trace Spacing')
+SUMMARY_FIELDS = ['file', 'status', 'error', 'g_factor', 'segments', 'limiting_speed', 'limiting_feature',
+                  'min_arc_radius', 'line_to_line', 'line_arc', 'arc_to_arc', 'path_intersection', 'trace_spacing',
+                  'arc_info', 'parse_seconds', 'analysis_seconds']
+
+
+def find_prg_files(root):
+    """Returns all .prg files below root, sorted, as paths relative to root."""
+    found = []
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for filename in sorted(filenames):
+            if filename.lower().endswith('.prg'):
+                found.append(os.path.relpath(os.path.join(dirpath, filename), root))
+    return found
+
+
+def new_row(relative_path, g_factor, error=None):
+    row = dict.fromkeys(SUMMARY_FIELDS)
+    row.update({'file': relative_path, 'status': 'error' if error else 'ok', 'error': error, 'g_factor': g_factor})
+    return row
+
+
+def analyze_file(root, relative_path, g_factor, annotated_dir=None, min_trace_gap=logic.DEFAULT_MIN_TRACE_GAP,
+                 split_workers=1, toolpath_dir=None):
+    """
+    Analyzes one file and returns its summary row. Never raises; failures are reported in the row.
+    split_workers > 1 parses and analyzes the file itself in that many processes; the combined time is
+    then reported as analysis_seconds. With toolpath_dir, the parsed toolpath is loaded from (or saved
+    to) a binary toolpath file there instead of parsing the program every run.
+    """
+    row = new_row(relative_path, g_factor)
+    path = os.path.join(root, relative_path)
+    try:
+        toolpath_path = None
+        if toolpath_dir:
+            toolpath_path = os.path.join(toolpath_dir, relative_path + logic.TOOLPATH_SUFFIX)
+            os.makedirs(os.path.dirname(toolpath_path) or '.', exist_ok=True)
+        if split_workers > 1:
+            start = time.perf_counter()
+            with open(path, 'rb') as prg_file:
+                data = prg_file.read()
+            toolpath = logic.load_current_toolpath(toolpath_path, data) if toolpath_path else None
+            if toolpath is not None:
+                segments = toolpath['segments']
+                analysis = logic.run_path_stress_analysis(segments, g_factor, min_trace_gap)
+            else:
+                segments, analysis = logic.parse_and_analyze_parallel(data, g_factor, min_trace_gap, split_workers)
+                if toolpath_path:
+                    logic.save_toolpath(segments, toolpath_path, data)
+            row['analysis_seconds'] = round(time.perf_counter() - start, 4)
+        else:
+            start = time.perf_counter()
+            if toolpath_path:
+                segments = logic.load_or_parse_toolpath(path, toolpath_path)['segments']
+            else:
+                segments = logic.parse_prg_file(path)
+            row['parse_seconds'] = round(time.perf_counter() - start, 4)
+
+            start = time.perf_counter()
+            analysis = logic.run_path_stress_analysis(segments, g_factor, min_trace_gap)
+            row['analysis_seconds'] = round(time.perf_counter() - start, 4)
+        row['segments'] = len(segments)
+        limiting_speed, stress_events, arc_info_events, limiting_arc_details = analysis
+
+        row['limiting_speed'] = round(limiting_speed, 4) if limiting_speed is not None else None
+        row['limiting_feature'] = limiting_arc_details.get('feature_num')
+        row['min_arc_radius'] = limiting_arc_details.get('radius')
+        counts = {event_type: 0 for event_type in STRESS_TYPES}
+        for event in stress_events:
+            counts[event['type']] = counts.get(event['type'], 0) + 1
+        row['line_to_line'] = counts['Line-to-Line']
+        row['line_arc'] = counts['Line-Arc Stress']
+        row['arc_to_arc'] = counts['Arc-to-Arc Stress']
+        row['path_intersection'] = counts['Path Intersection']
+        row['trace_spacing'] = counts['Trace Spacing']
+        row['arc_info'] = len(arc_info_events)
+
+        if annotated_dir:
+            base, ext = os.path.splitext(os.path.join(annotated_dir, relative_path))
+            os.makedirs(os.path.dirname(base) or '.', exist_ok=True)
+            logic.create_annotated_prg_file(path, f"{base}_annotated{ext}", limiting_speed, stress_events,
+                                            arc_info_events, g_factor, limiting_arc_details)
+            with open(f"{base}_report.txt", 'w') as report_file:
+                report_file.write(logic.generate_analysis_report(limiting_speed, stress_events, g_factor,
+                                                                 limiting_arc_details))
+                report_file.write("\n")
+    except Exception as e:
+        row['status'] = 'error'
+        row['error'] = f"{type(e).__name__}: {e}"
+    return row
+
+
+def _run_pool(root, files, workers, g_factor, options):
+    """Yields (relative_path, row) as files finish; row is None for a file whose worker process died."""
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = {pool.submit(analyze_file, root, relative_path, g_factor, *options): relative_path
+                   for relative_path in files}
+        for future in as_completed(futures):
+            try:
+                row = future.result()
+            except BrokenProcessPool:
+                row = None
+            except Exception as e:
+                row = new_row(futures[future], g_factor, f"{type(e).__name__}: {e}")
+            yield futures[future], row
+
+
+def pool_rows(root, files, workers, g_factor, *options):
+    """
+    Analyzes files in a process pool (analyze_file(root, file, g_factor, *options)) and yields their rows
+    as they finish. If a worker process dies (e.g. killed for running out of memory), the pool breaks and
+    every unfinished file fails with it: those are run again in a new pool, and a file that is unfinished
+    in two broken pools is then run on its own, so only the file that kills its worker gets an error row.
+    """
+    pending, suspects, retried = list(files), [], set()
+    while pending or suspects:
+        if pending:
+            batch, batch_workers, pending = pending, workers, []
+        else:
+            batch, batch_workers, suspects = suspects[:1], 1, suspects[1:]
+        for relative_path, row in _run_pool(root, batch, batch_workers, g_factor, options):
+            if row is not None:
+                yield row
+            elif len(batch) == 1:
+                yield new_row(relative_path, g_factor,
+                              "BrokenProcessPool: the worker process analyzing this file died")
+            elif relative_path in retried:
+                suspects.append(relative_path)
+            else:
+                retried.add(relative_path)
+                pending.append(relative_path)
+
+
+class SummaryWriter:
+    """Writes summary rows as JSON Lines or CSV, flushing after each row so partial runs are kept."""
+
+    def __init__(self, path, output_format):
+        self.file = open(path, 'w', newline='')
+        self.output_format = output_format
+        if output_format == 'csv':
+            self.csv_writer = csv.DictWriter(self.file, fieldnames=SUMMARY_FIELDS)
+            self.csv_writer.writeheader()
+
+    def write(self, row):
+        if self.output_format == 'csv':
+            self.csv_writer.writerow(row)
+        else:
+            self.file.write(json.dumps(row) + "\n")
+        self.file.flush()
+
+    def close(self):
+        self.file.close()
+
+
+def write_rows(writer, rows, total):
+    """Writes rows as they arrive, printing progress. Returns the number of failed files."""
+    failures = 0
+    for done, row in enumerate(rows, 1):
+        writer.write(row)
+        if row['status'] != 'ok':
+            failures += 1
+            print(f"[{done}/{total}] FAILED {row['file']}: {row['error']}", file=sys.stderr)
+        else:
+            print(f"[{done}/{total}] {row['file']}", file=sys.stderr)
+    return failures
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Analyze every .prg file in a directory tree.")
+    parser.add_argument('input_dir', help="Directory to search for .prg files (recursively).")
+    parser.add_argument('-o', '--output', default='summary.jsonl', help="Summary file (default: summary.jsonl).")
+    parser.add_argument('--format', choices=['jsonl', 'csv'],
+                        help="Summary format (default: from the output extension, else jsonl).")
+    parser.add_argument('-g', '--g-factor', type=float, default=0.5,
+                        help="Acceleration limit as a factor of g=9800 mm/s^2 (default: 0.5).")
+    parser.add_argument('--min-trace-gap', type=float, default=logic.DEFAULT_MIN_TRACE_GAP,
+                        help="Report printed traces closer than this many mm (default: %(default)s).")
+    parser.add_argument('-w', '--workers', type=int, default=os.cpu_count() or 1,
+                        help="Number of worker processes (default: number of CPUs).")
+    parser.add_argument('--split-workers', type=int, default=1,
+                        help="Analyze the files one at a time, each split over this many processes "
+                             "(for a few very large files; default: 1, off).")
+    parser.add_argument('--toolpath-dir',
+                        help="Keep binary toolpath files here, so unchanged programs are not parsed again.")
+    parser.add_argument('--annotated-dir',
+                        help="Also write annotated .prg files and text reports here, mirroring the input tree.")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    output_format = args.format or ('csv' if args.output.lower().endswith('.csv') else 'jsonl')
+    files = find_prg_files(args.input_dir)
+    if not files:
+        print(f"No .prg files found in {args.input_dir}", file=sys.stderr)
+        return 1
+
+    writer = SummaryWriter(args.output, output_format)
+    try:
+        if args.split_workers > 1:
+            rows = (analyze_file(args.input_dir, relative_path, args.g_factor, args.annotated_dir, args.min_trace_gap,
+                                 args.split_workers, args.toolpath_dir)
+                    for relative_path in files)
+            failures = write_rows(writer, rows, len(files))
+        else:
+            rows = pool_rows(args.input_dir, files, max(1, args.workers), args.g_factor, args.annotated_dir,
+                             args.min_trace_gap, 1, args.toolpath_dir)
+            failures = write_rows(writer, rows, len(files))
+    finally:
+        writer.close()
+    print(f"Analyzed {len(files)} files ({failures} failed). Summary written to {args.output}", file=sys.stderr)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
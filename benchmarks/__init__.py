@@ -0,0 +1,6 @@
+"""
+Synthetic .prg programs and a benchmark suite for the analysis pipeline.
+
+synthetic_prg generates valid programs of any size without needing customer files;
+run_benchmarks times each pipeline stage on them and writes the results as JSON.
+"""
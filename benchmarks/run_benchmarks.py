@@ -0,0 +1,180 @@
+"""
+Times the analysis pipeline on synthetic programs and writes the results as JSON.
+
+Example:
+    python -m benchmarks.run_benchmarks --scales 1000 100000 1000000 --output bench.json
+    python -m benchmarks.run_benchmarks --output new.json --baseline bench.json --tolerance 0.25
+
+For every scale (number of .prg lines) a synthetic program is generated once into the work directory,
+then each stage is run --repeat times and its best wall time is recorded. Peak memory is measured in
+one extra run of each stage under tracemalloc, which covers both Python objects and NumPy arrays.
+Stages: parse_prg_file, run_path_stress_analysis, create_annotated_prg_file and animate_printer
+(incremental renderer with a bounded frame count; needs ffmpeg). With --baseline, stages that got
+slower than the tolerance allows are listed and the exit code is 1.
+"""
+import argparse
+import datetime
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+import web_analyzer_logic as logic
+from benchmarks.synthetic_prg import write_synthetic_prg
+
+DEFAULT_SCALES = [1_000, 10_000, 100_000, 1_000_000]
+STAGES = ('parse', 'analysis', 'annotate', 'animation')
+
+
+def measure(func, repeat=3, trace_memory=True):
+    """Runs func repeat times and returns (result of the last run, stats dict with seconds and peak_bytes)."""
+    seconds = []
+    result = None
+    for _ in range(max(1, repeat)):
+        start = time.perf_counter()
+        result = func()
+        seconds.append(time.perf_counter() - start)
+    stats = {'seconds': min(seconds), 'all_seconds': [round(s, 6) for s in seconds]}
+    if trace_memory:
+        tracemalloc.start()
+        try:
+            func()
+            stats['peak_bytes'] = tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+    return result, stats
+
+
+def benchmark_file(prg_path, work_dir, stages=STAGES, g_factor=0.5, repeat=3, trace_memory=True,
+                   animation_frames=150):
+    """Runs the selected stages on one program. Returns a dict of per-stage stats; failures are recorded."""
+    results = {}
+    segments, results['parse'] = measure(lambda: logic.parse_prg_file(prg_path), repeat, trace_memory)
+    analysis, stats = (None, None), None
+    if {'analysis', 'annotate', 'animation'} & set(stages):
+        analysis, stats = measure(
+            lambda: logic.run_path_stress_analysis(segments, g_factor, logic.DEFAULT_MIN_TRACE_GAP), repeat, trace_memory)
+        if 'analysis' in stages:
+            results['analysis'] = stats
+    limiting_speed, stress_events, arc_info_events, limiting_arc_details = analysis
+    if 'annotate' in stages:
+        annotated_path = os.path.join(work_dir, "annotated.prg")
+        _, results['annotate'] = measure(
+            lambda: logic.create_annotated_prg_file(prg_path, annotated_path, limiting_speed, stress_events,
+                                                    arc_info_events, g_factor, limiting_arc_details),
+            repeat, trace_memory)
+    if 'animation' in stages:
+        video_path = os.path.join(work_dir, "animation.mp4")
+        try:
+            _, results['animation'] = measure(
+                lambda: logic.animate_printer(prg_path, limiting_speed, video_path, render_mode='incremental',
+                                              max_frames=animation_frames),
+                1, trace_memory)
+        except Exception as e:
+            results['animation'] = {'error': f"{type(e).__name__}: {e}"}
+    if 'parse' not in stages:
+        del results['parse']
+    results['segments'] = len(segments)
+    results['stress_events'] = len(stress_events) if stress_events is not None else None
+    return results
+
+
+def environment_info():
+    info = {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'processor': platform.processor(), 'cpu_count': os.cpu_count()}
+    try:
+        info['git_commit'] = subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                                            cwd=os.path.dirname(os.path.abspath(__file__))).stdout.strip() or None
+    except OSError:
+        info['git_commit'] = None
+    return info
+
+
+def compare_to_baseline(report, baseline, tolerance):
+    """Returns one message per (scale, stage) that is more than tolerance slower than in baseline."""
+    previous = {(entry['scale'], stage): stats.get('seconds') for entry in baseline.get('results', [])
+                for stage, stats in entry['stages'].items() if isinstance(stats, dict)}
+    regressions = []
+    for entry in report['results']:
+        for stage, stats in entry['stages'].items():
+            old = previous.get((entry['scale'], stage))
+            new = stats.get('seconds') if isinstance(stats, dict) else None
+            if old and new and new > old * (1 + tolerance):
+                regressions.append(f"{stage} at {entry['scale']} lines: {old:.4f}s -> {new:.4f}s "
+                                   f"(+{(new / old - 1) * 100:.0f}%)")
+    return regressions
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Benchmark the .prg analysis pipeline on synthetic programs.")
+    parser.add_argument('--scales', type=int, nargs='+', default=DEFAULT_SCALES,
+                        help="Program sizes in lines (default: %(default)s).")
+    parser.add_argument('--stages', nargs='+', choices=STAGES, default=list(STAGES),
+                        help="Stages to run (default: all).")
+    parser.add_argument('-o', '--output', default='benchmark_results.json', help="JSON results file.")
+    parser.add_argument('--work-dir', default='benchmark_data',
+                        help="Where generated programs and outputs are kept (default: benchmark_data).")
+    parser.add_argument('--repeat', type=int, default=3, help="Timed runs per stage (default: 3).")
+    parser.add_argument('--no-memory', action='store_true', help="Skip the tracemalloc peak memory runs.")
+    parser.add_argument('-g', '--g-factor', type=float, default=0.5, help="G-factor for the analysis (default: 0.5).")
+    parser.add_argument('--seed', type=int, default=0, help="Seed of the synthetic programs (default: 0).")
+    parser.add_argument('--arc-fraction', type=float, default=0.4, help="Share of ARC2 moves (default: 0.4).")
+    parser.add_argument('--corner-sharpness', type=float, default=0.3,
+                        help="Probability of a sharp turn per move (default: 0.3).")
+    parser.add_argument('--animation-frames', type=int, default=150,
+                        help="Frame cap for the animation stage (default: 150).")
+    parser.add_argument('--baseline', help="Earlier results file to compare against.")
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help="Allowed slowdown against --baseline, as a fraction (default: 0.2).")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    os.makedirs(args.work_dir, exist_ok=True)
+    generator_options = {'seed': args.seed, 'arc_fraction': args.arc_fraction,
+                         'corner_sharpness': args.corner_sharpness}
+    report = {'created': datetime.datetime.now(datetime.timezone.utc).isoformat(timespec='seconds'),
+              'environment': environment_info(),
+              'parameters': {'g_factor': args.g_factor, 'repeat': args.repeat, 'trace_memory': not args.no_memory,
+                             'animation_frames': args.animation_frames, 'generator': generator_options},
+              'results': []}
+    for scale in args.scales:
+        prg_path = os.path.join(args.work_dir, f"synthetic_{scale}_s{args.seed}_a{args.arc_fraction:g}"
+                                               f"_c{args.corner_sharpness:g}.prg")
+        if not os.path.exists(prg_path):
+            print(f"Generating {prg_path}", file=sys.stderr)
+            write_synthetic_prg(prg_path, scale, **generator_options)
+        with open(prg_path, 'rb') as prg_file:
+            line_count = sum(1 for _ in prg_file)
+        print(f"Benchmarking {scale} lines", file=sys.stderr)
+        stages = benchmark_file(prg_path, args.work_dir, args.stages, args.g_factor, args.repeat, not args.no_memory,
+                                args.animation_frames)
+        entry = {'scale': scale, 'lines': line_count, 'file_bytes': os.path.getsize(prg_path),
+                 'segments': stages.pop('segments'), 'stress_events': stages.pop('stress_events'), 'stages': stages}
+        report['results'].append(entry)
+        for stage, stats in stages.items():
+            detail = stats.get('error') or f"{stats['seconds']:.4f}s" + (
+                f", peak {stats['peak_bytes'] / 1e6:.1f} MB" if 'peak_bytes' in stats else "")
+            print(f"  {stage}: {detail}", file=sys.stderr)
+        with open(args.output, 'w') as output_file:  # rewritten after every scale so partial runs are kept
+            json.dump(report, output_file, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as baseline_file:
+            regressions = compare_to_baseline(report, json.load(baseline_file), args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}", file=sys.stderr)
+        if regressions:
+            return 1
+    print(f"Results written to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
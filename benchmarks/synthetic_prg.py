@@ -0,0 +1,109 @@
+"""
+Generates synthetic but valid .prg programs at a chosen scale.
+
+Example:
+    python -m benchmarks.synthetic_prg synthetic_1M.prg --lines 1000000 --arc-fraction 0.5 --corner-sharpness 0.2
+
+Each feature is a rapid move (PTP/ev) to its own cell of a square grid, a shutter open (alternating
+between "Start gIntSubBuffer,ShutterOpen" and "OUT0.0=1"), an optional printing PTP/e move, an MSEG start
+and a random trace of LINE and ARC2 moves kept inside the cell, then a shutter close and its !Feature
+marker. Keeping every feature in its own cell gives a realistic trace density at every scale.
+The same arguments and seed always produce the same file.
+"""
+import argparse
+import math
+import random
+import sys
+
+ARC_RADII = (0.05, 0.1, 0.25, 0.5, 1.0)
+
+
+def iter_synthetic_prg(target_lines, seed=0, arc_fraction=0.4, corner_sharpness=0.3, segments_per_feature=200,
+                       feature_pitch=20.0):
+    """
+    Yields the lines of a synthetic program with about target_lines lines (the last feature is always
+    completed). arc_fraction is the share of ARC2 moves among the LINE/ARC2 moves; corner_sharpness is
+    the probability that a move starts with a sharp turn (20-150 degrees) instead of continuing smoothly.
+    """
+    rng = random.Random(seed)
+    feature_count = max(1, math.ceil(target_lines / (segments_per_feature + 6)))
+    columns = math.ceil(math.sqrt(feature_count))
+    reach = feature_pitch * 0.4  # traces stay within this distance of their cell center
+    written = 0
+    feature = 0
+    while written < target_lines:
+        feature += 1
+        row, column = divmod(feature - 1, columns)
+        center_x, center_y = (column + 0.5) * feature_pitch, (row + 0.5) * feature_pitch
+        x, y = center_x + rng.uniform(-reach, reach) / 2, center_y + rng.uniform(-reach, reach) / 2
+        heading = rng.uniform(0, 2 * math.pi)
+        lines = [f"PTP/ev (X,Y),{x:.4f},{y:.4f},gDblRapidSpeed",
+                 "Start gIntSubBuffer,ShutterOpen" if feature % 2 else "OUT0.0=1"]
+        if feature % 5 == 0:
+            x += 0.5 * math.cos(heading)
+            y += 0.5 * math.sin(heading)
+            lines.append(f"PTP/e (X,Y),{x:.4f},{y:.4f}")
+        lines.append(f"{'MSEG/v' if feature % 3 == 0 else 'MSEG'} (X,Y),{x:.4f},{y:.4f}")
+        for _ in range(segments_per_feature):
+            if math.hypot(x - center_x, y - center_y) > reach:
+                heading = math.atan2(center_y - y, center_x - x) + rng.uniform(-0.5, 0.5)
+            elif rng.random() < corner_sharpness:
+                heading += rng.choice((-1, 1)) * math.radians(rng.uniform(20, 150))
+            else:
+                heading += rng.uniform(-0.005, 0.005)
+            if rng.random() < arc_fraction:
+                radius = rng.choice(ARC_RADII)
+                side = rng.choice((-1, 1))
+                arc_x = x + radius * math.cos(heading + side * math.pi / 2)
+                arc_y = y + radius * math.sin(heading + side * math.pi / 2)
+                sweep = side * rng.uniform(0.2, 2.5)
+                lines.append(f"ARC2 (X,Y),{arc_x:.5f},{arc_y:.5f},{sweep:.5f}")
+                end_angle = math.atan2(y - arc_y, x - arc_x) + sweep
+                x, y = arc_x + radius * math.cos(end_angle), arc_y + radius * math.sin(end_angle)
+                heading += sweep
+            else:
+                length = rng.uniform(0.05, 1.0)
+                x += length * math.cos(heading)
+                y += length * math.sin(heading)
+                lines.append(f"LINE (X,Y),{x:.5f},{y:.5f}")
+        lines += ["ENDS", "Start gIntSubBuffer,ShutterClose" if feature % 2 else "OUT0.0=0", f"!Feature {feature}"]
+        for line in lines:
+            yield line + "\n"
+        written += len(lines)
+
+
+def write_synthetic_prg(path, target_lines, **options):
+    """Writes a synthetic program to path (see iter_synthetic_prg for the options). Returns the line count."""
+    count = 0
+    with open(path, 'w') as prg_file:
+        for line in iter_synthetic_prg(target_lines, **options):
+            prg_file.write(line)
+            count += 1
+    return count
+
+
+def build_arg_parser():
+    parser = argparse.ArgumentParser(description="Generate a synthetic .prg program.")
+    parser.add_argument('output', help="Path of the .prg file to write.")
+    parser.add_argument('-n', '--lines', type=int, default=10000, help="Approximate number of lines (default: 10000).")
+    parser.add_argument('--seed', type=int, default=0, help="Random seed (default: 0).")
+    parser.add_argument('--arc-fraction', type=float, default=0.4,
+                        help="Share of ARC2 moves among the LINE/ARC2 moves (default: 0.4).")
+    parser.add_argument('--corner-sharpness', type=float, default=0.3,
+                        help="Probability that a move starts with a sharp turn (default: 0.3).")
+    parser.add_argument('--segments-per-feature', type=int, default=200,
+                        help="LINE/ARC2 moves per feature (default: 200).")
+    return parser
+
+
+def main(argv=None):
+    args = build_arg_parser().parse_args(argv)
+    count = write_synthetic_prg(args.output, args.lines, seed=args.seed, arc_fraction=args.arc_fraction,
+                                corner_sharpness=args.corner_sharpness,
+                                segments_per_feature=args.segments_per_feature)
+    print(f"Wrote {count} lines to {args.output}", file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Background render jobs for the Streamlit app.
+
+One RenderJobQueue is shared by all sessions. Jobs run on a fixed number of worker threads (each job
+may use a few render processes of its own), so the CPU spent on rendering stays bounded however many
+sessions ask for videos at once. Jobs are keyed by what they render: submitting a key that is already
+queued, running or done returns the existing job, so a Streamlit rerun never starts the same render
+twice. Every job works in its own temporary directory, which is removed as soon as the job ends.
+Jobs run on the queue's threads, outside the caller's collect_metrics() block, so a render function
+that wants its stages measured opens its own and keeps the result on job.metrics.
+"""
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+JOB_QUEUED = 'queued'
+JOB_RUNNING = 'running'
+JOB_DONE = 'done'
+JOB_FAILED = 'failed'
+
+
+class RenderJob:
+    """State of one job. The worker thread updates it; the app polls state, progress and result."""
+
+    def __init__(self, key):
+        self.key = key
+        self.job_id = uuid.uuid4().hex[:8]
+        self.state = JOB_QUEUED
+        self.frames_done = 0
+        self.frame_total = None
+        self.result = None
+        self.error = None
+        self.metrics = None  # the render function may store the RunMetrics of its work here
+        self.submitted_at = time.time()
+        self.finished_at = None
+        self._finished = threading.Event()
+
+    def report_progress(self, frames_done, frame_total):
+        """Progress callback for the render function, e.g. animate_printer(progress=job.report_progress)."""
+        self.frames_done, self.frame_total = frames_done, frame_total
+
+    @property
+    def fraction(self):
+        return min(1.0, self.frames_done / self.frame_total) if self.frame_total else 0.0
+
+    @property
+    def done(self):
+        return self._finished.is_set()
+
+    def wait(self, timeout=None):
+        """Waits until the job is done or failed. Returns False if the timeout expired first."""
+        return self._finished.wait(timeout)
+
+
+class RenderJobQueue:
+    """
+    Runs render functions on max_workers threads. Finished jobs keep their result until more than
+    max_finished_jobs jobs have finished; the oldest are dropped first.
+    """
+
+    def __init__(self, max_workers=1, max_finished_jobs=16, temp_root=None):
+        self.max_finished_jobs = max_finished_jobs
+        self.temp_root = temp_root
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='render_job')
+        self._jobs = OrderedDict()  # key -> RenderJob, in submission order
+        self._lock = threading.Lock()
+
+    def submit(self, key, render, *args, **kwargs):
+        """
+        Queues render(job, work_dir, *args, **kwargs) and returns its RenderJob; its return value becomes
+        job.result. If a job with this key is already queued, running or done, that job is returned
+        instead (a failed one is run again).
+        """
+        with self._lock:
+            job = self._jobs.get(key)
+            if job is not None and job.state != JOB_FAILED:
+                return job
+            job = RenderJob(key)
+            self._jobs.pop(key, None)
+            self._jobs[key] = job
+        self._executor.submit(self._run, job, render, args, kwargs)
+        return job
+
+    def _run(self, job, render, args, kwargs):
+        job.state = JOB_RUNNING
+        work_dir = tempfile.mkdtemp(prefix=f"render_{job.job_id}_", dir=self.temp_root)
+        try:
+            job.result = render(job, work_dir, *args, **kwargs)
+            job.state = JOB_DONE
+        except Exception as e:
+            job.error = f"{e}"
+            job.state = JOB_FAILED
+        finally:
+            shutil.rmtree(work_dir, ignore_errors=True)
+            job.finished_at = time.time()
+            job._finished.set()
+            self._drop_old_jobs()
+
+    def _drop_old_jobs(self):
+        with self._lock:
+            finished = [key for key, job in self._jobs.items() if job.done]
+            for key in finished[:max(0, len(finished) - self.max_finished_jobs)]:
+                del self._jobs[key]
+
+    def jobs_ahead(self, job):
+        """Number of unfinished jobs submitted before `job` (how long it still waits for a worker)."""
+        with self._lock:
+            ahead = 0
+            for other in self._jobs.values():
+                if other is job:
+                    return ahead
+                ahead += not other.done
+            return ahead
+
+    def shutdown(self, wait=True):
+        self._executor.shutdown(wait=wait)
@@ -1,29 +1,182 @@
 import streamlit as st
+import io
 import os
 import web_analyzer_logic as logic  # Import our NEW logic file
-import configparser
-import shutil  # For cleaning up temp files
+import logging
+import render_jobs
 
 # --- 1. Page Configuration ---
 st.set_page_config(page_title="Aerosol Jet Analyzer", layout="wide")
 st.title("Aerosol Jet .prg Analyzer 🚀")
 st.write("Upload a .prg file and set the G-Factor to analyze its mechanical stress points and generate an animation.")
 
-# --- 2. Configuration & Temp Folder Setup ---
-# Create a temporary directory for this user's session
-TEMP_DIR = "temp_files"
-if not os.path.exists(TEMP_DIR):
-    os.makedirs(TEMP_DIR)
+# --- 2. Configuration ---
+MAX_ANIMATION_FRAMES = 900  # caps the video at one minute (15 fps) however large the file is
+ANIMATION_WORKERS = min(4, os.cpu_count() or 1)  # processes used to render and encode video chunks
+RENDER_JOB_SLOTS = 1  # animations rendered at once across all sessions (each uses ANIMATION_WORKERS processes)
+RENDER_POLL_SECONDS = 0.5  # how often the page refreshes a render's progress
+RESULT_CACHE_BYTES = 512 * 1024 * 1024  # results of recent files are kept in memory up to this size
+GZIP_DOWNLOAD_THRESHOLD = 10 * 1024 * 1024  # annotated files larger than this also get a gzip download
+PROFILE_CHART_POINTS = 2000  # the speed profile chart is reduced to this many points
+G_SWEEP_VALUES = [round(0.1 * i, 1) for i in range(1, 21)]  # G-factors 0.1 to 2.0 for the sweep table
+VIEWER_ZOOM_LEVELS = [2 ** i for i in range(13)]  # zoom factors of the toolpath viewer, 1x (whole file) to 4096x
+VIEWER_EVENT_WINDOW = 2.0  # mm; "Go to event" zooms in until the view is at most this wide
+
+
+@st.cache_resource
+def get_result_cache():
+    """One result cache for the whole server, shared by all sessions."""
+    return logic.ResultCache(max_bytes=RESULT_CACHE_BYTES)
+
+
+@st.cache_resource
+def get_render_queue():
+    """One render job queue for the whole server, so concurrent sessions share RENDER_JOB_SLOTS."""
+    return render_jobs.RenderJobQueue(max_workers=RENDER_JOB_SLOTS)
+
+
+@st.cache_resource
+def configure_metrics_logging():
+    """Sends the per-run performance log lines (one JSON object per line) to stderr, once per server."""
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(asctime)s %(name)s %(message)s"))
+    logic.METRICS_LOGGER.addHandler(handler)
+    logic.METRICS_LOGGER.setLevel(logging.INFO)
+    logic.METRICS_LOGGER.propagate = False
+    return handler
+
+
+configure_metrics_logging()
+
+
+def performance_table(metrics):
+    return {
+        "Stage": ["\u00a0\u00a0\u00a0\u00a0" * record['depth'] + record['stage'] for record in metrics.stages],
+        "Time (s)": [round(record['seconds'], 3) for record in metrics.stages],
+        "Peak Memory (MB)": [round(record['peak_bytes'] / 1e6, 1) if record['peak_bytes'] is not None else None
+                             for record in metrics.stages],
+        "Counts": [", ".join(f"{name}={value:,}" for name, value in record['counters'].items())
+                   for record in metrics.stages],
+    }
+
+
+def create_annotated_bytes(file_bytes, results, g_factor, compress=False):
+    # Streamed straight from the uploaded bytes, no round trip through the temp folder
+    return logic.annotate_prg_bytes(
+        file_bytes, results['limiting_speed'], results['stress_events'], results['arc_info_events'],
+        g_factor, results['limiting_arc_details'], compress=compress
+    )
+
+
+def format_duration(seconds):
+    hours, remainder = divmod(int(round(seconds)), 3600)
+    minutes, secs = divmod(remainder, 60)
+    return f"{hours}:{minutes:02d}:{secs:02d}"
+
+
+def render_preview_png(results, file_name):
+    preview_png = io.BytesIO()
+    logic.render_toolpath_preview(results['segments'], preview_png, results['stress_events'],
+                                  title=f"Toolpath Preview ({file_name})")
+    return preview_png.getvalue()
+
+
+def render_window_png(lod, view, x_range, y_range, file_name):
+    window_png = io.BytesIO()
+    logic.render_toolpath_window(view, lod, window_png, x_range, y_range, title=f"Toolpath ({file_name})")
+    return window_png.getvalue()
+
+
+@st.fragment
+def toolpath_viewer(result_cache, results, file_name, min_trace_gap):
+    # A fragment: opening the viewer, panning and zooming rerun only this function, not the analysis around it
+    digest, stress_events = results['digest'], results['stress_events']
+    if not st.toggle("Open the viewer", key=f"viewer_{digest}_open"):
+        st.caption("Builds a zoomable level-of-detail view of the toolpath (a few seconds for very large programs).")
+        return
+    with st.spinner("Building the zoomable view..."):
+        # Independent of the G-factor; built once per file and trace gap (the stress events depend on it)
+        lod = result_cache.get_or_compute(
+            ('lod', digest, min_trace_gap),
+            lambda: logic.build_lod_pyramid(results['segments'], stress_events)
+        )
+    x_min, x_max, y_min, y_max = lod['bounds']
+    full_width = max(x_max - x_min, y_max - y_min, 1e-6)
+    key = f"viewer_{digest}"
+    st.session_state.setdefault(f"{key}_x", float((x_min + x_max) / 2))
+    st.session_state.setdefault(f"{key}_y", float((y_min + y_max) / 2))
+    st.session_state.setdefault(f"{key}_zoom", 1)
+
+    def go_to_event():
+        index = st.session_state[f"{key}_event"] - 1
+        st.session_state[f"{key}_x"] = float(lod['event_x'][index])
+        st.session_state[f"{key}_y"] = float(lod['event_y'][index])
+        st.session_state[f"{key}_zoom"] = next((zoom for zoom in VIEWER_ZOOM_LEVELS
+                                                if full_width / zoom <= VIEWER_EVENT_WINDOW), VIEWER_ZOOM_LEVELS[-1])
+
+    controls = st.columns(4)
+    center_x = controls[0].number_input("Center X (mm)", step=full_width / 16, format="%.3f", key=f"{key}_x")
+    center_y = controls[1].number_input("Center Y (mm)", step=full_width / 16, format="%.3f", key=f"{key}_y")
+    zoom = controls[2].select_slider("Zoom", options=VIEWER_ZOOM_LEVELS, format_func=lambda z: f"{z}x",
+                                     key=f"{key}_zoom")
+    if stress_events:
+        event_number = controls[3].number_input("Stress event #", min_value=1, max_value=len(stress_events),
+                                                key=f"{key}_event")
+        controls[3].button("Go to event", on_click=go_to_event)
+        event = stress_events[event_number - 1]
+        st.caption(f"Event {event_number}: {event['type']} at line {event['line_num']} - {event['message']}")
+
+    half_width = full_width / zoom / 2
+    x_range, y_range = (center_x - half_width, center_x + half_width), (center_y - half_width, center_y + half_width)
+    view = logic.lod_window(lod, *x_range, *y_range)
+    st.image(render_window_png(lod, view, x_range, y_range, file_name))
+    detail = f"cells of {view['cell_size']:g} mm" if view['level'] else "full resolution"
+    st.caption(f"Detail level {view['level']} of {len(lod['levels']) - 1} ({detail}): {len(view['lines']):,} moves "
+               f"and {len(view['events']):,} stress events in view")
+
+
+def render_video_bytes(job, work_dir, results, file_name, limiting_speed, analysis_run_id):
+    # Runs as a render job: animates the segments that were already parsed, in the job's own temp folder.
+    # The job runs on a queue thread, so it collects (and logs) its own metrics.
+    try:
+        with logic.collect_metrics() as job.metrics:
+            animation_path = logic.animate_printer(
+                file_name, limiting_speed, os.path.join(work_dir, "animation.mp4"),
+                render_mode='incremental', max_frames=MAX_ANIMATION_FRAMES, workers=ANIMATION_WORKERS,
+                segments=results['segments'], progress=job.report_progress
+            )
+            if not animation_path:
+                return None
+            with open(animation_path, 'rb') as video_file:
+                return video_file.read()
+    finally:
+        job.metrics.log(file=file_name, render_job=job.job_id, analysis_run_id=analysis_run_id)
+
+
+def show_render_job(job, render_queue):
+    # Polls the job until it ends, showing its queue position or frame progress
+    progress_bar = st.progress(0.0, text="Waiting for a free renderer...")
+    while not job.wait(timeout=RENDER_POLL_SECONDS):
+        if job.state == render_jobs.JOB_RUNNING:
+            progress_bar.progress(job.fraction, text=f"Rendering frame {job.frames_done} of {job.frame_total or '?'}")
+        else:
+            progress_bar.progress(0.0, text=f"Waiting for a free renderer ({render_queue.jobs_ahead(job)} ahead)...")
+    progress_bar.empty()
+    if job.state == render_jobs.JOB_FAILED:
+        st.error(f"The animation could not be rendered: {job.error}")
+    elif job.result:
+        st.video(job.result)
+    else:
+        st.info("No segments were found to animate.")
+    if job.metrics is not None and job.metrics.stages:
+        with st.expander("Animation Performance"):
+            st.caption(f"Render job {job.job_id}: {job.metrics.total_seconds:.2f} s in total")
+            st.dataframe(performance_table(job.metrics), hide_index=True)
+
 
 # Use Streamlit's session state to "remember" the g-factor
 if 'g_factor' not in st.session_state:
-    config = configparser.ConfigParser()
-    config_path = logic.get_config_path()
-    if os.path.exists(config_path):
-        config.read(config_path)
-        st.session_state.g_factor = config.getfloat('Parameters', 'g_factor', fallback=0.5)
-    else:
-        st.session_state.g_factor = 0.5
+    st.session_state.g_factor = logic.load_saved_g_factor()
 
 # --- 3. Sidebar (for inputs) ---
 with st.sidebar:
@@ -36,6 +189,27 @@ with st.sidebar:
         value=st.session_state.g_factor,
         step=0.1
     )
+    min_trace_gap_input = st.number_input(
+        "Minimum Trace Gap (mm):",
+        min_value=0.0,
+        value=logic.DEFAULT_MIN_TRACE_GAP,
+        step=0.01,
+        format="%.3f"
+    )
+    process_speed_input = st.number_input(
+        "Target Process Speed (mm/s):",
+        min_value=0.1,
+        value=10.0,
+        step=1.0
+    )
+    rapid_speed_input = st.number_input(
+        "Rapid Speed (mm/s):",
+        min_value=0.1,
+        value=logic.DEFAULT_RAPID_SPEED,
+        step=5.0
+    )
+    track_memory = st.checkbox("Track peak memory per stage (slower)", value=False)
+    render_video = st.checkbox("Also render toolpath animation (slower)", value=False)
     run_button = st.button("Run Analysis", type="primary")
 
 # --- 4. Main Page (for results) ---
@@ -43,69 +217,133 @@ if run_button:
     # Save the new g_factor for next time
     if g_factor_input != st.session_state.g_factor:
         st.session_state.g_factor = g_factor_input
-        config = configparser.ConfigParser()
-        config_path = logic.get_config_path()
-        config['Parameters'] = {'g_factor': str(st.session_state.g_factor)}
-        with open(config_path, 'w') as configfile:
-            config.write(configfile)
+        logic.save_g_factor(st.session_state.g_factor)
 
     if uploaded_file is not None:
-        # Save the uploaded file to the temporary path
-        temp_filepath = os.path.join(TEMP_DIR, uploaded_file.name)
-        with open(temp_filepath, "wb") as f:
-            f.write(uploaded_file.getbuffer())
+        file_bytes = uploaded_file.getvalue()
+        g_factor = st.session_state.g_factor
+        result_cache = get_result_cache()
+        animation_job = None
+        base, ext = os.path.splitext(uploaded_file.name)
 
         # Show a spinner while working
-        with st.spinner("Running analysis and rendering animation... This may take a moment."):
+        with st.spinner("Running analysis... This may take a moment."), \
+                logic.collect_metrics(trace_memory=track_memory) as metrics:
             try:
                 # --- Run Analysis ---
-                parsed_segments = logic.parse_prg_file(temp_filepath)
-                if not parsed_segments:
+                # Results are cached by file hash; a repeat upload or a new G-factor skips parsing and analysis
+                results = result_cache.results(file_bytes, g_factor, min_trace_gap_input)
+                digest = results['digest']
+                if not results['segments']:
                     st.warning("Could not parse any segments for analysis.")
                 else:
-                    lim_speed, stress, arc_info, lim_arc = logic.run_path_stress_analysis(
-                        parsed_segments, st.session_state.g_factor
-                    )
-
                     # --- Display Report ---
                     st.subheader("Analysis Report")
-                    report_string = logic.generate_analysis_report(lim_speed, stress, st.session_state.g_factor,
-                                                                   lim_arc)
+                    with logic.metrics_stage('report'):
+                        report_string = logic.generate_analysis_report(results['limiting_speed'],
+                                                                       results['stress_events'], g_factor,
+                                                                       results['limiting_arc_details'])
                     st.code(report_string, language="text")
 
-                    # --- Create & Display Download Button ---
-                    base, ext = os.path.splitext(uploaded_file.name)
-                    annotated_filename = f"{base}_annotated{ext}"
-                    annotated_filepath = os.path.join(TEMP_DIR, annotated_filename)
-
-                    logic.create_annotated_prg_file(
-                        temp_filepath, annotated_filepath, lim_speed, stress,
-                        arc_info, st.session_state.g_factor, lim_arc
+                    # --- Velocity Plan ---
+                    st.subheader("Estimated Print Time")
+                    plan = result_cache.get_or_compute(
+                        ('velocity_plan', digest, g_factor, process_speed_input, rapid_speed_input),
+                        lambda: logic.plan_velocity_profile(results['segments'], g_factor, process_speed_input,
+                                                            rapid_speed_input)
                     )
+                    time_columns = st.columns(3)
+                    time_columns[0].metric("Total", format_duration(plan['total_time']))
+                    time_columns[1].metric("Printing", format_duration(plan['printing_time']))
+                    time_columns[2].metric("Rapid Moves", format_duration(plan['rapid_time']))
+                    distance, speed = logic.speed_profile(plan, PROFILE_CHART_POINTS)
+                    st.line_chart({"Distance (mm)": distance.round(3).tolist(), "Speed (mm/s)": speed.round(2).tolist()},
+                                  x="Distance (mm)", y="Speed (mm/s)")
+                    with st.expander("Time per feature"):
+                        order = plan['feature_time'].argsort()[::-1]
+                        st.dataframe({
+                            "Feature": plan['feature_num'][order].tolist(),
+                            "Length (mm)": plan['feature_length'][order].round(2).tolist(),
+                            "Time (s)": plan['feature_time'][order].round(2).tolist(),
+                        }, hide_index=True)
 
-                    with open(annotated_filepath, "r") as f:
-                        st.download_button(
-                            label="Download Annotated .prg File",
-                            data=f.read(),
-                            file_name=annotated_filename,
-                            mime="text/plain"
+                    # --- G-Factor Sweep ---
+                    with st.expander("G-Factor Sweep: max safe speed from 0.1 g to 2.0 g"):
+                        sweep = result_cache.get_or_compute(
+                            ('g_sweep', digest),
+                            lambda: logic.sweep_g_factors(results['segments'], G_SWEEP_VALUES)
                         )
+                        if not len(sweep['feature_num']):
+                            st.info("No arcs found; the speed is not limited by any G-factor.")
+                        else:
+                            sweep_table = {
+                                "G-Factor": sweep['g_factor'].tolist(),
+                                "Accel. Limit (mm/s^2)": sweep['accel_limit'].round(1).tolist(),
+                                "Limiting Speed (mm/s)": sweep['limiting_speed'].round(2).tolist(),
+                                "Arcs At Limit": sweep['arcs_at_limit'].tolist(),
+                            }
+                            st.line_chart(sweep_table, x="G-Factor", y="Limiting Speed (mm/s)")
+                            st.dataframe(sweep_table, hide_index=True)
+                            st.markdown("**Limiting speed per feature** (tightest features first)")
+                            order = sweep['feature_min_radius'].argsort()
+                            feature_table = {
+                                "Feature": sweep['feature_num'][order].tolist(),
+                                "Tightest Arc Radius (mm)": sweep['feature_min_radius'][order].round(4).tolist(),
+                            }
+                            for column, g in enumerate(G_SWEEP_VALUES):
+                                feature_table[f"{g:g} g"] = sweep['feature_limiting_speed'][order, column].round(2).tolist()
+                            st.dataframe(feature_table, hide_index=True)
 
-                    # --- Create & Display Animation ---
-                    st.subheader("Toolpath Animation")
-                    video_save_path = os.path.join(TEMP_DIR, "animation.mp4")
+                    # --- Create & Display Download Button ---
+                    annotated_bytes = result_cache.get_or_compute(
+                        ('annotated', digest, g_factor, min_trace_gap_input),
+                        lambda: create_annotated_bytes(file_bytes, results, g_factor)
+                    )
+                    st.download_button(
+                        label="Download Annotated .prg File",
+                        data=annotated_bytes,
+                        file_name=f"{base}_annotated{ext}",
+                        mime="text/plain"
+                    )
+                    if len(annotated_bytes) > GZIP_DOWNLOAD_THRESHOLD:
+                        st.download_button(
+                            label="Download Annotated .prg File (gzip)",
+                            data=result_cache.get_or_compute(
+                                ('annotated_gz', digest, g_factor, min_trace_gap_input),
+                                lambda: create_annotated_bytes(file_bytes, results, g_factor, compress=True)
+                            ),
+                            file_name=f"{base}_annotated{ext}.gz",
+                            mime="application/gzip"
+                        )
 
-                    animation_path = logic.animate_printer(
-                        temp_filepath, lim_speed, video_save_path
+                    # --- Static Preview (reuses the parsed segments) ---
+                    st.subheader("Toolpath Preview")
+                    preview_bytes = result_cache.get_or_compute(
+                        ('preview', digest, min_trace_gap_input, uploaded_file.name),
+                        lambda: render_preview_png(results, uploaded_file.name)
+                    )
+                    st.image(preview_bytes)
+                    st.download_button(
+                        label="Download Preview (.png)",
+                        data=preview_bytes,
+                        file_name=f"{base}_preview.png",
+                        mime="image/png"
                     )
 
-                    if animation_path:
-                        video_file = open(animation_path, 'rb')
-                        video_bytes = video_file.read()
-                        st.video(video_bytes)
-                        video_file.close()
-                    else:
-                        st.info("No segments were found to animate.")
+                    # --- Zoomable Viewer (its level-of-detail pyramid is built only once it is opened) ---
+                    with st.expander("Zoomable Toolpath Viewer"):
+                        toolpath_viewer(result_cache, results, uploaded_file.name, min_trace_gap_input)
+
+                    # --- Queue the Animation (optional) ---
+                    # Rendered in the background; its progress is shown in this slot once the rest is on the page
+                    if render_video:
+                        st.subheader("Toolpath Animation")
+                        animation_slot = st.empty()
+                        render_queue = get_render_queue()
+                        animation_job = render_queue.submit(
+                            ('animation', digest, g_factor, process_speed_input, rapid_speed_input, uploaded_file.name),
+                            render_video_bytes, results, uploaded_file.name, plan['peak_speed'], metrics.run_id
+                        )
 
                     st.success("Analysis complete!")
 
@@ -113,9 +351,20 @@ if run_button:
                 st.error(f"An error occurred during analysis: {e}")
                 st.error("Please check the .prg file format or contact support.")
 
-        # Clean up the temporary files for this session
-        shutil.rmtree(TEMP_DIR)
-        os.makedirs(TEMP_DIR)  # Re-create it for the next run
+        # --- Performance ---
+        # Stages served from the result cache do not run again, so they are missing from a repeat run.
+        with st.expander("Performance"):
+            st.caption(f"Run {metrics.run_id}: {metrics.total_seconds:.2f} s in total")
+            if metrics.stages:
+                st.dataframe(performance_table(metrics), hide_index=True)
+            else:
+                st.info("Everything was served from the cache.")
+        metrics.log(file=uploaded_file.name, g_factor=g_factor)
+
+        # --- Display Animation ---
+        if animation_job is not None:
+            with animation_slot.container():
+                show_render_job(animation_job, render_queue)
 
     else:
-        st.error("Please upload a .prg file first.")
\ No newline at end of file
+        st.error("Please upload a .prg file first.")
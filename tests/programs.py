@@ -0,0 +1,48 @@
+"""
+Small synthetic programs and comparison helpers shared by the tests.
+"""
+import random
+
+import numpy as np
+
+import web_analyzer_logic as logic
+from benchmarks.synthetic_prg import iter_synthetic_prg
+
+
+def make_program(seed=0, lines=1500, arc_fraction=0.4, corner_sharpness=0.3):
+    """A synthetic program with extra zero-length moves, blank lines and comments mixed in."""
+    rng = random.Random(seed)
+    program = []
+    for line in iter_synthetic_prg(lines, seed=seed, arc_fraction=arc_fraction, corner_sharpness=corner_sharpness,
+                                   segments_per_feature=60, feature_pitch=4.0):
+        program.append(line)
+        if line.startswith(('LINE', 'MSEG')) and rng.random() < 0.05:
+            program.append(line)  # the same end point again: a zero-length move
+        elif rng.random() < 0.01:
+            program.append(rng.choice(("\n", "! comment\n", "  \n")))
+    return "".join(program).encode()
+
+
+def assert_same_table(table, expected):
+    assert len(table) == len(expected)
+    for name in logic.SegmentTable.COLUMNS:
+        column, expected_column = getattr(table, name), getattr(expected, name)
+        assert np.array_equal(column, expected_column, equal_nan=column.dtype.kind == 'f'), name
+
+
+def assert_same_geometry(geometry, expected):
+    assert_same_table(geometry['segments'], expected['segments'])
+    assert geometry['stress_events'] == expected['stress_events']
+    assert geometry['min_radius'] == expected['min_radius']
+    assert geometry['limiting_arc_details'] == expected['limiting_arc_details']
+
+
+def edited_programs(data):
+    """Variants of a program as a user would re-upload it: a changed line, inserted lines, deleted lines."""
+    lines = data.split(b'\n')
+    middle = len(lines) // 2
+    changed = list(lines)
+    changed[middle] = changed[middle].replace(b'1', b'2', 1)
+    inserted = lines[:middle] + [b'LINE (X,Y),1.0,1.0', b'!Feature 999', b'ARC2 (X,Y),1.5,1.0,3.0'] + lines[middle:]
+    deleted = lines[:10] + lines[40:]
+    return [b'\n'.join(variant) for variant in (changed, inserted, deleted)]
@@ -0,0 +1,59 @@
+"""
+The annotated program must keep every original line, put each annotation after the line it refers to,
+and be the same written to disk, built in memory or gzip-compressed.
+"""
+import gzip
+import io
+
+import web_analyzer_logic as logic
+from tests.programs import make_program
+
+
+def analyzed_program(seed=19):
+    data = make_program(seed)
+    analysis = logic.run_path_stress_analysis(logic.parse_prg_file(data), 0.5, logic.DEFAULT_MIN_TRACE_GAP)
+    return data, analysis
+
+
+def test_annotations_follow_their_lines():
+    data, (limiting_speed, stress_events, arc_info_events, limiting_arc_details) = analyzed_program()
+    assert stress_events and arc_info_events
+    text = logic.annotate_prg_bytes(data, limiting_speed, stress_events, arc_info_events, 0.5,
+                                    limiting_arc_details).decode()
+    header, body = text.split("! ------------------------\n\n", 1)
+    assert f"{limiting_speed:.2f} mm/s" in header
+    original, annotations, line_num = [], {}, 0
+    for line in body.splitlines(keepends=True):
+        if line.startswith(tuple(logic.ANNOTATION_PREFIXES.values())):
+            annotations.setdefault(line_num, []).append(line)
+        else:
+            original.append(line)
+            line_num += 1
+    assert "".join(original).encode() == data
+    expected = {}
+    for event in stress_events + arc_info_events:
+        prefix = logic.ANNOTATION_PREFIXES[event['category']]
+        expected.setdefault(event['line_num'], []).append(f"{prefix} {event['message']}\n")
+    assert annotations == expected
+
+
+def test_file_bytes_and_gzip_outputs_agree(tmp_path):
+    data, analysis = analyzed_program(20)
+    source = tmp_path / "program.prg"
+    source.write_bytes(data)
+    annotated = tmp_path / "program_annotated.prg"
+    logic.create_annotated_prg_file(str(source), str(annotated), *analysis[:3], 0.5, analysis[3])
+    expected = annotated.read_bytes()
+    for input_source in (data, io.BytesIO(data), str(source)):
+        assert logic.annotate_prg_bytes(input_source, *analysis[:3], 0.5, analysis[3]) == expected
+    # Small chunks, so that the compressed output is written in many pieces.
+    compressed = logic.annotate_prg_bytes(data, *analysis[:3], 0.5, analysis[3], compress=True, chunk_lines=100)
+    assert compressed[:2] == b'\x1f\x8b' and gzip.decompress(compressed) == expected
+
+
+def test_a_program_without_arcs_is_annotated_too():
+    data = b"OUT0.0=1\nMSEG (X,Y),0,0\nLINE (X,Y),1,0\nLINE (X,Y),2,0\nOUT0.0=0\n"
+    analysis = logic.run_path_stress_analysis(logic.parse_prg_file(data), 0.5)
+    text = logic.annotate_prg_bytes(data, *analysis[:3], 0.5, analysis[3]).decode()
+    assert "! No arcs found in design to calculate a limiting speed.\n" in text
+    assert text.endswith(data.decode())
@@ -0,0 +1,79 @@
+"""
+The batch CLI must write one row per file, with an error row for a file that fails, even when it kills
+its worker process.
+"""
+import json
+import os
+
+import batch_analyzer
+from tests.programs import make_program
+
+TIMES = ('parse_seconds', 'analysis_seconds')
+analyze_file = batch_analyzer.analyze_file
+
+
+def write_programs(root, names):
+    for seed, name in enumerate(names):
+        path = root / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(make_program(seed, lines=400))
+
+
+def run_batch(root, output, *options):
+    code = batch_analyzer.main([str(root), '--output', str(output), *options])
+    with open(output) as summary:
+        rows = [json.loads(line) for line in summary]
+    return code, {row['file']: {name: value for name, value in row.items() if name not in TIMES} for row in rows}
+
+
+def analyze_or_die(root, relative_path, *args):
+    if 'crash' in relative_path:
+        os._exit(1)  # as if the worker process were killed
+    return analyze_file(root, relative_path, *args)
+
+
+def test_a_failing_file_gets_an_error_row(tmp_path):
+    write_programs(tmp_path / 'in', ['a.prg', 'sub/b.prg'])
+    (tmp_path / 'in' / 'bad.prg').write_bytes(b"OUT0.0=1\n\xff\xfe\n")
+    code, rows = run_batch(tmp_path / 'in', tmp_path / 'summary.jsonl', '--workers', '2')
+    assert code == 1
+    assert sorted(rows) == ['a.prg', 'bad.prg', os.path.join('sub', 'b.prg')]
+    assert rows['bad.prg']['status'] == 'error' and 'Could not read the file' in rows['bad.prg']['error']
+    assert all(row['status'] == 'ok' and row['segments'] > 0 for name, row in rows.items() if name != 'bad.prg')
+
+
+def test_a_file_that_kills_its_worker_gets_an_error_row(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_analyzer, 'analyze_file', analyze_or_die)
+    names = ['a.prg', 'b.prg', 'crash.prg', 'c.prg', 'd.prg']
+    write_programs(tmp_path / 'in', names)
+    code, rows = run_batch(tmp_path / 'in', tmp_path / 'summary.jsonl', '--workers', '2')
+    assert code == 1 and sorted(rows) == sorted(names)
+    assert rows['crash.prg']['status'] == 'error' and 'BrokenProcessPool' in rows['crash.prg']['error']
+    assert all(rows[name]['status'] == 'ok' for name in names if name != 'crash.prg')
+
+
+def test_split_mode_gives_the_rows_of_a_normal_run(tmp_path, monkeypatch):
+    # Small partitions, so that these small programs are split over several processes.
+    monkeypatch.setattr(batch_analyzer.logic, 'PARALLEL_MIN_PARTITION_BYTES', 2048)
+    write_programs(tmp_path / 'in', ['a.prg', 'sub/b.prg'])
+    code, expected = run_batch(tmp_path / 'in', tmp_path / 'normal.jsonl', '--workers', '2')
+    assert code == 0
+    code, rows = run_batch(tmp_path / 'in', tmp_path / 'split.jsonl', '--split-workers', '3')
+    assert code == 0 and rows == expected
+
+
+def test_split_mode_reuses_toolpath_files(tmp_path, monkeypatch):
+    monkeypatch.setattr(batch_analyzer.logic, 'PARALLEL_MIN_PARTITION_BYTES', 2048)
+    write_programs(tmp_path / 'in', ['a.prg', 'sub/b.prg'])
+    toolpaths = tmp_path / 'toolpaths'
+    _, expected = run_batch(tmp_path / 'in', tmp_path / 'normal.jsonl')
+    _, first = run_batch(tmp_path / 'in', tmp_path / 'first.jsonl', '--split-workers', '3', '--toolpath-dir',
+                         str(toolpaths))
+    written = sorted(str(path.relative_to(toolpaths)) for path in toolpaths.rglob('*.toolpath'))
+    assert written == ['a.prg.toolpath', os.path.join('sub', 'b.prg.toolpath')]
+
+    # The second run must load the toolpath files: parsing and splitting again would fail.
+    monkeypatch.setattr(batch_analyzer.logic, 'parse_and_analyze_parallel', None)
+    _, second = run_batch(tmp_path / 'in', tmp_path / 'second.jsonl', '--split-workers', '3', '--toolpath-dir',
+                          str(toolpaths))
+    assert first == expected and second == expected
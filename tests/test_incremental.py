@@ -0,0 +1,41 @@
+"""
+Incremental re-analysis of an edited program must give exactly the results of a full run.
+"""
+import web_analyzer_logic as logic
+from tests.programs import make_program, assert_same_geometry, edited_programs
+
+
+def test_incremental_analysis_matches_full_run_after_edits(monkeypatch):
+    # Small chunks, so that the edits land in one of several chunks.
+    monkeypatch.setattr(logic, 'INCREMENTAL_MIN_CHUNK_BYTES', 4096)
+    data = make_program(6)
+    cache = logic.ResultCache(max_bytes=256 * 1024 * 1024)
+    assert_same_geometry(logic.analyze_geometry_incremental(data, cache),
+                         logic.analyze_geometry(logic.parse_prg_file(data)))
+    variants = edited_programs(data) + [data.replace(b'\n', b'\r\n'), data.replace(b'\n', b'\r'), b""]
+    for edited in variants:
+        assert_same_geometry(logic.analyze_geometry_incremental(edited, cache),
+                             logic.analyze_geometry(logic.parse_prg_file(edited)))
+
+
+def test_cold_and_warm_runs_agree_and_an_edit_reuses_the_cached_chunks(monkeypatch):
+    # Small chunks, so that this small program is cached in several of them.
+    monkeypatch.setattr(logic, 'INCREMENTAL_MIN_CHUNK_BYTES', 4096)
+    data = make_program(10, lines=3000)
+    cache = logic.ResultCache(max_bytes=256 * 1024 * 1024)
+    with logic.collect_metrics() as cold:
+        cold_geometry = logic.analyze_geometry_incremental(data, cache)
+    with logic.collect_metrics() as warm:
+        warm_geometry = logic.analyze_geometry_incremental(data, cache)
+    assert_same_geometry(cold_geometry, logic.analyze_geometry(logic.parse_prg_file(data)))
+    assert_same_geometry(warm_geometry, cold_geometry)
+    assert cold.counters['blocks'] > 4 and cold.counters['blocks_reused'] == 0
+    assert warm.counters['blocks_reused'] == warm.counters['blocks']
+
+    middle = len(data) // 2
+    edited = data[:middle] + data[middle:].replace(b'\n', b'\n! edited\n', 1)  # one block gets a comment line
+    with logic.collect_metrics() as metrics:
+        geometry = logic.analyze_geometry_incremental(edited, cache)
+    assert_same_geometry(geometry, logic.analyze_geometry(logic.parse_prg_file(edited)))
+    # The edited block's chunk is analyzed again; its new checksum may also move the cut to the next one.
+    assert metrics.counters['blocks'] - metrics.counters['blocks_reused'] <= 2
@@ -0,0 +1,101 @@
+"""
+The level-of-detail pyramid must stay within a cell of the full path at every level, keep every shown
+stress marker on a drawn edge, and give a window exactly the edges that touch it.
+"""
+import numpy as np
+import pytest
+
+import web_analyzer_logic as logic
+from tests.programs import make_program
+
+
+@pytest.fixture(scope='module')
+def pyramid():
+    table = logic.parse_prg_file(make_program(21, lines=3000, corner_sharpness=0.8))
+    stress_events = logic.run_path_stress_analysis(table, 0.5)[1]
+    return table, stress_events, logic.build_lod_pyramid(table, stress_events)
+
+
+def level_edges(lod, level):
+    data = lod['levels'][level]
+    return data['start'], data['end']
+
+
+def test_level_zero_is_the_full_path(pyramid):
+    table, stress_events, lod = pyramid
+    joined = logic.join_tessellated_runs(table)
+    start, end = level_edges(lod, 0)
+    assert len(start) == len(joined['vertices']) - (len(joined['run_starts']) - 1)
+    assert np.array_equal(np.sort(start), np.flatnonzero(lod['vertex_run'][:-1] == lod['vertex_run'][1:]))
+    assert np.array_equal(lod['levels'][0]['events'], np.arange(len(stress_events)))
+
+
+def test_every_level_stays_within_a_cell_of_the_path(pyramid):
+    _, _, lod = pyramid
+    x, y, origin = lod['x'], lod['y'], (lod['bounds'][0], lod['bounds'][2])
+    assert len(lod['levels']) > 2
+    for level, data in lod['levels'].items():
+        if not level:
+            continue
+        cell_size = data['cell_size']
+        cells = np.column_stack((((x - origin[0]) // cell_size), ((y - origin[1]) // cell_size))).astype(np.int64)
+        start, end = level_edges(lod, level)
+        drawn = {tuple(cell) for cell in cells[np.concatenate((start, end))].tolist()}
+        # Every vertex of the full path lies in a cell that an edge of this level reaches.
+        assert {tuple(cell) for cell in cells.tolist()} <= drawn
+
+
+def test_shown_markers_lie_on_drawn_edges(pyramid):
+    _, _, lod = pyramid
+    x, y = lod['x'], lod['y']
+    for level, data in lod['levels'].items():
+        start, end = level_edges(lod, level)
+        events = data['events']
+        px, py = lod['event_x'][events][:, None], lod['event_y'][events][:, None]
+        dx, dy = (x[end] - x[start])[None, :], (y[end] - y[start])[None, :]
+        t = np.clip(((px - x[start]) * dx + (py - y[start]) * dy) / np.maximum(dx * dx + dy * dy, 1e-18), 0, 1)
+        distance = np.hypot(px - (x[start] + t * dx), py - (y[start] + t * dy)).min(axis=1)
+        assert (distance <= logic.DEFAULT_CHORD_TOLERANCE).all(), level
+        if level:
+            # One marker per cell and type.
+            cells = np.column_stack(((lod['event_x'][events] - lod['bounds'][0]) // data['cell_size'],
+                                     (lod['event_y'][events] - lod['bounds'][2]) // data['cell_size']))
+            keys = {(tuple(cell), lod['event_type'][event]) for cell, event in zip(cells.tolist(), events)}
+            assert len(keys) == len(events)
+
+
+def test_windows_get_exactly_the_edges_that_touch_them(pyramid):
+    _, _, lod = pyramid
+    x, y = lod['x'], lod['y']
+    x_min, x_max, y_min, y_max = lod['bounds']
+    rng = np.random.default_rng(0)
+    for level in lod['levels']:
+        all_start, all_end = level_edges(lod, level)
+        for _ in range(5):
+            wx = np.sort(rng.uniform(x_min - 1, x_max + 1, 2))
+            wy = np.sort(rng.uniform(y_min - 1, y_max + 1, 2))
+            start, end = logic._window_edges(lod, level, wx[0], wx[1], wy[0], wy[1])
+            touching = ((np.maximum(x[all_start], x[all_end]) >= wx[0])
+                        & (np.minimum(x[all_start], x[all_end]) <= wx[1])
+                        & (np.maximum(y[all_start], y[all_end]) >= wy[0])
+                        & (np.minimum(y[all_start], y[all_end]) <= wy[1]))
+            assert sorted(zip(start.tolist(), end.tolist())) == sorted(
+                zip(all_start[touching].tolist(), all_end[touching].tolist()))
+
+
+def test_window_level_follows_the_pixel_size_and_line_budget(pyramid):
+    _, _, lod = pyramid
+    x_min, x_max, y_min, y_max = lod['bounds']
+    view = logic.lod_window(lod, x_min, x_max, y_min, y_max, pixels=512)
+    assert view['cell_size'] <= (x_max - x_min) / 512
+    assert view['level'] + 1 not in lod['levels'] or lod['levels'][view['level'] + 1]['cell_size'] > (
+            x_max - x_min) / 512
+    assert len(view['lines']) == len(view['is_printing'])
+    full = logic.lod_window(lod, x_min, x_max, y_min, y_max, pixels=10 ** 9)
+    assert full['level'] == 0
+    # The first level within the budget is used, or the coarsest level when none is.
+    counts = {level: len(data['start']) for level, data in lod['levels'].items()}
+    budget = logic.lod_window(lod, x_min, x_max, y_min, y_max, pixels=10 ** 9, max_lines=counts[2])
+    assert budget['level'] == min(level for level, count in counts.items() if count <= counts[2])
+    coarsest = logic.lod_window(lod, x_min, x_max, y_min, y_max, pixels=10 ** 9, max_lines=0)
+    assert coarsest['level'] == max(lod['levels'])
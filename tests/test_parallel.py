@@ -0,0 +1,19 @@
+"""
+The parallel split must give exactly the table and analysis of a serial run.
+"""
+import web_analyzer_logic as logic
+from tests.programs import make_program, assert_same_table
+
+
+def test_parallel_analysis_matches_serial(monkeypatch):
+    # Small partitions, so that these small programs are split over several processes.
+    monkeypatch.setattr(logic, 'PARALLEL_MIN_PARTITION_BYTES', 4096)
+    data = make_program(7)
+    no_markers = b'\n'.join(line for line in data.split(b'\n') if not line.startswith(b'!Feature'))
+    for program in (data, no_markers, data.replace(b'\n', b'\r\n')):
+        segments = logic.parse_prg_file(program)
+        expected = logic.run_path_stress_analysis(segments, 0.5, logic.DEFAULT_MIN_TRACE_GAP)
+        parallel_segments, analysis = logic.parse_and_analyze_parallel(program, 0.5, logic.DEFAULT_MIN_TRACE_GAP,
+                                                                       workers=3)
+        assert_same_table(parallel_segments, segments)
+        assert analysis == expected
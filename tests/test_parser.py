@@ -0,0 +1,28 @@
+"""
+parse_prg_file must build the same SegmentTable from every kind of input and line break.
+"""
+import io
+
+import pytest
+
+import web_analyzer_logic as logic
+from tests.programs import make_program, assert_same_table
+
+
+def test_parser_inputs_give_the_same_table(tmp_path):
+    data = make_program(4)
+    expected = logic.parse_prg_file(data)
+    path = tmp_path / "program.prg"
+    path.write_bytes(data)
+    assert_same_table(logic.parse_prg_file(str(path)), expected)
+    assert_same_table(logic.parse_prg_file(io.BytesIO(data)), expected)
+    with open(path, 'rb') as prg_file:
+        assert_same_table(logic.parse_prg_file(prg_file), expected)
+    with open(path, 'r') as prg_file:
+        assert_same_table(logic.parse_prg_file(prg_file), expected)
+
+
+@pytest.mark.parametrize('line_break', [b'\r\n', b'\r'])
+def test_parser_handles_crlf_and_bare_cr(line_break):
+    data = make_program(5)
+    assert_same_table(logic.parse_prg_file(data.replace(b'\n', line_break)), logic.parse_prg_file(data))
@@ -0,0 +1,72 @@
+"""
+ResultCache must stay within its byte budget, evicting least recently used entries first, and must give
+the same results at any G-factor as an uncached run.
+"""
+import numpy as np
+
+import web_analyzer_logic as logic
+from tests.programs import make_program
+
+
+def test_least_recently_used_entries_are_evicted_first():
+    cache = logic.ResultCache(max_bytes=3000)
+    for key in 'abc':
+        cache.put(key, np.zeros(100))  # 800 bytes each
+    assert cache.get_or_compute('a', lambda: None) is not None  # 'a' is now the most recently used
+    cache.put('d', np.zeros(100))
+    assert 'b' not in cache and {'a', 'c', 'd'} <= set(cache._entries)
+    assert cache.current_bytes == 3 * 800 <= cache.max_bytes
+
+
+def test_oversized_values_are_returned_but_not_kept():
+    cache = logic.ResultCache(max_bytes=1000)
+    cache.put('small', np.zeros(10))
+    value = cache.get_or_compute('big', lambda: np.zeros(1000))
+    assert len(value) == 1000 and 'big' not in cache
+    assert 'small' in cache and cache.current_bytes == 80
+
+
+def test_misses_compute_and_hits_do_not():
+    cache = logic.ResultCache()
+    calls = []
+    for _ in range(3):
+        cache.get_or_compute('key', lambda: calls.append(1) or 'value')
+    assert calls == [1]
+    cache.clear()
+    assert len(cache) == 0 and cache.current_bytes == 0
+
+
+def test_cached_results_match_an_uncached_run():
+    data = make_program(16)
+    cache = logic.ResultCache()
+    segments = logic.parse_prg_file(data)
+    for g_factor in (0.5, 2.0, 0.5):
+        results = cache.results(data, g_factor, logic.DEFAULT_MIN_TRACE_GAP)
+        expected = logic.run_path_stress_analysis(segments, g_factor, logic.DEFAULT_MIN_TRACE_GAP)
+        assert (results['limiting_speed'], results['stress_events'], results['arc_info_events'],
+                results['limiting_arc_details']) == expected
+    assert len([key for key in cache._entries if key[0] == 'g_factor']) == 2
+
+
+def test_tessellations_count_towards_the_budget():
+    data = make_program(17, arc_fraction=1.0)
+    cache = logic.ResultCache()
+    geometry = cache.geometry(data)
+    before = cache.current_bytes
+    tessellation = logic.tessellate_segments(geometry['segments'])
+    grown = tessellation['vertices'].nbytes + tessellation['offsets'].nbytes
+    assert cache.geometry(data) is geometry  # a read estimates the entry again
+    assert cache.current_bytes == before + grown
+
+
+def test_a_table_that_grows_evicts_older_entries():
+    table = logic.parse_prg_file(make_program(18, arc_fraction=1.0))
+    cache = logic.ResultCache()
+    cache.put('older', np.zeros(1000))
+    cache.put('table', table)
+    tessellation = logic.tessellate_segments(table)
+    # Room for the tessellated table, but not for both.
+    cache.max_bytes = cache.current_bytes + tessellation['vertices'].nbytes + tessellation['offsets'].nbytes - 1
+    assert cache.get_or_compute('table', lambda: None) is table
+    assert 'older' not in cache and 'table' in cache
+    assert cache.current_bytes == table.nbytes <= cache.max_bytes
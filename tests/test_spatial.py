@@ -0,0 +1,69 @@
+"""
+find_spatial_events must flag real crossings and close traces, never a closed contour against itself,
+and the grid must find every pair a brute-force comparison of all pieces finds.
+"""
+import numpy as np
+import pytest
+
+import web_analyzer_logic as logic
+from tests.programs import make_program
+
+CIRCLE = b"PTP/ev (X,Y),1,0,gDblRapidSpeed\nOUT0.0=1\nMSEG (X,Y),1,0\nARC2 (X,Y),0,0,6.283185307\nOUT0.0=0\n"
+SQUARE = (b"PTP/ev (X,Y),0,0,gDblRapidSpeed\nOUT0.0=1\nMSEG (X,Y),0,0\n"
+          b"LINE (X,Y),1,0\nLINE (X,Y),1,1\nLINE (X,Y),0,1\nLINE (X,Y),0,0\nOUT0.0=0\n")
+
+
+def spatial_events(data, min_trace_gap=0.05):
+    return [(event['type'], event['line_num'], event['message'])
+            for event in logic.find_spatial_events(logic.parse_prg_file(data), min_trace_gap)]
+
+
+@pytest.mark.parametrize('data', [CIRCLE, SQUARE], ids=['circle', 'square'])
+def test_closed_contours_are_not_flagged_against_themselves(data):
+    assert spatial_events(data) == []
+
+
+def test_crossing_traces_are_flagged():
+    data = b"OUT0.0=1\nMSEG (X,Y),0,0\nLINE (X,Y),2,0\nLINE (X,Y),2,1\nLINE (X,Y),1,1\nLINE (X,Y),1,-1\nOUT0.0=0\n"
+    assert spatial_events(data) == [
+        ('Path Intersection', 6, "Printed path crosses the trace at line 3 (Feature 1).")]
+
+
+def test_traces_closer_than_the_gap_are_flagged():
+    data = (b"OUT0.0=1\nMSEG (X,Y),0,0\nLINE (X,Y),2,0\nOUT0.0=0\n"
+            b"PTP/ev (X,Y),0,0.03,gDblRapidSpeed\nOUT0.0=1\nMSEG (X,Y),0,0.03\nLINE (X,Y),2,0.03\nOUT0.0=0\n")
+    assert spatial_events(data) == [
+        ('Trace Spacing', 8, "Trace passes 0.030 mm from the trace at line 3 (Feature 1); minimum gap is 0.05 mm.")]
+    assert spatial_events(data, min_trace_gap=0.02) == []
+
+
+def all_piece_pairs(x0, y0, x1, y1, cell_size, reach):
+    yield np.triu_indices(len(x0), 1)
+
+
+@pytest.mark.parametrize('min_trace_gap', [0.05, 0.5])
+def test_grid_finds_the_events_of_a_brute_force_comparison(monkeypatch, min_trace_gap):
+    table = logic.parse_prg_file(make_program(8, lines=300))
+    events = logic.find_spatial_events(table, min_trace_gap)
+    monkeypatch.setattr(logic, '_candidate_piece_pairs', all_piece_pairs)
+    assert events == logic.find_spatial_events(table, min_trace_gap)
+    if min_trace_gap == 0.5:
+        assert events
+
+
+def test_grid_emits_every_overlapping_pair_once():
+    table = logic.parse_prg_file(make_program(9, lines=300))
+    x0, y0, x1, y1 = logic._tessellate_printing_pieces(table, logic.DEFAULT_CHORD_TOLERANCE, 0.2)[:4]
+    reach = 0.1
+    pairs = np.concatenate([np.stack(batch, axis=1)
+                            for batch in logic._candidate_piece_pairs(x0, y0, x1, y1, 0.2, reach)])
+    assert (pairs[:, 0] < pairs[:, 1]).all()
+    assert len(np.unique(pairs, axis=0)) == len(pairs)
+    a, b = np.triu_indices(len(x0), 1)
+    half = reach / 2.0
+    overlap = ((np.minimum(x0[a], x1[a]) - half <= np.maximum(x0[b], x1[b]) + half)
+               & (np.minimum(x0[b], x1[b]) - half <= np.maximum(x0[a], x1[a]) + half)
+               & (np.minimum(y0[a], y1[a]) - half <= np.maximum(y0[b], y1[b]) + half)
+               & (np.minimum(y0[b], y1[b]) - half <= np.maximum(y0[a], y1[a]) + half))
+    expected = set(zip(a[overlap].tolist(), b[overlap].tolist()))
+    assert expected <= set(map(tuple, pairs.tolist()))
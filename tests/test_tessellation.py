@@ -0,0 +1,20 @@
+"""
+tessellate_segments must keep every arc within the chord tolerance, whatever its radius.
+"""
+import numpy as np
+import pytest
+
+import web_analyzer_logic as logic
+
+
+@pytest.mark.parametrize('radius', [0.5, 10.0, 65.0, 500.0, 5000.0])
+@pytest.mark.parametrize('tolerance', [logic.DEFAULT_CHORD_TOLERANCE, 0.0005])
+def test_arc_chords_stay_within_the_tolerance(radius, tolerance):
+    data = f"OUT0.0=1\nMSEG (X,Y),{radius},0\nARC2 (X,Y),0,0,6.283185307\n".encode()
+    table = logic.parse_prg_file(data)
+    tessellation = logic.tessellate_segments(table, tolerance)
+    arc = tessellation['vertices'][tessellation['offsets'][-2]:]  # the arc is the last segment
+    # The farthest a chord gets from the arc is at its middle.
+    middle = (arc[1:] + arc[:-1]) / 2
+    assert radius - np.hypot(middle[:, 0], middle[:, 1]).min() <= tolerance * (1 + 1e-6)
+    assert np.allclose(np.hypot(arc[:, 0], arc[:, 1]), radius)
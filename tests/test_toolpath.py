@@ -0,0 +1,52 @@
+"""
+A toolpath file must load back the table it was saved from, and is only reused while its program is unchanged.
+"""
+import numpy as np
+import pytest
+
+import web_analyzer_logic as logic
+from tests.programs import make_program, assert_same_table
+
+
+def test_toolpath_round_trip(tmp_path):
+    data = make_program(13).replace(b'\n', b'\r\n')
+    segments = logic.parse_prg_file(data)
+    path = tmp_path / "program.toolpath"
+    logic.save_toolpath(segments, str(path), data)
+    toolpath = logic.load_toolpath(str(path))
+    assert_same_table(toolpath['segments'], segments)
+    assert toolpath['source_sha256'] == logic.file_digest(data)
+    assert toolpath['source_bytes'] == len(data)
+    # The line index finds the source line of every segment.
+    offsets, lines = toolpath['line_offsets'], data.splitlines()
+    for row in (0, len(segments) // 2, len(segments) - 1):
+        line_num = segments.line_num[row]
+        assert data[offsets[line_num - 1]:offsets[line_num]].rstrip(b'\r\n') == lines[line_num - 1]
+    # The feature map rebuilds the feature column.
+    feature_num = np.repeat(toolpath['feature_numbers'], np.diff(np.append(toolpath['feature_starts'],
+                                                                           len(segments))))
+    assert np.array_equal(feature_num, segments.feature_num)
+    assert logic.run_path_stress_analysis(toolpath['segments'], 0.5) == logic.run_path_stress_analysis(segments, 0.5)
+
+
+def test_toolpath_is_rebuilt_when_the_program_changes(tmp_path):
+    source = tmp_path / "program.prg"
+    source.write_bytes(make_program(14))
+    toolpath_path = f"{source}{logic.TOOLPATH_SUFFIX}"
+    first = logic.load_or_parse_toolpath(str(source))
+    assert logic.load_current_toolpath(toolpath_path, source.read_bytes()) is not None
+
+    edited = make_program(15)
+    source.write_bytes(edited)
+    assert logic.load_current_toolpath(toolpath_path, edited) is None
+    second = logic.load_or_parse_toolpath(str(source))
+    assert second['source_sha256'] != first['source_sha256']
+    assert_same_table(second['segments'], logic.parse_prg_file(edited))
+
+
+def test_loading_something_else_fails_cleanly(tmp_path):
+    path = tmp_path / "program.toolpath"
+    path.write_bytes(b"OUT0.0=1\n")
+    with pytest.raises(Exception, match="Could not read the toolpath file"):
+        logic.load_toolpath(str(path))
+    assert logic.load_current_toolpath(str(path), b"OUT0.0=1\n") is None
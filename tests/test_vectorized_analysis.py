@@ -0,0 +1,27 @@
+"""
+The vectorized run_path_stress_analysis must give exactly the results of run_path_stress_analysis_reference.
+"""
+import pytest
+
+import web_analyzer_logic as logic
+from tests.programs import make_program
+
+
+@pytest.mark.parametrize('seed, arc_fraction, corner_sharpness', [
+    (0, 0.0, 0.3),  # lines only
+    (1, 1.0, 0.3),  # arcs only
+    (2, 0.4, 0.0),  # smooth line/arc mix
+    (3, 0.5, 0.8),  # sharp line/arc mix
+])
+@pytest.mark.parametrize('g_factor', [0.1, 0.5, 2.0])
+def test_vectorized_analysis_matches_reference(seed, arc_fraction, corner_sharpness, g_factor):
+    table = logic.parse_prg_file(make_program(seed, arc_fraction=arc_fraction, corner_sharpness=corner_sharpness))
+    assert logic.run_path_stress_analysis(table, g_factor) == logic.run_path_stress_analysis_reference(table, g_factor)
+
+
+def test_vectorized_analysis_matches_reference_on_edge_cases():
+    for data in (b"", b"!Feature 1\n", b"LINE (X,Y),1,1\n",
+                 b"PTP/ev (X,Y),0,0,gDblRapidSpeed\nOUT0.0=1\nMSEG (X,Y),0,0\nLINE (X,Y),1,0\n",
+                 b"OUT0.0=1\nMSEG (X,Y),0,0\nLINE (X,Y),0,0\nLINE (X,Y),1,0\n!Feature 1\nLINE (X,Y),1,0\n"):
+        table = logic.parse_prg_file(data)
+        assert logic.run_path_stress_analysis(table, 0.5) == logic.run_path_stress_analysis_reference(table, 0.5)
@@ -0,0 +1,66 @@
+"""
+plan_velocity_profile must respect its speed caps and the acceleration limit, and match the closed-form
+times of simple moves.
+"""
+import math
+
+import numpy as np
+import pytest
+
+import web_analyzer_logic as logic
+from tests.programs import make_program
+
+
+def straight_line(length):
+    return logic.parse_prg_file(f"OUT0.0=1\nMSEG (X,Y),0,0\nLINE (X,Y),{length},0\nOUT0.0=0\n".encode())
+
+
+@pytest.mark.parametrize('length', [0.01, 1.0, 500.0])
+def test_single_line_takes_the_trapezoidal_time(length):
+    g_factor, speed = 0.5, 100.0
+    accel = g_factor * logic.G_ACCELERATION
+    plan = logic.plan_velocity_profile(straight_line(length), g_factor, speed)
+    if length >= speed ** 2 / accel:
+        expected = length / speed + speed / accel  # reaches the process speed
+    else:
+        expected = 2.0 * math.sqrt(length / accel)  # accelerates half way, then brakes
+    assert plan['total_time'] == pytest.approx(expected)
+    assert plan['entry_speed'][0] == 0.0 and plan['exit_speed'][-1] == 0.0
+
+
+def test_plan_respects_caps_and_acceleration():
+    table = logic.parse_prg_file(make_program(11, arc_fraction=0.5, corner_sharpness=0.8))
+    plan = logic.plan_velocity_profile(table, 0.2, 80.0)
+    accel, length = plan['accel_limit'], plan['length']
+    entry, peak, exit_speed = plan['entry_speed'], plan['peak_speed'], plan['exit_speed']
+    assert entry[0] == 0.0 and exit_speed[-1] == 0.0
+    assert np.array_equal(exit_speed[:-1], entry[1:])
+    assert (peak <= plan['cruise_speed'] * (1 + 1e-9)).all()
+    assert (np.maximum(entry, exit_speed) <= peak * (1 + 1e-9)).all()
+    # No segment changes speed faster than the acceleration limit allows over its length.
+    assert (np.abs(exit_speed ** 2 - entry ** 2) <= 2.0 * accel * length * (1 + 1e-9) + 1e-9).all()
+    # Junctions flagged by the stress checks are capped by the junction-deviation model.
+    limits = logic.junction_speed_limits(table, accel)
+    assert (exit_speed[:-1] <= limits * (1 + 1e-9)).all()
+    assert plan['total_time'] == pytest.approx(plan['printing_time'] + plan['rapid_time'])
+    assert plan['feature_time'].sum() == pytest.approx(plan['total_time'])
+    assert plan['feature_length'].sum() == pytest.approx(plan['total_length'])
+
+
+def test_tight_arcs_cruise_at_the_centripetal_limit():
+    table = logic.parse_prg_file(b"OUT0.0=1\nMSEG (X,Y),2,0\nARC2 (X,Y),0,0,62.83185307\nOUT0.0=0\n")
+    plan = logic.plan_velocity_profile(table, 0.1, 1000.0)
+    assert plan['cruise_speed'][0] == pytest.approx(math.sqrt(0.1 * logic.G_ACCELERATION * 2.0))
+
+
+def test_speed_profile_traces_the_plan():
+    plan = logic.plan_velocity_profile(logic.parse_prg_file(make_program(12)), 0.5, 100.0)
+    distance, speed = logic.speed_profile(plan)
+    assert len(distance) == 4 * len(plan['length'])
+    assert (np.diff(distance) >= -1e-9).all()
+    assert distance[-1] == pytest.approx(plan['total_length'])
+    reduced_distance, reduced_speed = logic.speed_profile(plan, max_points=100)
+    assert len(reduced_distance) <= 100
+    assert reduced_speed.min() == speed.min()
+    empty = logic.plan_velocity_profile(logic.parse_prg_file(b""), 0.5, 100.0)
+    assert [len(array) for array in logic.speed_profile(empty)] == [0, 0]
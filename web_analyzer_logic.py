@@ -1,16 +1,30 @@
-import matplotlib
-
-matplotlib.use('Agg')  # Use a non-interactive backend for the server
-import matplotlib.pyplot as plt
-import matplotlib.animation as animation
 import re
+import io
+from array import array
+from collections.abc import Mapping
 import numpy as np
 import os
 import math
-import configparser
+import gzip
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+import contextlib
+import contextvars
+import functools
+import json
+import logging
+import time
+import tracemalloc
+import uuid
+import zlib
+
+
+# --- CONFIGURATION ---
+DEFAULT_G_FACTOR = 0.5
 
 
-# --- CONFIGURATION (No changes) ---
 def get_config_path():
     try:
         script_dir = os.path.dirname(os.path.abspath(__file__))
@@ -19,112 +33,601 @@ def get_config_path():
     return os.path.join(script_dir, 'analyzer_config.ini')
 
 
-# --- PARSER (No changes, just removed tkinter popups) ---
-def parse_prg_file(filename):
-    feature_map = []
+@functools.lru_cache(maxsize=1)
+def load_saved_g_factor():
+    """The G-factor saved in analyzer_config.ini (DEFAULT_G_FACTOR if none), read once per process."""
+    import configparser
+    config = configparser.ConfigParser()
+    config.read(get_config_path())  # a missing file reads as empty
+    return config.getfloat('Parameters', 'g_factor', fallback=DEFAULT_G_FACTOR)
+
+
+def save_g_factor(g_factor):
+    """Saves the G-factor to analyzer_config.ini and updates the value load_saved_g_factor returns."""
+    import configparser
+    config = configparser.ConfigParser()
+    config['Parameters'] = {'g_factor': str(g_factor)}
+    with open(get_config_path(), 'w') as configfile:
+        config.write(configfile)
+    load_saved_g_factor.cache_clear()
+
+
+# --- INSTRUMENTATION ---
+# Pipeline functions are wrapped with @timed_stage and report counts with record_count(). Both only
+# look up the active RunMetrics (a context variable) and do nothing else unless a caller has opened
+# collect_metrics(), so with metrics off they cost a single context variable lookup per call.
+METRICS_LOGGER = logging.getLogger('web_analyzer_logic.metrics')
+_active_metrics = contextvars.ContextVar('active_run_metrics', default=None)
+
+
+class RunMetrics:
+    """
+    Timings, peak memory and counters collected during one run. Each stage records its name, nesting
+    depth, wall time, the peak memory allocated while it ran (when tracing memory; tracemalloc covers
+    NumPy arrays too, but is process-wide, so concurrent runs see each other's allocations) and the
+    counters recorded inside it. Counters are also summed over the whole run.
+    """
+
+    def __init__(self, trace_memory=False):
+        self.run_id = uuid.uuid4().hex[:8]
+        self.trace_memory = trace_memory
+        self.stages = []
+        self.counters = {}
+        self._stack = []  # open stage records, innermost last
+        self._started = time.perf_counter()
+        self.total_seconds = None
+
+    @contextlib.contextmanager
+    def stage(self, name):
+        record = {'stage': name, 'depth': len(self._stack), 'seconds': None, 'peak_bytes': None, 'counters': {}}
+        self.stages.append(record)
+        tracing = self.trace_memory and tracemalloc.is_tracing()
+        if tracing:
+            current, peak = tracemalloc.get_traced_memory()
+            if self._stack:
+                self._stack[-1]['_max_traced'] = max(self._stack[-1]['_max_traced'], peak)
+            tracemalloc.reset_peak()
+            record['_start_traced'] = record['_max_traced'] = current
+        self._stack.append(record)
+        start = time.perf_counter()
+        try:
+            yield record
+        finally:
+            record['seconds'] = time.perf_counter() - start
+            self._stack.pop()
+            if tracing:
+                record['_max_traced'] = max(record['_max_traced'], tracemalloc.get_traced_memory()[1])
+                record['peak_bytes'] = record['_max_traced'] - record.pop('_start_traced')
+                max_traced = record.pop('_max_traced')
+                if self._stack:
+                    self._stack[-1]['_max_traced'] = max(self._stack[-1]['_max_traced'], max_traced)
+
+    def count(self, name, value=1):
+        self.counters[name] = self.counters.get(name, 0) + value
+        if self._stack:
+            stage_counters = self._stack[-1]['counters']
+            stage_counters[name] = stage_counters.get(name, 0) + value
+
+    def finish(self):
+        self.total_seconds = time.perf_counter() - self._started
+
+    def as_dict(self):
+        return {'run_id': self.run_id, 'total_seconds': self.total_seconds, 'trace_memory': self.trace_memory,
+                'counters': dict(self.counters), 'stages': [dict(record) for record in self.stages]}
+
+    def log(self, logger=METRICS_LOGGER, **context):
+        """Writes one JSON log line per stage and one for the run, tagged with run_id and any context."""
+        for record in self.stages:
+            logger.info(json.dumps({'event': 'stage', 'run_id': self.run_id, **context, **record}, default=str))
+        logger.info(json.dumps({'event': 'run', 'run_id': self.run_id, **context, 'total_seconds': self.total_seconds,
+                                'counters': self.counters}, default=str))
+
+
+@contextlib.contextmanager
+def collect_metrics(trace_memory=False):
+    """Collects the metrics of everything run inside the block into a new RunMetrics, which it yields."""
+    metrics = RunMetrics(trace_memory)
+    started_tracing = trace_memory and not tracemalloc.is_tracing()
+    if started_tracing:
+        tracemalloc.start()
+    token = _active_metrics.set(metrics)
     try:
-        with open(filename, 'r') as file:
-            for i, line in enumerate(file, 1):
-                if line.strip().startswith("!Feature"):
-                    try:
-                        num = int(line.strip().split(" ")[1])
-                        feature_map.append({'end_line': i, 'number': num})
-                    except (IndexError, ValueError):
-                        pass
+        yield metrics
+    finally:
+        _active_metrics.reset(token)
+        if started_tracing:
+            tracemalloc.stop()
+        metrics.finish()
+
+
+def timed_stage(name):
+    """Decorator that records each call of the function as a stage of the active RunMetrics, if any."""
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            metrics = _active_metrics.get()
+            if metrics is None:
+                return func(*args, **kwargs)
+            with metrics.stage(name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def metrics_stage(name):
+    """Context manager form of timed_stage, for code outside the decorated functions."""
+    metrics = _active_metrics.get()
+    return metrics.stage(name) if metrics is not None else contextlib.nullcontext()
+
+
+def record_count(name, value=1):
+    """Adds value to the named counter of the active RunMetrics, if any."""
+    metrics = _active_metrics.get()
+    if metrics is not None:
+        metrics.count(name, value)
+
+
+# --- SEGMENT TABLE ---
+# Segments are stored column-wise in NumPy arrays instead of one dict per segment. Rows can still be
+# read like the old dicts (seg['x'], 'center_x' in seg, seg.get(...)) through SegmentRow views.
+SEGMENT_TYPES = ('PTP', 'LINE', 'ARC2')
+TYPE_PTP, TYPE_LINE, TYPE_ARC2 = 0, 1, 2
+_TYPE_CODES = {name: code for code, name in enumerate(SEGMENT_TYPES)}
+
+_RAPID_KEYS = ('type', 'line_num', 'feature_num', 'is_printing', 'start_x', 'start_y', 'x', 'y', 'speed', 'angle')
+_LINEAR_KEYS = ('line_num', 'feature_num', 'is_printing', 'speed', 'type', 'start_x', 'start_y', 'x', 'y', 'angle')
+_ARC_KEYS = ('line_num', 'feature_num', 'is_printing', 'speed', 'type', 'start_x', 'start_y', 'center_x', 'center_y',
+             'angle')
+
+
+def compute_arc_end_points(start_x, start_y, center_x, center_y, angle):
+    """Vectorized get_arc_end_point: returns (end_x, end_y) arrays for the given arc columns."""
+    dx, dy = start_x - center_x, start_y - center_y
+    radius = np.sqrt(dx ** 2 + dy ** 2)
+    end_angle = np.arctan2(dy, dx) + angle
+    degenerate = radius < 1e-9
+    end_x = np.where(degenerate, start_x, center_x + radius * np.cos(end_angle))
+    end_y = np.where(degenerate, start_y, center_y + radius * np.sin(end_angle))
+    return end_x, end_y
+
+
+class SegmentRow(Mapping):
+    """Read-only, dict-like view of one row of a SegmentTable, with the keys of the original segment dicts."""
+    __slots__ = ('_table', '_index')
+
+    def __init__(self, table, index):
+        self._table = table
+        self._index = index
+
+    def _keys(self):
+        table, i = self._table, self._index
+        if table.type_code[i] == TYPE_ARC2:
+            return _ARC_KEYS
+        return _LINEAR_KEYS if table.is_printing[i] else _RAPID_KEYS
+
+    def __getitem__(self, key):
+        if key not in self._keys():
+            raise KeyError(key)
+        table, i = self._table, self._index
+        if key == 'type':
+            return SEGMENT_TYPES[table.type_code[i]]
+        if key == 'x':
+            return float(table.end_x[i])
+        if key == 'y':
+            return float(table.end_y[i])
+        if key == 'speed':
+            return None if table.is_printing[i] else 'default_rapid'
+        if key == 'angle':
+            return float(table.angle[i]) if table.type_code[i] == TYPE_ARC2 else None
+        if key == 'is_printing':
+            return bool(table.is_printing[i])
+        if key in ('line_num', 'feature_num'):
+            return int(getattr(table, key)[i])
+        return float(getattr(table, key)[i])
+
+    def __iter__(self):
+        return iter(self._keys())
+
+    def __len__(self):
+        return len(self._keys())
+
+    @property
+    def end_point(self):
+        """The precomputed end point of the segment (also for ARC2, where it is not a dict key)."""
+        return float(self._table.end_x[self._index]), float(self._table.end_y[self._index])
+
+    def __repr__(self):
+        return f"SegmentRow({dict(self)!r})"
+
+
+class SegmentTable:
+    """
+    Columnar segment store. `type_code` indexes SEGMENT_TYPES; center_x/center_y/angle are NaN for
+    PTP and LINE rows. end_x/end_y hold the end point of every row, including ARC2 rows, where it is
+    computed once here rather than on every tangent lookup.
+    """
+    COLUMNS = ('type_code', 'line_num', 'feature_num', 'is_printing', 'start_x', 'start_y', 'end_x', 'end_y',
+               'center_x', 'center_y', 'angle')
+
+    def __init__(self, type_code, line_num, feature_num, is_printing, start_x, start_y, end_x, end_y, center_x,
+                 center_y, angle):
+        self.type_code = np.asarray(type_code, dtype=np.int8)
+        self.line_num = np.asarray(line_num, dtype=np.int64)
+        self.feature_num = np.asarray(feature_num, dtype=np.int64)
+        self.is_printing = np.asarray(is_printing, dtype=bool)
+        self.start_x = np.asarray(start_x, dtype=np.float64)
+        self.start_y = np.asarray(start_y, dtype=np.float64)
+        self.end_x = np.array(end_x, dtype=np.float64)
+        self.end_y = np.array(end_y, dtype=np.float64)
+        self.center_x = np.asarray(center_x, dtype=np.float64)
+        self.center_y = np.asarray(center_y, dtype=np.float64)
+        self.angle = np.asarray(angle, dtype=np.float64)
+        arcs = self.type_code == TYPE_ARC2
+        if arcs.any():
+            self.end_x[arcs], self.end_y[arcs] = compute_arc_end_points(
+                self.start_x[arcs], self.start_y[arcs], self.center_x[arcs], self.center_y[arcs], self.angle[arcs])
+
+    @classmethod
+    def from_segments(cls, segments):
+        """Builds a table from a list of segment dicts (or rows of another table)."""
+        if isinstance(segments, SegmentTable):
+            return segments
+        nan = float('nan')
+        columns = {name: [] for name in cls.COLUMNS}
+        for seg in segments:
+            is_arc = seg['type'] == 'ARC2'
+            columns['type_code'].append(_TYPE_CODES[seg['type']])
+            columns['line_num'].append(seg['line_num'])
+            columns['feature_num'].append(seg['feature_num'])
+            columns['is_printing'].append(seg['is_printing'])
+            columns['start_x'].append(seg['start_x'])
+            columns['start_y'].append(seg['start_y'])
+            columns['end_x'].append(nan if is_arc else seg['x'])
+            columns['end_y'].append(nan if is_arc else seg['y'])
+            columns['center_x'].append(seg['center_x'] if is_arc else nan)
+            columns['center_y'].append(seg['center_y'] if is_arc else nan)
+            columns['angle'].append(seg['angle'] if is_arc else nan)
+        return cls(**columns)
+
+    @classmethod
+    def from_stored_columns(cls, columns):
+        """Wraps columns that already hold every end point (e.g. memory-mapped ones) without copying them."""
+        table = cls.__new__(cls)
+        for name in cls.COLUMNS:
+            setattr(table, name, columns[name])
+        return table
+
+    @classmethod
+    def concatenate(cls, tables):
+        """Joins tables end to end into one table."""
+        return cls(**{name: np.concatenate([getattr(table, name) for table in tables]) if tables else []
+                      for name in cls.COLUMNS})
+
+    def __len__(self):
+        return len(self.type_code)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return SegmentTable(**{name: getattr(self, name)[index] for name in self.COLUMNS})
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError("segment index out of range")
+        return SegmentRow(self, index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield SegmentRow(self, i)
+
+    @property
+    def nbytes(self):
+        """Size of the columns plus the tessellations cached on the table (see tessellate_segments)."""
+        tessellations = self.__dict__.get('_tessellations', {}).values()
+        return (sum(getattr(self, name).nbytes for name in self.COLUMNS)
+                + sum(t['vertices'].nbytes + t['offsets'].nbytes for t in tessellations))
+
+    def to_dicts(self):
+        """Materializes the table as the list of per-segment dicts that parse_prg_file used to return."""
+        columns = {name: getattr(self, name).tolist() for name in self.COLUMNS}
+        segments = []
+        for i, code in enumerate(columns['type_code']):
+            common = {'line_num': columns['line_num'][i], 'feature_num': columns['feature_num'][i],
+                      'is_printing': columns['is_printing'][i], 'start_x': columns['start_x'][i],
+                      'start_y': columns['start_y'][i]}
+            if code == TYPE_ARC2:
+                common.update({'type': 'ARC2', 'speed': None, 'center_x': columns['center_x'][i],
+                               'center_y': columns['center_y'][i], 'angle': columns['angle'][i]})
+            else:
+                common.update({'type': SEGMENT_TYPES[code], 'speed': None if common['is_printing'] else 'default_rapid',
+                               'x': columns['end_x'][i], 'y': columns['end_y'][i], 'angle': None})
+            segments.append(common)
+        return segments
+
+
+# --- PARSER ---
+# Motion commands are dispatched on their leading keyword (the first four characters of the
+# stripped line), so each line is tried against at most the one or two patterns that can match it.
+PTP_EV_PATTERN = re.compile(r"PTP/ev\s*\((X,Y)\),([-.\d]+),([-.\d]+),(.+)")
+PTP_E_PATTERN = re.compile(r"PTP/e\s*\((X,Y)\),([-.\d]+),([-.\d]+)")
+MSEG_COMMAND_PATTERN = re.compile(r"MSEG(?:/v)?\s*\((X,Y)\),([-.\d]+),([-.\d]+)")
+MSEG_LINE_PATTERN = re.compile(r"LINE\s*\((X,Y)\),([-.\d]+),([-.\d]+)")
+MSEG_ARC2_PATTERN = re.compile(r"ARC2\s*\((X,Y)\),([-.\d]+),([-.\d]+),([-.\d]+)")
+
+
+def _open_prg_source(source):
+    """
+    Returns (text_stream, should_close) for a .prg path, an open file object or an in-memory
+    bytes buffer (e.g. the Streamlit upload). Nothing is written to disk.
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return io.TextIOWrapper(io.BytesIO(source)), True
+    if hasattr(source, 'read'):
+        if isinstance(source, io.TextIOBase):
+            return source, False
+        return io.TextIOWrapper(io.BytesIO(source.read())), True
+    try:
+        return open(source, 'r'), True
     except FileNotFoundError:
-        raise FileNotFoundError(f"File not found during parsing: {filename}")
-    except Exception as e:
+        raise FileNotFoundError(f"File not found during parsing: {source}")
+
+
+@timed_stage('parse')
+def parse_prg_file(source):
+    """
+    Parses a .prg program into a SegmentTable in a single pass.
+    `source` may be a file path, an open file object or the raw bytes of the file.
+    A line belongs to the feature of the first `!Feature` marker at or after it (or to the
+    last feature if it comes after every marker), so segments are tagged once their marker is seen.
+    """
+    file, should_close = _open_prg_source(source)
+    try:
+        columns, feature_runs, _ = _parse_prg_stream(file)
+    except (OSError, UnicodeDecodeError) as e:
         raise Exception(f"Could not read the file. Error: {e}")
+    finally:
+        if should_close:
+            file.close()
+    segment_count = len(columns['type_code'])
+    record_count('segments', segment_count)
+    return SegmentTable(feature_num=_resolve_feature_numbers(feature_runs, segment_count), **columns)
+
+
+def _parse_prg_stream(file, is_printing=False, last_x=None, last_y=None):
+    """
+    The parsing loop of parse_prg_file, starting from the given machine state (shutter open, current
+    position). Line numbers count from 1 at the start of `file`. Returns (columns, feature_runs,
+    exit_state): the SegmentTable columns except feature_num, the (segment count, number) of every
+    feature marker, and the (is_printing, last_x, last_y) state after the last line.
+    """
+    nan = float('nan')
+    type_code, line_nums, is_printing_col = array('b'), array('q'), array('b')
+    start_x, start_y, end_x, end_y = array('d'), array('d'), array('d'), array('d')
+    center_x_col, center_y_col, angle_col = array('d'), array('d'), array('d')
+    feature_runs = []  # (segment count when the marker was seen, feature number)
+
+    def add_segment(code, line_num, printing, x0, y0, x1, y1, cx=nan, cy=nan, sweep=nan):
+        type_code.append(code)
+        line_nums.append(line_num)
+        is_printing_col.append(printing)
+        start_x.append(x0)
+        start_y.append(y0)
+        end_x.append(x1)
+        end_y.append(y1)
+        center_x_col.append(cx)
+        center_y_col.append(cy)
+        angle_col.append(sweep)
 
-    feature_map.sort(key=lambda f: f['end_line'])
-
-    # ... (Rest of the parse_prg_file function is identical, so it is omitted for brevity) ...
-
-    def get_feature_for_line(line_num):
-        """Given a line number, find which feature it belongs to."""
-        for feature in feature_map:
-            if line_num <= feature['end_line']:
-                return feature['number']
-        return feature_map[-1]['number'] if feature_map else 1
-
-    all_segments = []
-    is_printing = False
-    last_x, last_y = None, None
-    ptp_ev_pattern = re.compile(r"PTP/ev\s*\((X,Y)\),([-.\d]+),([-.\d]+),(.+)")
-    ptp_e_pattern = re.compile(r"PTP/e\s*\((X,Y)\),([-.\d]+),([-.\d]+)")
-    mseg_command_pattern = re.compile(r"MSEG(?:/v)?\s*\((X,Y)\),([-.\d]+),([-.\d]+)")
-    mseg_line_pattern = re.compile(r"LINE\s*\((X,Y)\),([-.\d]+),([-.\d]+)")
-    mseg_arc2_pattern = re.compile(r"ARC2\s*\((X,Y)\),([-.\d]+),([-.\d]+),([-.\d]+)")
-    with open(filename, 'r') as file:
-        lines = file.readlines()
-    for line_num, line_content in enumerate(lines, 1):
+    for line_num, line_content in enumerate(file, 1):
         line = line_content.strip()
-        if not line or line.startswith("!"):
+        if not line:
             continue
-        current_feature_num = get_feature_for_line(line_num)
-        match_ptp_rapid = ptp_ev_pattern.match(line)
-        if match_ptp_rapid and "gDblRapidSpeed" in match_ptp_rapid.group(4):
-            x, y = float(match_ptp_rapid.group(2)), float(match_ptp_rapid.group(3))
-            if last_x is not None:
-                all_segments.append({
-                    'type': 'PTP', 'line_num': line_num, 'feature_num': current_feature_num,
-                    'is_printing': False, 'start_x': last_x, 'start_y': last_y, 'x': x, 'y': y,
-                    'speed': 'default_rapid', 'angle': None
-                })
-            last_x, last_y = x, y
+        if line[0] == "!":
+            if line.startswith("!Feature"):
+                try:
+                    feature_runs.append((len(type_code), int(line.split(" ")[1])))
+                except (IndexError, ValueError):
+                    pass
             continue
+        keyword = line[:4]
+        if keyword == "PTP/":
+            match_ptp_rapid = PTP_EV_PATTERN.match(line)
+            if match_ptp_rapid and "gDblRapidSpeed" in match_ptp_rapid.group(4):
+                x, y = float(match_ptp_rapid.group(2)), float(match_ptp_rapid.group(3))
+                if last_x is not None:
+                    add_segment(TYPE_PTP, line_num, False, last_x, last_y, x, y)
+                last_x, last_y = x, y
+                continue
         if "Start gIntSubBuffer,ShutterOpen" in line or line == "OUT0.0=1":
             is_printing = True
         elif "Start gIntSubBuffer,ShutterClose" in line or line == "OUT0.0=0":
             is_printing = False
-        segment = {'line_num': line_num, 'feature_num': current_feature_num, 'is_printing': is_printing, 'speed': None}
-        match = ptp_e_pattern.match(line)
-        if match and is_printing:
-            x, y = float(match.group(2)), float(match.group(3))
-            if last_x is not None:
-                segment.update({'type': 'PTP', 'start_x': last_x, 'start_y': last_y, 'x': x, 'y': y, 'angle': None})
-                all_segments.append(segment)
-            last_x, last_y = x, y
-            continue
-        match = mseg_command_pattern.match(line)
-        if match:
-            x_mseg_start, y_mseg_start = float(match.group(2)), float(match.group(3))
-            if last_x is not None and (abs(last_x - x_mseg_start) > 1e-6 or abs(last_y - y_mseg_start) > 1e-6):
-                all_segments.append({
-                    'type': 'PTP', 'line_num': line_num, 'feature_num': current_feature_num,
-                    'is_printing': False, 'start_x': last_x, 'start_y': last_y, 'x': x_mseg_start, 'y': y_mseg_start,
-                    'speed': 'default_rapid', 'angle': None
-                })
-            last_x, last_y = x_mseg_start, y_mseg_start
-            continue
-        match = mseg_line_pattern.match(line)
-        if match and is_printing:
-            x, y = float(match.group(2)), float(match.group(3))
-            if last_x is not None:
-                segment.update({'type': 'LINE', 'start_x': last_x, 'start_y': last_y, 'x': x, 'y': y, 'angle': None})
-                all_segments.append(segment)
-            last_x, last_y = x, y
-            continue
-        match = mseg_arc2_pattern.match(line)
-        if match and is_printing:
-            center_x, center_y, angle_rad_val = float(match.group(2)), float(match.group(3)), float(match.group(4))
-            if last_x is not None:
-                segment.update(
-                    {'type': 'ARC2', 'start_x': last_x, 'start_y': last_y, 'center_x': center_x, 'center_y': center_y,
-                     'angle': angle_rad_val})
-                all_segments.append(segment)
-                if abs(angle_rad_val) > 1e-6:
-                    radius = np.sqrt((last_x - center_x) ** 2 + (last_y - center_y) ** 2)
-                    if radius > 1e-9:
-                        start_angle_rad_calc = np.arctan2(last_y - center_y, last_x - center_x)
-                        end_angle_rad_calc = start_angle_rad_calc + angle_rad_val
-                        last_x = center_x + radius * np.cos(end_angle_rad_calc)
-                        last_y = center_y + radius * np.sin(end_angle_rad_calc)
-            continue
-    return all_segments
+        if keyword == "PTP/":
+            match = PTP_E_PATTERN.match(line)
+            if match and is_printing:
+                x, y = float(match.group(2)), float(match.group(3))
+                if last_x is not None:
+                    add_segment(TYPE_PTP, line_num, True, last_x, last_y, x, y)
+                last_x, last_y = x, y
+        elif keyword == "MSEG":
+            match = MSEG_COMMAND_PATTERN.match(line)
+            if match:
+                x_mseg_start, y_mseg_start = float(match.group(2)), float(match.group(3))
+                if last_x is not None and (abs(last_x - x_mseg_start) > 1e-6 or abs(last_y - y_mseg_start) > 1e-6):
+                    add_segment(TYPE_PTP, line_num, False, last_x, last_y, x_mseg_start, y_mseg_start)
+                last_x, last_y = x_mseg_start, y_mseg_start
+        elif keyword == "LINE":
+            match = MSEG_LINE_PATTERN.match(line)
+            if match and is_printing:
+                x, y = float(match.group(2)), float(match.group(3))
+                if last_x is not None:
+                    add_segment(TYPE_LINE, line_num, True, last_x, last_y, x, y)
+                last_x, last_y = x, y
+        elif keyword == "ARC2":
+            match = MSEG_ARC2_PATTERN.match(line)
+            if match and is_printing:
+                center_x, center_y, angle_rad_val = float(match.group(2)), float(match.group(3)), float(
+                    match.group(4))
+                if last_x is not None:
+                    # The end point column is filled in for all arcs at once by SegmentTable.
+                    add_segment(TYPE_ARC2, line_num, True, last_x, last_y, nan, nan, center_x, center_y,
+                                angle_rad_val)
+                    if abs(angle_rad_val) > 1e-6:
+                        radius = np.sqrt((last_x - center_x) ** 2 + (last_y - center_y) ** 2)
+                        if radius > 1e-9:
+                            start_angle_rad_calc = np.arctan2(last_y - center_y, last_x - center_x)
+                            end_angle_rad_calc = start_angle_rad_calc + angle_rad_val
+                            last_x = center_x + radius * np.cos(end_angle_rad_calc)
+                            last_y = center_y + radius * np.sin(end_angle_rad_calc)
+    columns = {'type_code': type_code, 'line_num': line_nums, 'is_printing': is_printing_col, 'start_x': start_x,
+               'start_y': start_y, 'end_x': end_x, 'end_y': end_y, 'center_x': center_x_col,
+               'center_y': center_y_col, 'angle': angle_col}
+    return columns, feature_runs, (is_printing, last_x, last_y)
+
+
+def _resolve_feature_numbers(feature_runs, segment_count):
+    """
+    Expands (segment count at marker, feature number) pairs into a per-segment feature column.
+    Segments after the last marker belong to the last feature (or feature 1 if there are none).
+    """
+    feature_num = np.empty(segment_count, dtype=np.int64)
+    run_start = 0
+    for run_end, number in feature_runs:
+        feature_num[run_start:run_end] = number
+        run_start = max(run_start, run_end)
+    feature_num[run_start:] = feature_runs[-1][1] if feature_runs else 1
+    return feature_num
+
+
+# --- TOOLPATH FILES ---
+# A parsed program can be saved as a binary toolpath file and memory-mapped back instead of parsing the
+# text again. Layout: TOOLPATH_MAGIC, the header length as a little-endian uint32, a JSON header, then
+# every array at a 64-byte aligned offset. Besides the SegmentTable columns the file holds the feature
+# map (first segment of every run of one feature number) and the byte offset of every source line.
+# The header records the SHA-256 of the source program, so a file whose program has changed is stale.
+TOOLPATH_MAGIC = b'PRGPATH\x00'
+TOOLPATH_VERSION = 1
+TOOLPATH_SUFFIX = '.toolpath'
+_TOOLPATH_ALIGNMENT = 64
+
+
+def _align(offset):
+    return -(-offset // _TOOLPATH_ALIGNMENT) * _TOOLPATH_ALIGNMENT
+
+
+def build_line_index(data):
+    """
+    Byte offset of the start of every line of a program, plus len(data) at the end, so line n
+    (counted from 1, as in line_num) is data[index[n - 1]:index[n]]. CR, LF and CRLF all end a line.
+    """
+    raw = np.frombuffer(data, dtype=np.uint8)
+    line_breaks = raw == 10
+    line_breaks[:-1] |= (raw[:-1] == 13) & (raw[1:] != 10)
+    if len(raw):
+        line_breaks[-1] |= raw[-1] == 13
+    starts = np.flatnonzero(line_breaks) + 1
+    if len(raw) and (not len(starts) or starts[-1] != len(raw)):
+        starts = np.append(starts, len(raw))
+    return np.concatenate(([0], starts)).astype(np.int64)
+
+
+@timed_stage('toolpath.save')
+def save_toolpath(segments, path, source_data):
+    """Writes parsed segments of the program `source_data` (its bytes) to a toolpath file at path."""
+    table = SegmentTable.from_segments(segments)
+    run_starts = np.ones(len(table), dtype=bool)
+    run_starts[1:] = table.feature_num[1:] != table.feature_num[:-1]
+    feature_starts = np.flatnonzero(run_starts)
+    arrays = {name: getattr(table, name) for name in SegmentTable.COLUMNS}
+    arrays.update(feature_numbers=table.feature_num[feature_starts], feature_starts=feature_starts.astype(np.int64),
+                  line_offsets=build_line_index(source_data))
+    specs, offset = {}, 0
+    for name, values in arrays.items():
+        values = np.ascontiguousarray(values, dtype=values.dtype.newbyteorder('<'))
+        arrays[name] = values
+        specs[name] = {'dtype': values.dtype.str, 'length': len(values), 'offset': offset}
+        offset = _align(offset + values.nbytes)
+    header = json.dumps({'version': TOOLPATH_VERSION, 'source_sha256': file_digest(source_data),
+                         'source_bytes': len(source_data), 'segments': len(table), 'arrays': specs}).encode()
+    data_start = _align(len(TOOLPATH_MAGIC) + 4 + len(header))
+    temp_path = f"{path}.{uuid.uuid4().hex[:8]}.tmp"
+    try:
+        with open(temp_path, 'wb') as toolpath_file:
+            toolpath_file.write(TOOLPATH_MAGIC + len(header).to_bytes(4, 'little') + header)
+            for name, values in arrays.items():
+                toolpath_file.seek(data_start + specs[name]['offset'])
+                toolpath_file.write(values.tobytes())
+            toolpath_file.truncate(data_start + offset)
+        os.replace(temp_path, path)  # readers never see a half-written file
+    except OSError as e:
+        raise Exception(f"Could not write the toolpath file. Error: {e}")
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return path
+
+
+@timed_stage('toolpath.load')
+def load_toolpath(path):
+    """
+    Memory-maps a toolpath file. Returns a dict with the SegmentTable ('segments', read-only),
+    'feature_numbers', 'feature_starts', 'line_offsets', 'source_sha256' and 'source_bytes'.
+    """
+    try:
+        with open(path, 'rb') as toolpath_file:
+            prefix = toolpath_file.read(len(TOOLPATH_MAGIC) + 4)
+            if prefix[:len(TOOLPATH_MAGIC)] != TOOLPATH_MAGIC:
+                raise ValueError("not a toolpath file")
+            header_length = int.from_bytes(prefix[len(TOOLPATH_MAGIC):], 'little')
+            header = json.loads(toolpath_file.read(header_length))
+        if header.get('version') != TOOLPATH_VERSION:
+            raise ValueError(f"unsupported toolpath version {header.get('version')}")
+        mapped = np.memmap(path, dtype=np.uint8, mode='r')
+        data_start = _align(len(TOOLPATH_MAGIC) + 4 + header_length)
+        arrays = {name: np.ndarray((spec['length'],), dtype=spec['dtype'], buffer=mapped,
+                                   offset=data_start + spec['offset'])
+                  for name, spec in header['arrays'].items()}
+    except (OSError, ValueError, KeyError, TypeError) as e:
+        raise Exception(f"Could not read the toolpath file. Error: {e}")
+    record_count('segments', header['segments'])
+    return {'segments': SegmentTable.from_stored_columns(arrays), 'feature_numbers': arrays['feature_numbers'],
+            'feature_starts': arrays['feature_starts'], 'line_offsets': arrays['line_offsets'],
+            'source_sha256': header['source_sha256'], 'source_bytes': header['source_bytes']}
+
+
+def load_current_toolpath(toolpath_path, source_data):
+    """Returns load_toolpath(toolpath_path) if that file exists and was written for `source_data`, else None."""
+    if os.path.exists(toolpath_path):
+        try:
+            toolpath = load_toolpath(toolpath_path)
+            if toolpath['source_sha256'] == file_digest(source_data):
+                return toolpath
+        except Exception:
+            pass  # unreadable or written by another version: the caller rebuilds it
+    return None
+
+
+def load_or_parse_toolpath(source_path, toolpath_path=None):
+    """
+    Returns load_toolpath() for a .prg file. The toolpath file (default: next to the program, with
+    TOOLPATH_SUFFIX appended) is used if it was written for the program's current contents; otherwise
+    the program is parsed and the file is (re)written first.
+    """
+    data = _read_prg_bytes(source_path)
+    toolpath_path = toolpath_path or f"{source_path}{TOOLPATH_SUFFIX}"
+    toolpath = load_current_toolpath(toolpath_path, data)
+    if toolpath is not None:
+        return toolpath
+    save_toolpath(parse_prg_file(data), toolpath_path, data)
+    return load_toolpath(toolpath_path)
+
+
+# --- ANALYSIS/GEOMETRY FUNCTIONS ---
+# Every event is tagged with its category when it is created, so consumers never have to work out
+# which list an event came from.
+EVENT_CATEGORY_STRESS = 'stress'
+EVENT_CATEGORY_INFO = 'info'
 
 
-# --- ANALYSIS/GEOMETRY FUNCTIONS (No changes) ---
 def get_arc_end_point(segment):
     radius = math.sqrt(
         (segment['start_x'] - segment['center_x']) ** 2 + (segment['start_y'] - segment['center_y']) ** 2)
@@ -141,7 +644,8 @@ def get_arc_tangent(segment, at_start=True):
         radius_vec_x = segment['start_x'] - segment['center_x']
         radius_vec_y = segment['start_y'] - segment['center_y']
     else:
-        end_x, end_y = get_arc_end_point(segment)
+        # Rows of a SegmentTable carry the arc end point precomputed.
+        end_x, end_y = segment.end_point if isinstance(segment, SegmentRow) else get_arc_end_point(segment)
         radius_vec_x = end_x - segment['center_x']
         radius_vec_y = end_y - segment['center_y']
     if segment['angle'] > 0:
@@ -150,7 +654,8 @@ def get_arc_tangent(segment, at_start=True):
         return radius_vec_y, -radius_vec_x
 
 
-def run_path_stress_analysis(parsed_segments, g_factor):
+def run_path_stress_analysis_reference(parsed_segments, g_factor):
+    """Scalar, pair-by-pair implementation of the stress analysis, kept as the reference for the vectorized one."""
     if not parsed_segments:
         return None, [], [], {}
     G_ACCELERATION = 9800.0
@@ -189,7 +694,8 @@ def run_path_stress_analysis(parsed_segments, g_factor):
                     stress_events.append({'type': 'Line-to-Line', 'line_num': next_seg['line_num'],
                                           'feature_num': next_seg['feature_num'],
                                           'coords': (next_seg['start_x'], next_seg['start_y']),
-                                          'message': f"Sharp turn of {angle:.1f} degrees detected."})
+                                          'message': f"Sharp turn of {angle:.1f} degrees detected.",
+                                          'category': EVENT_CATEGORY_STRESS})
         if current_seg['type'] in ['PTP', 'LINE'] and next_seg['type'] == 'ARC2':
             v_line_x = current_seg['x'] - current_seg['start_x'];
             v_line_y = current_seg['y'] - current_seg['start_y']
@@ -202,7 +708,8 @@ def run_path_stress_analysis(parsed_segments, g_factor):
                 stress_events.append({'type': 'Line-Arc Stress', 'line_num': next_seg['line_num'],
                                       'feature_num': next_seg['feature_num'],
                                       'coords': (next_seg['start_x'], next_seg['start_y']),
-                                      'message': "Non-tangential transition from a line into an arc."})
+                                      'message': "Non-tangential transition from a line into an arc.",
+                                      'category': EVENT_CATEGORY_STRESS})
         if current_seg['type'] == 'ARC2' and next_seg['type'] in ['PTP', 'LINE']:
             t_x, t_y = get_arc_tangent(current_seg, at_start=False)
             l_x = next_seg['x'] - next_seg['start_x'];
@@ -214,7 +721,8 @@ def run_path_stress_analysis(parsed_segments, g_factor):
                 stress_events.append({'type': 'Line-Arc Stress', 'line_num': next_seg['line_num'],
                                       'feature_num': next_seg['feature_num'],
                                       'coords': (next_seg['start_x'], next_seg['start_y']),
-                                      'message': "Non-tangential transition from an arc into a line."})
+                                      'message': "Non-tangential transition from an arc into a line.",
+                                      'category': EVENT_CATEGORY_STRESS})
         if current_seg['type'] == 'ARC2' and next_seg['type'] == 'ARC2':
             t1_x, t1_y = get_arc_tangent(current_seg, at_start=False)
             t2_x, t2_y = get_arc_tangent(next_seg, at_start=True)
@@ -227,7 +735,8 @@ def run_path_stress_analysis(parsed_segments, g_factor):
                     stress_events.append({'type': 'Arc-to-Arc Stress', 'line_num': next_seg['line_num'],
                                           'feature_num': next_seg['feature_num'],
                                           'coords': (next_seg['start_x'], next_seg['start_y']),
-                                          'message': f"Non-collinear transition between arcs. Angle: {angle:.1f} degrees."})
+                                          'message': f"Non-collinear transition between arcs. Angle: {angle:.1f} degrees.",
+                                          'category': EVENT_CATEGORY_STRESS})
     if limiting_process_speed is not None:
         for arc in printing_arcs:
             radius = math.sqrt((arc['start_x'] - arc['center_x']) ** 2 + (arc['start_y'] - arc['center_y']) ** 2)
@@ -236,12 +745,1206 @@ def run_path_stress_analysis(parsed_segments, g_factor):
                 status = "At Limit" if abs(accel_at_limit_speed - ACCEL_LIMIT) < 1.0 else "Below Limit"
                 arc_info_events.append({
                     'type': 'Arc Acceleration Info', 'line_num': arc['line_num'], 'feature_num': arc['feature_num'],
-                    'message': f"At {limiting_process_speed:.1f} mm/s, this arc experiences {accel_at_limit_speed:.1f} mm/s^2 ({status})."
+                    'message': f"At {limiting_process_speed:.1f} mm/s, this arc experiences {accel_at_limit_speed:.1f} mm/s^2 ({status}).",
+                    'category': EVENT_CATEGORY_INFO
                 })
     return limiting_process_speed, stress_events, arc_info_events, limiting_arc_details
 
 
-# --- REPORTING FUNCTIONS (No changes) ---
+# --- VECTORIZED ANALYSIS ---
+# Batched version of the scalar checks in run_path_stress_analysis_reference. All consecutive segment
+# pairs are evaluated at once as array operations; only the flagged pairs are turned into event dicts.
+G_ACCELERATION = 9800.0
+CRITICAL_TURNING_ANGLE_DEG = 1.0
+TANGENT_DOT_PRODUCT_TOLERANCE = 0.02
+DEFAULT_MIN_TRACE_GAP = 0.05  # mm, centerline to centerline (see SPATIAL ANALYSIS)
+# Pair kinds, by the types of the current and next segment ("line" covers both PTP and LINE).
+PAIR_NONE, PAIR_LINE_LINE, PAIR_LINE_ARC, PAIR_ARC_LINE, PAIR_ARC_ARC = 0, 1, 2, 3, 4
+# Angles are pre-filtered with this slack (degrees) and re-checked with math.acos, so the vectorized
+# thresholds can never disagree with the scalar reference because of last-bit differences in arccos.
+_ANGLE_PREFILTER_SLACK_DEG = 1e-6
+
+
+def compute_segment_directions(table):
+    """
+    Returns (start_dx, start_dy, end_dx, end_dy): the direction of every segment at its start and end.
+    For PTP/LINE rows both are the chord vector; for ARC2 rows they are the (unnormalized) tangents,
+    with the same sign convention as get_arc_tangent.
+    """
+    arcs = table.type_code == TYPE_ARC2
+    chord_x, chord_y = table.end_x - table.start_x, table.end_y - table.start_y
+    sign = np.where(table.angle > 0, 1.0, -1.0)
+    start_rx, start_ry = table.start_x - table.center_x, table.start_y - table.center_y
+    end_rx, end_ry = table.end_x - table.center_x, table.end_y - table.center_y
+    return (np.where(arcs, -sign * start_ry, chord_x), np.where(arcs, sign * start_rx, chord_y),
+            np.where(arcs, -sign * end_ry, chord_x), np.where(arcs, sign * end_rx, chord_y))
+
+
+def compute_pair_geometry(table):
+    """
+    Evaluates every consecutive printing pair (i, i + 1) at once.
+    Returns (kind, cosine, valid): the PAIR_* kind of each pair (PAIR_NONE unless both segments print),
+    the cosine between the compared vectors, and whether both vectors were long enough to compare.
+    Line-to-arc pairs compare the line with the arc's start radius, all others the end and start directions.
+    """
+    if len(table) < 2:
+        empty = np.zeros(0)
+        return empty.astype(np.int8), empty, empty.astype(bool)
+    arcs = table.type_code == TYPE_ARC2
+    start_dx, start_dy, end_dx, end_dy = compute_segment_directions(table)
+    cur_arc, next_arc = arcs[:-1], arcs[1:]
+    line_to_arc = ~cur_arc & next_arc
+    a_x, a_y = end_dx[:-1], end_dy[:-1]
+    b_x = np.where(line_to_arc, table.start_x[1:] - table.center_x[1:], start_dx[1:])
+    b_y = np.where(line_to_arc, table.start_y[1:] - table.center_y[1:], start_dy[1:])
+    mag_a = np.sqrt(a_x ** 2 + a_y ** 2)
+    mag_b = np.sqrt(b_x ** 2 + b_y ** 2)
+    valid = (mag_a > 1e-6) & (mag_b > 1e-6)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        cosine = ((a_x * b_x) + (a_y * b_y)) / (mag_a * mag_b)
+    kind = np.where(cur_arc, np.where(next_arc, PAIR_ARC_ARC, PAIR_ARC_LINE),
+                    np.where(next_arc, PAIR_LINE_ARC, PAIR_LINE_LINE)).astype(np.int8)
+    kind[~(table.is_printing[:-1] & table.is_printing[1:])] = PAIR_NONE
+    return kind, cosine, valid
+
+
+def _exact_turn_angle(cos_value):
+    return math.degrees(math.acos(min(1.0, max(-1.0, cos_value))))
+
+
+def find_stress_pairs(table):
+    """
+    Returns (pair_indices, kind, cosine) for every consecutive pair (i, i + 1) that the stress checks
+    flag, in segment order. kind and cosine are the compute_pair_geometry values of those pairs.
+    """
+    kind, cosine, valid = compute_pair_geometry(table)
+    with np.errstate(invalid='ignore'):
+        angle = np.degrees(np.arccos(np.clip(cosine, -1.0, 1.0)))
+    flagged = valid & (
+            ((kind == PAIR_LINE_LINE) & (angle >= CRITICAL_TURNING_ANGLE_DEG - _ANGLE_PREFILTER_SLACK_DEG)) |
+            ((kind == PAIR_LINE_ARC) & (np.abs(cosine) > TANGENT_DOT_PRODUCT_TOLERANCE)) |
+            ((kind == PAIR_ARC_LINE) & (np.abs(np.abs(cosine) - 1.0) > TANGENT_DOT_PRODUCT_TOLERANCE)) |
+            ((kind == PAIR_ARC_ARC) & (angle > CRITICAL_TURNING_ANGLE_DEG - _ANGLE_PREFILTER_SLACK_DEG) &
+             (angle < 180 - CRITICAL_TURNING_ANGLE_DEG + _ANGLE_PREFILTER_SLACK_DEG)))
+    candidates = np.flatnonzero(flagged)
+    keep = []
+    for pair_kind, cos_value in zip(kind[candidates].tolist(), cosine[candidates].tolist()):
+        if pair_kind == PAIR_LINE_LINE:
+            keep.append(_exact_turn_angle(cos_value) >= CRITICAL_TURNING_ANGLE_DEG)
+        elif pair_kind == PAIR_ARC_ARC:
+            keep.append(CRITICAL_TURNING_ANGLE_DEG < _exact_turn_angle(cos_value) < (180 - CRITICAL_TURNING_ANGLE_DEG))
+        else:
+            keep.append(True)
+    pair_indices = candidates[np.array(keep, dtype=bool)]
+    return pair_indices, kind[pair_indices], cosine[pair_indices]
+
+
+def find_stress_events(table):
+    """Vectorized equivalent of the pairwise stress checks; returns stress events in segment order."""
+    return stress_events_from_pairs(table, *find_stress_pairs(table))
+
+
+def stress_events_from_pairs(table, pair_indices, kinds, cosines):
+    """Builds the stress event dicts for the flagged pairs returned by find_stress_pairs."""
+    line_nums = table.line_num[pair_indices + 1].tolist()
+    feature_nums = table.feature_num[pair_indices + 1].tolist()
+    xs = table.start_x[pair_indices + 1].tolist()
+    ys = table.start_y[pair_indices + 1].tolist()
+    stress_events = []
+    for pair_kind, cos_value, line_num, feature_num, x, y in zip(kinds.tolist(), cosines.tolist(), line_nums,
+                                                                 feature_nums, xs, ys):
+        if pair_kind == PAIR_LINE_LINE:
+            event_type = 'Line-to-Line'
+            message = f"Sharp turn of {_exact_turn_angle(cos_value):.1f} degrees detected."
+        elif pair_kind == PAIR_ARC_ARC:
+            event_type = 'Arc-to-Arc Stress'
+            message = f"Non-collinear transition between arcs. Angle: {_exact_turn_angle(cos_value):.1f} degrees."
+        elif pair_kind == PAIR_LINE_ARC:
+            event_type, message = 'Line-Arc Stress', "Non-tangential transition from a line into an arc."
+        else:
+            event_type, message = 'Line-Arc Stress', "Non-tangential transition from an arc into a line."
+        stress_events.append({'type': event_type, 'line_num': line_num, 'feature_num': feature_num,
+                              'coords': (x, y), 'message': message, 'category': EVENT_CATEGORY_STRESS})
+    return stress_events
+
+
+def printing_arc_radii(table):
+    """Returns (row indices, radii) of all printing ARC2 segments."""
+    rows = np.flatnonzero(table.is_printing & (table.type_code == TYPE_ARC2))
+    radii = np.sqrt((table.start_x[rows] - table.center_x[rows]) ** 2 + (table.start_y[rows] - table.center_y[rows]) ** 2)
+    return rows, radii
+
+
+def find_limiting_arc(table):
+    """Returns (min_radius, limiting_arc_details) for the tightest printing arc, or (None, {}) if there is none."""
+    rows, radii = printing_arc_radii(table)
+    positive = np.where(radii > 0, radii, np.inf)
+    if not len(positive) or np.isinf(positive.min()):
+        return None, {}
+    tightest = int(np.argmin(positive))
+    row = rows[tightest]
+    min_radius = float(radii[tightest])
+    return min_radius, {'radius': min_radius, 'line_num': int(table.line_num[row]),
+                        'feature_num': int(table.feature_num[row])}
+
+
+def find_arc_acceleration_events(table, limiting_process_speed, accel_limit):
+    """Info events with the centripetal acceleration of every printing arc at the limiting speed."""
+    if limiting_process_speed is None:
+        return []
+    rows, radii = printing_arc_radii(table)
+    keep = radii > 1e-6
+    rows, radii = rows[keep], radii[keep]
+    accel_at_limit_speed = (limiting_process_speed ** 2) / radii
+    at_limit = np.abs(accel_at_limit_speed - accel_limit) < 1.0
+    return [{'type': 'Arc Acceleration Info', 'line_num': line_num, 'feature_num': feature_num,
+             'message': f"At {limiting_process_speed:.1f} mm/s, this arc experiences {accel:.1f} mm/s^2 "
+                        f"({'At Limit' if is_at_limit else 'Below Limit'}).", 'category': EVENT_CATEGORY_INFO}
+            for line_num, feature_num, accel, is_at_limit in zip(
+            table.line_num[rows].tolist(), table.feature_num[rows].tolist(), accel_at_limit_speed.tolist(),
+            at_limit.tolist())]
+
+
+@timed_stage('analysis.geometry')
+def analyze_geometry(parsed_segments):
+    """
+    Runs the G-factor independent part of the analysis. Returns a dict with the SegmentTable
+    ('segments'), 'stress_events', and the tightest printing arc ('min_radius', 'limiting_arc_details').
+    """
+    table = SegmentTable.from_segments(parsed_segments)
+    min_radius, limiting_arc_details = find_limiting_arc(table)
+    stress_events = find_stress_events(table)
+    record_count('stress_events', len(stress_events))
+    return {'segments': table, 'stress_events': stress_events, 'min_radius': min_radius,
+            'limiting_arc_details': limiting_arc_details}
+
+
+@timed_stage('analysis.g_factor')
+def apply_g_factor(geometry, g_factor):
+    """Completes a geometry result for one G-factor. Returns (limiting_process_speed, arc_info_events)."""
+    accel_limit = g_factor * G_ACCELERATION
+    min_radius = geometry['min_radius']
+    limiting_process_speed = math.sqrt(accel_limit * min_radius) if min_radius is not None else None
+    arc_info_events = find_arc_acceleration_events(geometry['segments'], limiting_process_speed, accel_limit)
+    record_count('arc_info_events', len(arc_info_events))
+    return limiting_process_speed, arc_info_events
+
+
+@timed_stage('analysis')
+def run_path_stress_analysis(parsed_segments, g_factor, min_trace_gap=None):
+    """
+    Analyzes a SegmentTable (or list of segment dicts) and returns
+    (limiting_process_speed, stress_events, arc_info_events, limiting_arc_details).
+    The pairwise checks produce the same results as run_path_stress_analysis_reference, as array
+    operations. With a min_trace_gap, the spatial events of find_spatial_events follow them.
+    """
+    if not len(parsed_segments):
+        return None, [], [], {}
+    return _complete_analysis(analyze_geometry(parsed_segments), g_factor, min_trace_gap)
+
+
+def _complete_analysis(geometry, g_factor, min_trace_gap):
+    """The G-factor and spatial part of run_path_stress_analysis, for a geometry result."""
+    limiting_process_speed, arc_info_events = apply_g_factor(geometry, g_factor)
+    stress_events = geometry['stress_events']
+    if min_trace_gap is not None:
+        stress_events = stress_events + find_spatial_events(geometry['segments'], min_trace_gap)
+    return limiting_process_speed, stress_events, arc_info_events, geometry['limiting_arc_details']
+
+
+# --- INCREMENTAL ANALYSIS ---
+# A program is split into !Feature blocks (each block ends with its marker line). A block's segments
+# and stress pairs depend only on its bytes and on the machine state it starts from (shutter state
+# and current position), so both are cached under (block fingerprint, entry state). Re-uploading an
+# edited program only parses and checks the blocks that changed (and a block whose entry state moved);
+# line numbers and feature numbers are rebased when blocks are merged, and the pairs across block
+# seams are always re-checked. Small blocks are grouped into chunks of at least
+# INCREMENTAL_MIN_CHUNK_BYTES, which are the unit of caching.
+_FEATURE_MARKER_LINE = re.compile(rb'^[ \t]*!Feature[^\n]*\n?', re.MULTILINE)
+INCREMENTAL_MIN_CHUNK_BYTES = 64 * 1024
+
+
+def split_feature_blocks(data):
+    """Returns the (start, end) byte ranges of the !Feature blocks of a program's bytes."""
+    if data.count(b'\r') != data.count(b'\r\n'):
+        return [(0, len(data))] if data else []  # bare CR line breaks: keep the text stream's line numbering
+    bounds = [0] + [match.end() for match in _FEATURE_MARKER_LINE.finditer(data)]
+    if bounds[-1] < len(data):
+        bounds.append(len(data))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def chunk_feature_blocks(data, min_bytes):
+    """
+    Groups the !Feature blocks of a program's bytes into (start, end) chunks of at least `min_bytes`
+    (except the last one). Once a chunk is big enough, each block ends it with a chance of its size in
+    `min_bytes`, picked by the block's checksum. The cuts depend only on the blocks' own bytes, so after
+    an edit the chunks that follow soon line up with the cached ones again.
+    """
+    chunks, chunk_start = [], 0
+    for start, end in split_feature_blocks(data):
+        if end - chunk_start >= min_bytes and zlib.crc32(data[start:end]) % min_bytes < end - start:
+            chunks.append((chunk_start, end))
+            chunk_start = end
+    if chunk_start < len(data):
+        chunks.append((chunk_start, len(data)))
+    return chunks
+
+
+def _analyze_block(block, entry_state):
+    """
+    Parses one block from entry_state. Returns its table (line numbers local to the block), its feature
+    runs as an array of (segment count, number) rows, its exit state and its stress pairs.
+    """
+    try:
+        columns, feature_runs, exit_state = _parse_prg_stream(io.TextIOWrapper(io.BytesIO(block)), *entry_state)
+    except UnicodeDecodeError as e:
+        raise Exception(f"Could not read the file. Error: {e}")
+    table = SegmentTable(feature_num=np.zeros(len(columns['type_code']), dtype=np.int64), **columns)
+    feature_runs = np.array(feature_runs, dtype=np.int64).reshape(-1, 2)
+    return {'segments': table, 'feature_runs': feature_runs, 'exit_state': exit_state,
+            'stress_pairs': find_stress_pairs(table)}
+
+
+@timed_stage('analysis.incremental')
+def analyze_geometry_incremental(data, cache):
+    """
+    Same result as analyze_geometry(parse_prg_file(data)) for a program's bytes, reusing the chunks of
+    !Feature blocks that are already in `cache` (a ResultCache) and adding the new ones to it.
+    """
+    data = bytes(data)
+    blocks, line_offsets = [], []
+    state, line_offset, reused = (False, None, None), 0, 0
+    for start, end in chunk_feature_blocks(data, INCREMENTAL_MIN_CHUNK_BYTES):
+        chunk = data[start:end]
+        key = ('prg_block', hashlib.blake2b(chunk, digest_size=16).digest(), state)
+        reused += key in cache
+        block = cache.get_or_compute(key, lambda: _analyze_block(chunk, state))
+        blocks.append(block)
+        line_offsets.append(line_offset)
+        state = block['exit_state']
+        line_offset += chunk.count(b'\n')
+    record_count('blocks', len(blocks))
+    record_count('blocks_reused', reused)
+    return _merge_blocks(blocks, line_offsets)
+
+
+def _merge_blocks(blocks, line_offsets):
+    """
+    Joins consecutive analyzed blocks (see _analyze_block) into a geometry result, given the number of
+    lines before each block. Pairs inside blocks are taken over; the pair across every seam is checked.
+    """
+    counts = np.array([len(block['segments']) for block in blocks], dtype=np.int64)
+    segment_offsets = np.concatenate(([0], np.cumsum(counts)[:-1])) if len(blocks) else counts
+    table = SegmentTable.concatenate([block['segments'] for block in blocks])
+    table.line_num += np.repeat(np.array(line_offsets, dtype=np.int64), counts)
+    feature_runs = np.concatenate([np.zeros((0, 2), dtype=np.int64)] + [
+        block['feature_runs'] + (offset, 0) for block, offset in zip(blocks, segment_offsets)])
+    table.feature_num = _resolve_feature_numbers(feature_runs.tolist(), len(table))
+
+    # The pair across every seam is checked on a gathered table of (last row of one block, first row of
+    # the next), keeping only the even (seam) pairs.
+    seams = segment_offsets[(counts > 0) & (segment_offsets > 0)] - 1
+    seam_rows = np.column_stack((seams, seams + 1)).ravel()
+    seam_table = SegmentTable(**{name: getattr(table, name)[seam_rows] for name in SegmentTable.COLUMNS})
+    seam_pairs, seam_kinds, seam_cosines = find_stress_pairs(seam_table)
+    on_seam = seam_pairs % 2 == 0
+    pair_indices = np.concatenate([block['stress_pairs'][0] + offset for block, offset in zip(blocks, segment_offsets)]
+                                  + [seams[seam_pairs[on_seam] // 2]]).astype(np.int64)
+    kinds = np.concatenate([block['stress_pairs'][1] for block in blocks] + [seam_kinds[on_seam]])
+    cosines = np.concatenate([block['stress_pairs'][2] for block in blocks] + [seam_cosines[on_seam]])
+    order = np.argsort(pair_indices, kind='stable')
+    stress_events = stress_events_from_pairs(table, pair_indices[order], kinds[order], cosines[order])
+    record_count('stress_events', len(stress_events))
+    min_radius, limiting_arc_details = find_limiting_arc(table)
+    return {'segments': table, 'stress_events': stress_events, 'min_radius': min_radius,
+            'limiting_arc_details': limiting_arc_details}
+
+
+# --- PARALLEL ANALYSIS ---
+# For very large programs the file is cut into one partition per worker, at a !Feature marker near each
+# cut where there is one, and the partitions are parsed and checked in a process pool (the same block
+# analysis as above). The machine state a partition starts from is rebuilt from the file itself: from
+# the last move before the cut that sets the position absolutely (a rapid PTP or an MSEG start) the
+# lines up to the cut are replayed, starting from the shutter state of the last shutter command before
+# that move. The partitions are then merged like cached blocks, so the result is identical to a serial run.
+PARALLEL_MIN_PARTITION_BYTES = 1024 * 1024
+_STATE_LINE_TOKENS = (b'PTP/', b'MSEG', b'Shutter', b'OUT0.0=')
+
+
+def _line_state_effect(line):
+    """
+    How a stripped program line changes the parser state, mirroring _parse_prg_stream. Returns
+    (sets_position, shutter): sets_position is True for moves that set the position whatever the state
+    before them; shutter is True/False for a shutter open/close command and None otherwise.
+    """
+    if not line or line[0] == "!":
+        return False, None
+    keyword = line[:4]
+    if keyword == "PTP/":
+        match_ptp_rapid = PTP_EV_PATTERN.match(line)
+        if match_ptp_rapid and "gDblRapidSpeed" in match_ptp_rapid.group(4):
+            return True, None
+    shutter = None
+    if "Start gIntSubBuffer,ShutterOpen" in line or line == "OUT0.0=1":
+        shutter = True
+    elif "Start gIntSubBuffer,ShutterClose" in line or line == "OUT0.0=0":
+        shutter = False
+    return keyword == "MSEG" and MSEG_COMMAND_PATTERN.match(line) is not None, shutter
+
+
+def _partition_entry(data, start):
+    """
+    Returns (anchor, is_printing) for a partition starting at byte offset `start` (a line start):
+    parsing data[anchor:start] from (is_printing, None, None) ends in the exact state at `start`.
+    """
+    anchor = None
+    end = start
+    while end > 0:
+        line_start = data.rfind(b'\n', 0, end - 1) + 1
+        raw_line = data[line_start:end]
+        if any(token in raw_line for token in _STATE_LINE_TOKENS):
+            sets_position, shutter = _line_state_effect(raw_line.decode(errors='replace').strip())
+            if anchor is None:
+                if sets_position:
+                    anchor = line_start
+            elif shutter is not None:
+                return anchor, shutter
+        end = line_start
+    return anchor or 0, False
+
+
+def partition_prg_bytes(data, partitions):
+    """
+    Splits a program's bytes into at most `partitions` (start, end) ranges of whole lines. Each cut is
+    moved to just after the first !Feature marker line in the following half partition, if there is one.
+    """
+    size = len(data)
+    bounds = [0]
+    for i in range(1, partitions):
+        target = max(size * i // partitions, bounds[-1])
+        marker = _FEATURE_MARKER_LINE.search(data, target, min(size, target + size // partitions // 2))
+        cut = data.find(b'\n', marker.start() if marker else target) + 1 or size
+        if bounds[-1] < cut < size:
+            bounds.append(cut)
+    bounds.append(size)
+    return [(start, end) for start, end in zip(bounds[:-1], bounds[1:]) if start < end]
+
+
+def _analyze_partition(chunk, replay_length, is_printing):
+    """Process pool worker: replays chunk[:replay_length] to find the entry state, then analyzes the rest."""
+    try:
+        _, _, entry_state = _parse_prg_stream(io.TextIOWrapper(io.BytesIO(chunk[:replay_length])), is_printing)
+    except UnicodeDecodeError as e:
+        raise Exception(f"Could not read the file. Error: {e}")
+    return _analyze_block(chunk[replay_length:], entry_state)
+
+
+def _read_prg_bytes(source):
+    """The raw bytes of a .prg path, open file object or bytes buffer."""
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        return bytes(source)
+    if hasattr(source, 'read'):
+        data = source.read()
+        return data.encode() if isinstance(data, str) else data
+    try:
+        with open(source, 'rb') as prg_file:
+            return prg_file.read()
+    except FileNotFoundError:
+        raise FileNotFoundError(f"File not found during parsing: {source}")
+
+
+@timed_stage('analysis.parallel')
+def analyze_geometry_parallel(source, workers=None):
+    """
+    Same result as analyze_geometry(parse_prg_file(source)), with the file parsed and checked in up to
+    `workers` processes (default: one per CPU). Partitions are at least PARALLEL_MIN_PARTITION_BYTES,
+    so small files run in this process.
+    """
+    data = _read_prg_bytes(source)
+    workers = workers or os.cpu_count() or 1
+    partitions = max(1, min(workers, len(data) // PARALLEL_MIN_PARTITION_BYTES))
+    if data.count(b'\r') != data.count(b'\r\n'):
+        partitions = 1  # bare CR line breaks: keep the text stream's line numbering
+    jobs, line_offsets, line_offset, previous = [], [], 0, 0
+    for start, end in partition_prg_bytes(data, partitions):
+        anchor, is_printing = _partition_entry(data, start)
+        jobs.append((data[anchor:end], start - anchor, is_printing))
+        line_offset += data.count(b'\n', previous, start)
+        line_offsets.append(line_offset)
+        previous = start
+    record_count('partitions', len(jobs))
+    if len(jobs) > 1:
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        # 'spawn' avoids forking a multi-threaded server process (e.g. Streamlit).
+        with ProcessPoolExecutor(max_workers=len(jobs), mp_context=multiprocessing.get_context('spawn')) as pool:
+            blocks = list(pool.map(_analyze_partition, *zip(*jobs)))
+    else:
+        blocks = [_analyze_partition(*job) for job in jobs]
+    geometry = _merge_blocks(blocks, line_offsets)
+    record_count('segments', len(geometry['segments']))
+    return geometry
+
+
+def parse_and_analyze_parallel(source, g_factor, min_trace_gap=None, workers=None):
+    """
+    Parallel equivalent of parse_prg_file followed by run_path_stress_analysis. Returns (segments,
+    (limiting_process_speed, stress_events, arc_info_events, limiting_arc_details)).
+    """
+    geometry = analyze_geometry_parallel(source, workers)
+    if not len(geometry['segments']):
+        return geometry['segments'], (None, [], [], {})
+    return geometry['segments'], _complete_analysis(geometry, g_factor, min_trace_gap)
+
+
+# --- TESSELLATION ---
+# Arcs are turned into vertices once per toolpath, for all segments at once: every arc gets just enough
+# chords to stay within a chord tolerance of the true curve. The result is one flat (V, 2) vertex buffer
+# and per-segment offsets (segment i is vertices[offsets[i]:offsets[i + 1]], from its start point to its
+# end point), cached on the table per tolerance. Plot bounds, animation, preview and the spatial checks
+# all read from it.
+DEFAULT_CHORD_TOLERANCE = 0.005  # mm between a chord and its arc
+# No chord is shorter than this (mm), which bounds the vertex count of an arc by its length. The
+# tolerance still holds for every radius from MIN_ARC_CHORD_LENGTH ** 2 / (8 * tolerance) up.
+MIN_ARC_CHORD_LENGTH = 0.01
+
+
+def tessellate_segments(table, tolerance=DEFAULT_CHORD_TOLERANCE):
+    """
+    Returns {'vertices', 'offsets', 'tolerance'} for a SegmentTable. PTP and LINE segments have their
+    two end points; an arc has chords + 1 points, the last one being its end point. Computed once per
+    table and tolerance.
+    """
+    cache = table.__dict__.setdefault('_tessellations', {})
+    if tolerance in cache:
+        return cache[tolerance]
+    radius = np.hypot(table.start_x - table.center_x, table.start_y - table.center_y)
+    on_arc = (table.type_code == TYPE_ARC2) & (radius >= 1e-9)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        step = 2 * np.arccos(np.clip(1 - tolerance / radius, -1.0, 1.0))
+        chords = np.ceil(np.abs(table.angle) / step)
+        max_chords = np.ceil(radius * np.abs(table.angle) / MIN_ARC_CHORD_LENGTH)
+    chords = np.where(on_arc & np.isfinite(chords), np.clip(chords, 1, np.maximum(max_chords, 1)), 1).astype(np.int64)
+    offsets = np.concatenate(([0], np.cumsum(chords + 1)))
+    seg = np.repeat(np.arange(len(table)), chords + 1)
+    k = np.arange(offsets[-1]) - offsets[seg]
+    vertices = np.empty((offsets[-1], 2))
+    at_start = k == 0
+    vertices[:, 0] = np.where(at_start, table.start_x[seg], table.end_x[seg])
+    vertices[:, 1] = np.where(at_start, table.start_y[seg], table.end_y[seg])
+    inner = np.flatnonzero(on_arc[seg] & ~at_start & (k < chords[seg]))
+    arc_seg = seg[inner]
+    theta = (np.arctan2(table.start_y - table.center_y, table.start_x - table.center_x)[arc_seg]
+             + table.angle[arc_seg] * k[inner] / chords[arc_seg])
+    vertices[inner, 0] = table.center_x[arc_seg] + radius[arc_seg] * np.cos(theta)
+    vertices[inner, 1] = table.center_y[arc_seg] + radius[arc_seg] * np.sin(theta)
+    cache[tolerance] = {'vertices': vertices, 'offsets': offsets, 'tolerance': tolerance}
+    return cache[tolerance]
+
+
+def join_tessellated_runs(table, tolerance=DEFAULT_CHORD_TOLERANCE):
+    """
+    Joins the tessellation into one polyline per run of consecutive segments with the same printing
+    state (inside a run, a segment's first vertex repeats the previous end point and is dropped).
+    Returns {'vertices' (V, 2), 'run_starts' (first vertex of every run, then V), 'run_is_printing',
+    'buffer_index' (the joined vertex at or just before every tessellation vertex)}.
+    """
+    tessellation = tessellate_segments(table, tolerance)
+    vertices, offsets = tessellation['vertices'], tessellation['offsets']
+    run_start = np.ones(len(table), dtype=bool)
+    run_start[1:] = table.is_printing[1:] != table.is_printing[:-1]
+    joined = np.ones(len(vertices), dtype=bool)
+    joined[offsets[:-1][~run_start]] = False
+    buffer_index = np.cumsum(joined) - 1
+    run_rows = np.flatnonzero(run_start)
+    return {'vertices': vertices[joined], 'run_starts': np.append(buffer_index[offsets[run_rows]], joined.sum()),
+            'run_is_printing': table.is_printing[run_rows], 'buffer_index': buffer_index}
+
+
+# --- SPATIAL ANALYSIS ---
+# The pairwise checks above only see consecutive segments. This stage looks for printed traces that
+# cross or run closer than a minimum gap anywhere in the file. Printing segments are tessellated into
+# short straight pieces and binned into a uniform grid, so only pieces sharing a grid cell are compared.
+SPATIAL_EVENT_TYPES = ('Path Intersection', 'Trace Spacing')
+# Two points of the same continuous trace closer than this many gaps along the path (the short way
+# round, on a closed loop) are neighbours, not separate traces, and are never compared for spacing.
+_SPACING_PATH_EXCLUSION = 2.0
+_MAX_CANDIDATE_PAIRS = 250_000  # candidate pairs are generated in batches of about this many
+
+
+def _tessellate_printing_pieces(table, tolerance, max_length):
+    """
+    Splits every printing segment into straight pieces: the chords of tessellate_segments(table,
+    tolerance), each cut into pieces no longer than `max_length`. Returns the piece end points
+    (x0, y0, x1, y1) and, per piece, its segment row, its continuous printing run and its path
+    position (s0, s1) along that run.
+    """
+    tessellation = tessellate_segments(table, tolerance)
+    vertices, offsets = tessellation['vertices'], tessellation['offsets']
+    # A chord runs from every vertex of a printing segment except its last one to the next vertex.
+    vertex_row = np.repeat(np.arange(len(table)), np.diff(offsets))
+    starts_chord = table.is_printing[vertex_row]
+    starts_chord[offsets[1:] - 1] = False
+    chord_start = np.flatnonzero(starts_chord)
+    chord_row = vertex_row[chord_start]
+    x0, y0 = vertices[chord_start, 0], vertices[chord_start, 1]
+    x1, y1 = vertices[chord_start + 1, 0], vertices[chord_start + 1, 1]
+
+    # Split long chords so that every piece only touches a few grid cells.
+    parts = np.maximum(np.ceil(np.hypot(x1 - x0, y1 - y0) / max_length), 1).astype(np.int64)
+    piece_chord = np.repeat(np.arange(len(chord_row)), parts)
+    j = np.arange(len(piece_chord)) - np.repeat(np.cumsum(parts) - parts, parts)
+    t0, t1 = j / parts[piece_chord], (j + 1) / parts[piece_chord]
+    dx, dy = (x1 - x0)[piece_chord], (y1 - y0)[piece_chord]
+    px0, py0 = x0[piece_chord] + dx * t0, y0[piece_chord] + dy * t0
+    px1, py1 = x0[piece_chord] + dx * t1, y0[piece_chord] + dy * t1
+    piece_row = chord_row[piece_chord]
+
+    # Continuous printing runs: a run ends wherever a non-printing segment comes in between.
+    run_id = np.cumsum(np.diff(piece_row, prepend=-2) > 1)
+    piece_length = np.hypot(px1 - px0, py1 - py0)
+    s1 = np.cumsum(piece_length)
+    s0 = s1 - piece_length
+    return px0, py0, px1, py1, piece_row, run_id, s0, s1
+
+
+def _loop_lengths(x0, y0, x1, y1, run_id, s0, s1, tolerance):
+    """
+    Per piece, the path length of its run if the run is a closed loop (it ends within `tolerance` of
+    where it starts), including the closing gap, and 0 for an open run.
+    """
+    first = np.flatnonzero(np.diff(run_id, prepend=-1))
+    last = np.append(first[1:], len(run_id)) - 1
+    closing = np.hypot(x1[last] - x0[first], y1[last] - y0[first])
+    length = np.where(closing <= tolerance, s1[last] - s0[first] + closing, 0.0)
+    return np.repeat(length, last - first + 1)
+
+
+def _candidate_piece_pairs(x0, y0, x1, y1, cell_size, reach):
+    """
+    Yields batches of (a, b) piece index pairs, a < b, whose bounding boxes grown by reach / 2 overlap.
+    Each piece is entered into every grid cell its grown box touches. A pair is only emitted by the
+    cell holding the lower-left corner of the overlap of the two boxes, so every pair appears once.
+    """
+    half = reach / 2.0
+    min_x, max_x = np.minimum(x0, x1) - half, np.maximum(x0, x1) + half
+    min_y, max_y = np.minimum(y0, y1) - half, np.maximum(y0, y1) + half
+    origin_x, origin_y = min_x.min(), min_y.min()
+    cx0 = ((min_x - origin_x) // cell_size).astype(np.int64)
+    cx1 = ((max_x - origin_x) // cell_size).astype(np.int64)
+    cy0 = ((min_y - origin_y) // cell_size).astype(np.int64)
+    cy1 = ((max_y - origin_y) // cell_size).astype(np.int64)
+    width, height = cx1 - cx0 + 1, cy1 - cy0 + 1
+    cells_per_piece = width * height
+    piece = np.repeat(np.arange(len(x0)), cells_per_piece)
+    offset = np.arange(len(piece)) - np.repeat(np.cumsum(cells_per_piece) - cells_per_piece, cells_per_piece)
+    cell_x = cx0[piece] + offset % width[piece]
+    cell_y = cy0[piece] + offset // width[piece]
+    columns = int(cx1.max()) + 1
+    cell = cell_y * columns + cell_x
+    order = np.lexsort((piece, cell))
+    cell, piece = cell[order], piece[order]
+
+    group_start = np.flatnonzero(np.diff(cell, prepend=-1))
+    group_size = np.diff(np.append(group_start, len(cell)))
+    rank = np.arange(len(cell)) - np.repeat(group_start, group_size)
+    partners = np.repeat(group_size, group_size) - 1 - rank  # later entries in the same cell
+    bounds = np.searchsorted(np.cumsum(partners), np.arange(0, partners.sum(), _MAX_CANDIDATE_PAIRS), side='right')
+    for lo, hi in zip(bounds, np.append(bounds[1:], len(cell))):
+        count = partners[lo:hi]
+        first = np.repeat(np.arange(lo, hi), count)
+        second = first + 1 + (np.arange(len(first)) - np.repeat(np.cumsum(count) - count, count))
+        a, b = piece[first], piece[second]
+        overlap_x = ((np.maximum(min_x[a], min_x[b]) - origin_x) // cell_size).astype(np.int64)
+        overlap_y = ((np.maximum(min_y[a], min_y[b]) - origin_y) // cell_size).astype(np.int64)
+        owner = (overlap_y * columns + overlap_x) == cell[first]
+        yield a[owner], b[owner]
+
+
+def _point_segment_distance(px, py, x0, y0, x1, y1):
+    """Distance from points to segments, and the parameter t of the closest point on each segment."""
+    dx, dy = x1 - x0, y1 - y0
+    length_sq = dx * dx + dy * dy
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t = np.where(length_sq > 0, ((px - x0) * dx + (py - y0) * dy) / length_sq, 0.0)
+    t = np.clip(t, 0.0, 1.0)
+    return np.hypot(px - (x0 + t * dx), py - (y0 + t * dy)), t
+
+
+def _closest_piece_geometry(ax0, ay0, ax1, ay1, bx0, by0, bx1, by1):
+    """
+    For pairs of pieces a and b, returns (crossing, distance, x, y): whether they cross or touch, the
+    shortest distance between them, and the crossing point (or the point of b closest to a).
+    """
+    cross_a0 = (bx1 - bx0) * (ay0 - by0) - (by1 - by0) * (ax0 - bx0)
+    cross_a1 = (bx1 - bx0) * (ay1 - by0) - (by1 - by0) * (ax1 - bx0)
+    cross_b0 = (ax1 - ax0) * (by0 - ay0) - (ay1 - ay0) * (bx0 - ax0)
+    cross_b1 = (ax1 - ax0) * (by1 - ay0) - (ay1 - ay0) * (bx1 - ax0)
+    # Touching counts as crossing; collinear pieces (all four products zero) are left to the distance test.
+    collinear = (cross_a0 == 0) & (cross_a1 == 0)
+    crossing = (cross_a0 * cross_a1 <= 0) & (cross_b0 * cross_b1 <= 0) & ~collinear
+
+    d_a0, t_a0 = _point_segment_distance(ax0, ay0, bx0, by0, bx1, by1)
+    d_a1, t_a1 = _point_segment_distance(ax1, ay1, bx0, by0, bx1, by1)
+    d_b0, _ = _point_segment_distance(bx0, by0, ax0, ay0, ax1, ay1)
+    d_b1, _ = _point_segment_distance(bx1, by1, ax0, ay0, ax1, ay1)
+    candidates = np.stack((d_a0, d_a1, d_b0, d_b1))
+    nearest = candidates.argmin(axis=0)
+    distance = np.where(crossing, 0.0, candidates.min(axis=0))
+    # Closest point on b: the projection of a's end point, or b's own end point.
+    t_b = np.select([nearest == 0, nearest == 1, nearest == 2], [t_a0, t_a1, 0.0], 1.0)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        t_cross = cross_b0 / (cross_b0 - cross_b1)
+    t_b = np.where(crossing, t_cross, t_b)
+    return crossing, distance, bx0 + t_b * (bx1 - bx0), by0 + t_b * (by1 - by0)
+
+
+@timed_stage('analysis.spatial')
+def find_spatial_events(parsed_segments, min_trace_gap=DEFAULT_MIN_TRACE_GAP):
+    """
+    Finds printed traces that cross each other ('Path Intersection') or whose centerlines come closer
+    than min_trace_gap mm ('Trace Spacing'), anywhere in the file. Each printing segment gets at most one
+    event of each type, for the other, earlier segment it crosses first or comes closest to. Returns stress
+    events in segment order, with the same keys as the pairwise stress events.
+    """
+    table = SegmentTable.from_segments(parsed_segments)
+    if not table.is_printing.any():
+        return []
+    min_trace_gap = max(float(min_trace_gap), 0.0)
+    printing_length = compute_segment_lengths(table)[table.is_printing]
+    # Cells of about one mean segment length keep both the piece count and the pieces per cell small.
+    cell_size = max(min_trace_gap, printing_length.mean(), 1e-6)
+    # The shared tessellation is used unless the gap calls for a finer one.
+    tolerance = min(DEFAULT_CHORD_TOLERANCE, min_trace_gap / 4.0) if min_trace_gap > 0 else DEFAULT_CHORD_TOLERANCE
+    x0, y0, x1, y1, row, run_id, s0, s1 = _tessellate_printing_pieces(table, tolerance, cell_size)
+    loop_length = _loop_lengths(x0, y0, x1, y1, run_id, s0, s1, tolerance)
+
+    # Best pair so far for every segment and event type: the earliest segment it crosses, and the
+    # closest segment it comes near. Reduced batch by batch, so memory stays O(segments).
+    best = {event_type: {'distance': np.full(len(table), np.inf), 'other': np.full(len(table), -1),
+                         'pair': np.full(len(table), -1), 'x': np.zeros(len(table)), 'y': np.zeros(len(table))}
+            for event_type in SPATIAL_EVENT_TYPES}
+    for a, b in _candidate_piece_pairs(x0, y0, x1, y1, cell_size, min_trace_gap):
+        same_run = run_id[a] == run_id[b]
+        path_gap = s0[b] - s1[a]  # a < b, so a comes first along the path
+        # On a closed loop, the other way round (past the start of the run) can be shorter.
+        closed = same_run & (loop_length[a] > 0)
+        path_gap = np.where(closed, np.minimum(path_gap, loop_length[a] - (s1[b] - s0[a])), path_gap)
+        crossing, distance, x, y = _closest_piece_geometry(x0[a], y0[a], x1[a], y1[a], x0[b], y0[b], x1[b], y1[b])
+        other_segment = row[a] != row[b]
+        pair = b * len(x0) + a  # breaks ties between equally close pairs, earliest along the path first
+        crossing &= other_segment & ~(same_run & (path_gap <= 1e-9))
+        too_close = other_segment & ~crossing & (distance < min_trace_gap) & ~(
+                same_run & (path_gap < _SPACING_PATH_EXCLUSION * min_trace_gap))
+        for event_type, selected in zip(SPATIAL_EVENT_TYPES, (crossing, too_close)):
+            _keep_closest(best[event_type], row[b[selected]], row[a[selected]], pair[selected], distance[selected],
+                          x[selected], y[selected])
+
+    events = []
+    for event_type in SPATIAL_EVENT_TYPES:
+        found = best[event_type]
+        for this_row in np.flatnonzero(found['other'] >= 0).tolist():
+            other_row = found['other'][this_row]
+            other = f"the trace at line {table.line_num[other_row]} (Feature {table.feature_num[other_row]})"
+            if event_type == 'Path Intersection':
+                message = f"Printed path crosses {other}."
+            else:
+                message = (f"Trace passes {found['distance'][this_row]:.3f} mm from {other}; "
+                           f"minimum gap is {min_trace_gap:g} mm.")
+            events.append((this_row, {'type': event_type, 'line_num': int(table.line_num[this_row]),
+                                      'feature_num': int(table.feature_num[this_row]),
+                                      'coords': (float(found['x'][this_row]), float(found['y'][this_row])),
+                                      'message': message, 'category': EVENT_CATEGORY_STRESS}))
+    events.sort(key=lambda item: item[0])
+    record_count('spatial_events', len(events))
+    return [event for _, event in events]
+
+
+def _keep_closest(best, this_row, other_row, pair, distance, x, y):
+    """
+    Updates the per-segment best (lowest distance, then earliest other segment, then lowest pair key)
+    with a batch of pairs, so the result does not depend on the order of the batches.
+    """
+    order = np.lexsort((pair, other_row, distance, this_row))
+    first = order[np.flatnonzero(np.diff(this_row[order], prepend=-1))]
+    this_row, other_row, pair, distance = this_row[first], other_row[first], pair[first], distance[first]
+    current_distance, current_other = best['distance'][this_row], best['other'][this_row]
+    better = (current_other < 0) | (distance < current_distance) | (distance == current_distance) & (
+            (other_row < current_other) | (other_row == current_other) & (pair < best['pair'][this_row]))
+    this_row = this_row[better]
+    best['distance'][this_row] = distance[better]
+    best['other'][this_row] = other_row[better]
+    best['pair'][this_row] = pair[better]
+    best['x'][this_row] = x[first][better]
+    best['y'][this_row] = y[first][better]
+
+
+# --- G-FACTOR SWEEP ---
+@timed_stage('g_sweep')
+def sweep_g_factors(parsed_segments, g_factors):
+    """
+    Evaluates many G-factors at once. The printing arc radii are extracted once; limiting speeds and
+    per-arc acceleration status are then computed for all G-factors as one broadcast step.
+    Returns a dict of arrays:
+      'g_factor', 'accel_limit', 'limiting_speed' (NaN without arcs)    -- shape (G,)
+      'arc_line_num', 'arc_feature_num', 'arc_radius'                   -- shape (A,), arcs with r > 1e-6
+      'arc_at_limit' (A arcs at each G-factor), 'arcs_at_limit' (count)  -- shape (G, A) and (G,)
+      'feature_num', 'feature_min_radius'                                -- shape (F,), features with arcs
+      'feature_limiting_speed'                                          -- shape (F, G)
+    The limiting speed at every G-factor matches run_path_stress_analysis, and 'arc_at_limit' matches the
+    "At Limit" status of its arc acceleration info.
+    """
+    table = SegmentTable.from_segments(parsed_segments)
+    g_factors = np.asarray(g_factors, dtype=np.float64).ravel()
+    accel_limit = g_factors * G_ACCELERATION
+    rows, radii = printing_arc_radii(table)
+    positive = radii > 0
+    min_radius = radii[positive].min() if positive.any() else np.nan
+    limiting_speed = np.sqrt(accel_limit * min_radius)
+
+    info = radii > 1e-6
+    arc_radius = radii[info]
+    with np.errstate(invalid='ignore'):
+        accel_at_limit_speed = (limiting_speed[:, None] ** 2) / arc_radius[None, :]
+        arc_at_limit = np.abs(accel_at_limit_speed - accel_limit[:, None]) < 1.0
+
+    arc_features = table.feature_num[rows[positive]]
+    feature_num, feature_index = np.unique(arc_features, return_inverse=True)
+    feature_min_radius = np.full(len(feature_num), np.inf)
+    np.minimum.at(feature_min_radius, feature_index, radii[positive])
+    return {
+        'g_factor': g_factors, 'accel_limit': accel_limit, 'limiting_speed': limiting_speed,
+        'arc_line_num': table.line_num[rows[info]], 'arc_feature_num': table.feature_num[rows[info]],
+        'arc_radius': arc_radius, 'arc_at_limit': arc_at_limit, 'arcs_at_limit': arc_at_limit.sum(axis=1),
+        'feature_num': feature_num, 'feature_min_radius': feature_min_radius,
+        'feature_limiting_speed': np.sqrt(np.outer(feature_min_radius, accel_limit)),
+    }
+
+
+# --- VELOCITY PLANNER ---
+# The limiting speed above is a single worst-case number. The planner instead estimates how fast each
+# segment can actually be run: every segment has a cruise cap (the target speed, or sqrt(a*r) on tighter
+# arcs), the speed is capped at the junctions the stress checks flag, and forward/backward passes limit
+# the speed changes to the acceleration limit. Segments then follow trapezoidal speed profiles.
+DEFAULT_RAPID_SPEED = 50.0  # mm/s, used for PTP moves and non-printing lines
+DEFAULT_JUNCTION_DEVIATION = 0.01  # mm, how far a flagged corner may be rounded off at speed
+
+
+def compute_segment_lengths(table):
+    """Path length of every segment: the chord for PTP/LINE rows, radius * |angle| for ARC2 rows."""
+    chord = np.hypot(table.end_x - table.start_x, table.end_y - table.start_y)
+    radius = np.hypot(table.start_x - table.center_x, table.start_y - table.center_y)
+    return np.where(table.type_code == TYPE_ARC2, radius * np.abs(table.angle), chord)
+
+
+def junction_speed_limits(table, accel_limit, junction_deviation=DEFAULT_JUNCTION_DEVIATION):
+    """
+    Returns the speed cap at every junction between segments i and i + 1 (inf where there is none).
+    Junctions flagged by the stress checks, and junctions next to a rapid move (which the checks skip),
+    are capped with the junction-deviation model v^2 = a * d * s / (1 - s), where s = cos(turn / 2).
+    """
+    limits = np.full(max(len(table) - 1, 0), np.inf)
+    if len(table) < 2:
+        return limits
+    start_dx, start_dy, end_dx, end_dy = compute_segment_directions(table)
+    a_x, a_y, b_x, b_y = end_dx[:-1], end_dy[:-1], start_dx[1:], start_dy[1:]
+    mag = np.hypot(a_x, a_y) * np.hypot(b_x, b_y)
+    capped = np.zeros(len(limits), dtype=bool)
+    capped[find_stress_pairs(table)[0]] = True
+    capped |= ~(table.is_printing[:-1] & table.is_printing[1:])
+    capped &= mag > 1e-12  # no direction to compare (zero-length segment)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        turn_cosine = np.clip((a_x * b_x + a_y * b_y) / mag, -1.0, 1.0)
+        half_cosine = np.sqrt(0.5 * (1.0 + turn_cosine))
+        deviation_speed = np.sqrt(accel_limit * junction_deviation * half_cosine / (1.0 - half_cosine))
+    limits[capped] = deviation_speed[capped]
+    return limits
+
+
+def _limit_by_acceleration(boundary_caps_sq, reach_sq):
+    """
+    One planner pass: the largest squared speeds w with w[k] <= boundary_caps_sq[k] and
+    w[k] <= w[k - 1] + reach_sq[k - 1]. As a min-plus scan: w = S + running_min(caps - S), S = cumsum(reach).
+    """
+    distance_sq = np.concatenate(([0.0], np.cumsum(reach_sq)))
+    return distance_sq + np.minimum.accumulate(boundary_caps_sq - distance_sq)
+
+
+@timed_stage('velocity_plan')
+def plan_velocity_profile(parsed_segments, g_factor, process_speed, rapid_speed=DEFAULT_RAPID_SPEED,
+                          junction_deviation=DEFAULT_JUNCTION_DEVIATION):
+    """
+    Plans the speed over the whole toolpath for one G-factor. The job starts and ends at rest.
+    Returns a dict:
+      'g_factor', 'accel_limit', 'total_time', 'printing_time', 'rapid_time', 'total_length'  -- scalars
+      'length', 'cruise_speed', 'entry_speed', 'peak_speed', 'exit_speed', 'time'          -- shape (N,)
+      'feature_num', 'feature_length', 'feature_time'                                       -- shape (F,)
+    Speeds are in mm/s, lengths in mm and times in s.
+    """
+    table = SegmentTable.from_segments(parsed_segments)
+    accel_limit = g_factor * G_ACCELERATION
+    length = compute_segment_lengths(table)
+    radius = np.hypot(table.start_x - table.center_x, table.start_y - table.center_y)
+    printing_arcs = table.is_printing & (table.type_code == TYPE_ARC2) & (radius > 0)
+    cruise_speed = np.where(table.is_printing, float(process_speed), float(rapid_speed))
+    cruise_speed[printing_arcs] = np.minimum(cruise_speed[printing_arcs], np.sqrt(accel_limit * radius[printing_arcs]))
+    cruise_sq = cruise_speed ** 2
+
+    # Boundary k lies between segment k - 1 and segment k; the first and last boundaries are at rest.
+    boundary_sq = np.zeros(len(table) + 1)
+    boundary_sq[1:-1] = np.minimum(np.minimum(cruise_sq[:-1], cruise_sq[1:]),
+                                   junction_speed_limits(table, accel_limit, junction_deviation) ** 2)
+    reach_sq = 2.0 * accel_limit * length
+    forward_sq = _limit_by_acceleration(boundary_sq, reach_sq)
+    backward_sq = _limit_by_acceleration(boundary_sq[::-1], reach_sq[::-1])[::-1]
+    boundary_sq = np.clip(np.minimum(forward_sq, backward_sq), 0.0, None)
+
+    entry_sq, exit_sq = boundary_sq[:-1], boundary_sq[1:]
+    peak_sq = np.maximum(np.minimum(cruise_sq, 0.5 * (entry_sq + exit_sq) + accel_limit * length),
+                         np.maximum(entry_sq, exit_sq))
+    entry_speed, exit_speed, peak_speed = np.sqrt(entry_sq), np.sqrt(exit_sq), np.sqrt(peak_sq)
+    ramp_length = (2.0 * peak_sq - entry_sq - exit_sq) / (2.0 * accel_limit)
+    cruise_length = np.clip(length - ramp_length, 0.0, None)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        time = np.where(peak_speed > 0, (2.0 * peak_speed - entry_speed - exit_speed) / accel_limit +
+                        cruise_length / peak_speed, 0.0)
+
+    feature_num, feature_index = np.unique(table.feature_num, return_inverse=True)
+    return {
+        'g_factor': g_factor, 'accel_limit': accel_limit, 'total_time': float(time.sum()),
+        'printing_time': float(time[table.is_printing].sum()), 'rapid_time': float(time[~table.is_printing].sum()),
+        'total_length': float(length.sum()),
+        'length': length, 'cruise_speed': cruise_speed, 'entry_speed': entry_speed, 'peak_speed': peak_speed,
+        'exit_speed': exit_speed, 'time': time,
+        'feature_num': feature_num,
+        'feature_length': np.bincount(feature_index, weights=length, minlength=len(feature_num)),
+        'feature_time': np.bincount(feature_index, weights=time, minlength=len(feature_num)),
+    }
+
+
+def speed_profile(plan, max_points=None):
+    """
+    Returns (distance, speed) arrays tracing the planned speed along the path (4 points per segment:
+    entry, end of acceleration, start of deceleration, exit). With max_points the profile is reduced to
+    at most that many distance bins, keeping the lowest speed in each so slowdowns stay visible.
+    """
+    length, entry, peak, exit_speed = plan['length'], plan['entry_speed'], plan['peak_speed'], plan['exit_speed']
+    accel_limit = plan['accel_limit']
+    if not len(length):
+        return np.zeros(0), np.zeros(0)
+    start = np.concatenate(([0.0], np.cumsum(length)[:-1]))
+    accel_end = np.minimum(start + (peak ** 2 - entry ** 2) / (2.0 * accel_limit), start + length)
+    decel_start = np.maximum(start + length - (peak ** 2 - exit_speed ** 2) / (2.0 * accel_limit), accel_end)
+    distance = np.column_stack((start, accel_end, decel_start, start + length)).ravel()
+    speed = np.column_stack((entry, peak, peak, exit_speed)).ravel()
+    if max_points is None or len(distance) <= max_points or not len(distance) or distance[-1] <= 0:
+        return distance, speed
+    bins = np.minimum((distance / distance[-1] * max_points).astype(np.int64), max_points - 1)
+    bin_starts = np.flatnonzero(np.diff(bins, prepend=-1))
+    return distance[bin_starts], np.minimum.reduceat(speed, bin_starts)
+
+
+# --- LEVEL OF DETAIL ---
+# For zoomable viewing, the joined path (see join_tessellated_runs) is decimated into a pyramid. Level 0
+# is the full path; level k >= 1 merges consecutive vertices that fall in the same grid cell of size
+# LOD_FINEST_CELL * 2**(k - 1), so it stays within cell_size * sqrt(2) of the full path, and keeps one
+# edge per pair of cells it connects. Each level also keeps one stress event per cell and type, and the
+# chords those events lie on are never merged, so the drawn path still passes through every marker.
+# The edges of each level are bucketed into square tiles of LOD_TILE_CELLS cells, so a window only
+# looks at the tiles it overlaps. Levels are added until the whole path fits in LOD_VIEW_PIXELS cells
+# across and LOD_MAX_LINES edges, so even the densest program has a level cheap enough to draw whole.
+LOD_FINEST_CELL = 2 * DEFAULT_CHORD_TOLERANCE
+LOD_TILE_CELLS = 256
+LOD_VIEW_PIXELS = 512  # a window is drawn at the coarsest level with cells no larger than 1/LOD_VIEW_PIXELS of its width
+LOD_MAX_LINES = 200000  # ...or at a coarser one, if that level has more edges than this in the window
+
+
+def _event_chords(table, joined, tolerance, stress_events):
+    """
+    Joined vertex indices (start, end) of the tessellation chord nearest to every stress event, among
+    the chords of the event's segment.
+    """
+    if not len(stress_events) or not len(table):
+        return np.zeros(0, dtype=np.int64), np.zeros(0, dtype=np.int64)
+    tessellation = tessellate_segments(table, tolerance)
+    vertices, offsets = tessellation['vertices'], tessellation['offsets']
+    event_lines = np.array([event['line_num'] for event in stress_events], dtype=np.int64)
+    event_xy = np.array([event['coords'] for event in stress_events], dtype=np.float64)
+    rows = np.clip(np.searchsorted(table.line_num, event_lines), 0, len(table) - 1)
+    counts = offsets[rows + 1] - offsets[rows] - 1  # chords of every event's segment
+    event = np.repeat(np.arange(len(rows)), counts)
+    chord = offsets[rows][event] + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    start, direction = vertices[chord], vertices[chord + 1] - vertices[chord]
+    offset = event_xy[event] - start
+    along = np.clip(np.einsum('ij,ij->i', offset, direction)
+                    / np.maximum(np.einsum('ij,ij->i', direction, direction), 1e-18), 0.0, 1.0)
+    distance = np.hypot(*(offset - along[:, None] * direction).T)
+    nearest = chord[np.lexsort((distance, event))[np.cumsum(counts) - counts]]
+    return joined['buffer_index'][nearest], joined['buffer_index'][nearest + 1]
+
+
+def _first_per_key(*keys):
+    """Indices of the first row of every distinct combination of the key arrays, in ascending order."""
+    if not len(keys[0]):
+        return np.zeros(0, dtype=np.int64)
+    order = np.lexsort(keys[::-1])
+    first = np.ones(len(order), dtype=bool)
+    for key in keys:
+        sorted_key = key[order]
+        first[1:] &= sorted_key[1:] == sorted_key[:-1]
+    first[1:] = ~first[1:]
+    return np.sort(order[first])
+
+
+def _tile_edges(x, y, start, end, origin, tile_size):
+    """Sorts edges (start -> end vertex indices) by tile. Edges longer than a tile are kept apart."""
+    min_x, max_x = np.minimum(x[start], x[end]), np.maximum(x[start], x[end])
+    min_y, max_y = np.minimum(y[start], y[end]), np.maximum(y[start], y[end])
+    long_edge = (max_x - min_x > tile_size) | (max_y - min_y > tile_size)
+    tile_x = ((min_x - origin[0]) // tile_size).astype(np.int64)
+    tile_y = ((min_y - origin[1]) // tile_size).astype(np.int64)
+    tile_key = np.where(long_edge, -1, tile_x * (1 << 31) + tile_y)
+    order = np.argsort(tile_key, kind='stable')
+    keys, first = np.unique(tile_key[order], return_index=True)
+    return {'start': start[order], 'end': end[order], 'tile_keys': keys,
+            'tile_bounds': np.append(first, len(order)), 'tile_size': tile_size}
+
+
+@timed_stage('lod')
+def build_lod_pyramid(parsed_segments, stress_events=(), tolerance=DEFAULT_CHORD_TOLERANCE):
+    """
+    Builds the level-of-detail pyramid of a toolpath for lod_window(). Returns a dict with the joined
+    path ('x', 'y', 'vertex_run', 'run_is_printing'), 'bounds' (x_min, x_max, y_min, y_max), the stress
+    event positions and types ('event_x', 'event_y', 'event_type') and 'levels', a dict of level number
+    -> {'cell_size', 'vertex_count', 'events' (indices of the events shown), edges sorted by tile}.
+    """
+    table = SegmentTable.from_segments(parsed_segments)
+    joined = join_tessellated_runs(table, tolerance)
+    vertices, run_starts = joined['vertices'], joined['run_starts']
+    x, y = np.ascontiguousarray(vertices[:, 0]), np.ascontiguousarray(vertices[:, 1])
+    vertex_run = np.repeat(np.arange(len(run_starts) - 1), np.diff(run_starts))
+    edge_printing = joined['run_is_printing'][vertex_run]
+    bounds = (x.min(), x.max(), y.min(), y.max()) if len(x) else (0.0, 1.0, 0.0, 1.0)
+    origin = (bounds[0], bounds[2])
+    extent = max(bounds[1] - bounds[0], bounds[3] - bounds[2], 1e-6)
+
+    event_x = np.array([event['coords'][0] for event in stress_events], dtype=np.float64)
+    event_y = np.array([event['coords'][1] for event in stress_events], dtype=np.float64)
+    event_type = np.array([event['type'] for event in stress_events], dtype=object)
+    type_codes = {name: code for code, name in enumerate(dict.fromkeys(event_type))}
+    event_code = np.array([type_codes[name] for name in event_type], dtype=np.int64)
+    chord_start, chord_end = _event_chords(table, joined, tolerance, stress_events)
+    run_ends = np.zeros(len(x), dtype=bool)
+    run_ends[run_starts[:-1]] = True
+    run_ends[run_starts[1:] - 1] = True
+
+    levels = {}
+    level = 0
+    while True:
+        if level:
+            cell_size = LOD_FINEST_CELL * 2 ** (level - 1)
+            events = _first_per_key(((event_x - origin[0]) // cell_size).astype(np.int64),
+                                    ((event_y - origin[1]) // cell_size).astype(np.int64), event_code)
+            pinned = run_ends.copy()
+            pinned[chord_start[events]] = True
+            pinned[chord_end[events]] = True
+            cell_x = ((x - origin[0]) // cell_size).astype(np.int64)
+            cell_y = ((y - origin[1]) // cell_size).astype(np.int64)
+            keep = pinned.copy()
+            keep[1:] |= (cell_x[1:] != cell_x[:-1]) | (cell_y[1:] != cell_y[:-1])
+            kept = np.flatnonzero(keep)
+        else:
+            cell_size = 0.0
+            events = np.arange(len(event_x))
+            kept = np.arange(len(x))
+        start, end = kept[:-1], kept[1:]
+        same_run = vertex_run[start] == vertex_run[end]
+        start, end = start[same_run], end[same_run]
+        if level:
+            # One edge per pair of cells (and printing state), except the chords of the events shown
+            cell_id = cell_x * (1 << 31) + cell_y
+            cell_lo = np.minimum(cell_id[start], cell_id[end]) * 2 + edge_printing[start]
+            cell_hi = np.maximum(cell_id[start], cell_id[end])
+            distinct = np.zeros(len(start), dtype=bool)
+            distinct[_first_per_key(cell_lo, cell_hi)] = True
+            distinct |= pinned[start] & pinned[end]
+            start, end = start[distinct], end[distinct]
+        tile_size = LOD_TILE_CELLS * (cell_size or LOD_FINEST_CELL / 2)
+        levels[level] = {'cell_size': cell_size, 'vertex_count': len(kept), 'events': events,
+                         **_tile_edges(x, y, start, end, origin, tile_size)}
+        if cell_size * LOD_VIEW_PIXELS >= extent and len(start) <= LOD_MAX_LINES or cell_size >= extent:
+            break
+        level += 1
+    record_count('lod_levels', len(levels))
+    return {'x': x, 'y': y, 'vertex_run': vertex_run, 'run_is_printing': joined['run_is_printing'],
+            'bounds': bounds, 'levels': levels, 'event_x': event_x, 'event_y': event_y, 'event_type': event_type}
+
+
+def _window_edges(lod, level, x_min, x_max, y_min, y_max):
+    """Start and end vertex indices of the edges of one level that touch the window."""
+    data = lod['levels'][level]
+    origin_x, origin_y = lod['bounds'][0], lod['bounds'][2]
+    tile_size = data['tile_size']
+    # An edge is filed under the tile of its lower-left corner, so the tiles just left of and below the
+    # window can hold edges reaching into it. No tile lies below or left of the path's bounds.
+    tiles_x = np.arange(max(0, math.floor((x_min - origin_x) / tile_size) - 1),
+                        max(0, math.floor((x_max - origin_x) / tile_size) + 1))
+    tiles_y = np.arange(max(0, math.floor((y_min - origin_y) / tile_size) - 1),
+                        max(0, math.floor((y_max - origin_y) / tile_size) + 1))
+    keys = np.append((tiles_x[:, None] * (1 << 31) + tiles_y[None, :]).ravel(), -1)  # -1: the long edges
+    tile_keys = data['tile_keys']
+    found = np.minimum(np.searchsorted(tile_keys, keys), max(len(tile_keys) - 1, 0))
+    found = found[tile_keys[found] == keys] if len(tile_keys) else found[:0]
+    starts, stops = data['tile_bounds'][found], data['tile_bounds'][found + 1]
+    counts = stops - starts
+    edges = np.repeat(starts, counts) + np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    start, end = data['start'][edges], data['end'][edges]
+    x, y = lod['x'], lod['y']
+    visible = ((np.maximum(x[start], x[end]) >= x_min) & (np.minimum(x[start], x[end]) <= x_max)
+               & (np.maximum(y[start], y[end]) >= y_min) & (np.minimum(y[start], y[end]) <= y_max))
+    return start[visible], end[visible]
+
+
+def lod_window(lod, x_min, x_max, y_min, y_max, pixels=LOD_VIEW_PIXELS, max_lines=LOD_MAX_LINES):
+    """
+    Returns what is visible in a window at the coarsest level whose cells are at most one pixel of
+    `pixels` across the window's width, or at the first coarser level with at most `max_lines` edges in
+    the window: {'level', 'cell_size', 'lines' (N, 2, 2), 'is_printing' (N,), 'events' (indices of the
+    level's stress events inside the window)}.
+    """
+    pixel_size = (x_max - x_min) / pixels
+    level = max([k for k, data in lod['levels'].items() if data['cell_size'] <= pixel_size], default=0)
+    start, end = _window_edges(lod, level, x_min, x_max, y_min, y_max)
+    while len(start) > max_lines and level + 1 in lod['levels']:
+        level += 1
+        start, end = _window_edges(lod, level, x_min, x_max, y_min, y_max)
+    data = lod['levels'][level]
+    x, y = lod['x'], lod['y']
+    lines = np.stack((np.column_stack((x[start], y[start])), np.column_stack((x[end], y[end]))), axis=1)
+    events = data['events']
+    events = events[(lod['event_x'][events] >= x_min) & (lod['event_x'][events] <= x_max)
+                    & (lod['event_y'][events] >= y_min) & (lod['event_y'][events] <= y_max)]
+    return {'level': level, 'cell_size': data['cell_size'], 'lines': lines,
+            'is_printing': lod['run_is_printing'][lod['vertex_run'][start]], 'events': events}
+
+
+# --- RESULT CACHE ---
+DEFAULT_CACHE_BYTES = 512 * 1024 * 1024
+_EVENT_NBYTES = 400  # rough size of one event dict with its strings and tuple
+
+
+def file_digest(data):
+    """SHA-256 hex digest of a .prg file's contents, used as its cache key."""
+    return hashlib.sha256(data).hexdigest()
+
+
+def estimate_nbytes(value):
+    """Rough in-memory size of a cached value, used for the cache's byte budget."""
+    if isinstance(value, SegmentTable):
+        return value.nbytes
+    if isinstance(value, (bytes, bytearray, str)):
+        return len(value)
+    if isinstance(value, np.ndarray):
+        return value.nbytes
+    if isinstance(value, dict):
+        return 64 + sum(estimate_nbytes(v) for v in value.values())
+    if isinstance(value, (list, tuple)):
+        if value and isinstance(value[0], dict):
+            return 64 + _EVENT_NBYTES * len(value)
+        return 64 + sum(estimate_nbytes(v) for v in value)
+    return 64
+
+
+class ResultCache:
+    """
+    Bounded, thread-safe LRU cache of analysis results keyed by the SHA-256 of the file contents.
+    Geometry results (segments, stress events, tightest arc) are stored once per file; the limiting
+    speed and arc acceleration info are stored per (file, G-factor), so changing the G-factor never
+    re-parses or re-analyzes the file. Entries are evicted least recently used first once the
+    estimated size exceeds max_bytes. Other derived outputs can be cached with get_or_compute().
+    A cached SegmentTable grows when it is tessellated, so an entry's size is estimated again whenever
+    it is read.
+    """
+
+    def __init__(self, max_bytes=DEFAULT_CACHE_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._entries = OrderedDict()  # key -> (value, nbytes)
+        self._lock = threading.Lock()
+
+    def __len__(self):
+        return len(self._entries)
+
+    def __contains__(self, key):
+        return key in self._entries
+
+    def get_or_compute(self, key, compute):
+        """Returns the cached value for key, calling compute() (outside the lock) on a miss."""
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                value, nbytes = self._entries[key]
+                current_nbytes = estimate_nbytes(value)
+                if current_nbytes != nbytes:
+                    self._entries[key] = (value, current_nbytes)
+                    self.current_bytes += current_nbytes - nbytes
+                    self._evict()
+                return value
+        value = compute()
+        self.put(key, value)
+        return value
+
+    def put(self, key, value):
+        nbytes = estimate_nbytes(value)
+        with self._lock:
+            if key in self._entries:
+                self.current_bytes -= self._entries.pop(key)[1]
+            if nbytes > self.max_bytes:
+                return
+            self._entries[key] = (value, nbytes)
+            self.current_bytes += nbytes
+            self._evict()
+
+    def _evict(self):
+        """Drops the least recently used entries until the cache fits max_bytes. Call with the lock held."""
+        while self.current_bytes > self.max_bytes and self._entries:
+            _, (_, evicted_nbytes) = self._entries.popitem(last=False)
+            self.current_bytes -= evicted_nbytes
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.current_bytes = 0
+
+    def geometry(self, data, digest=None):
+        """
+        Returns the geometry result for a file's bytes, analyzing it only on a miss. A miss still
+        reuses the !Feature blocks this cache has seen before (see analyze_geometry_incremental).
+        """
+        digest = digest or file_digest(data)
+        return self.get_or_compute(('geometry', digest), lambda: analyze_geometry_incremental(data, self))
+
+    def results(self, data, g_factor, min_trace_gap=None):
+        """
+        Returns the full analysis of a file's bytes at one G-factor as a dict with 'digest', 'segments',
+        'limiting_speed', 'stress_events', 'arc_info_events' and 'limiting_arc_details'. With a
+        min_trace_gap, the spatial events are cached per (file, min_trace_gap) and appended to the stress events.
+        """
+        digest = file_digest(data)
+        geometry = self.geometry(data, digest)
+        limiting_speed, arc_info_events = self.get_or_compute(('g_factor', digest, g_factor),
+                                                              lambda: apply_g_factor(geometry, g_factor))
+        stress_events = geometry['stress_events']
+        if min_trace_gap is not None:
+            stress_events = stress_events + self.get_or_compute(
+                ('spatial', digest, min_trace_gap), lambda: find_spatial_events(geometry['segments'], min_trace_gap))
+        return {'digest': digest, 'segments': geometry['segments'], 'limiting_speed': limiting_speed,
+                'stress_events': stress_events, 'arc_info_events': arc_info_events,
+                'limiting_arc_details': geometry['limiting_arc_details']}
+
+
+# --- REPORTING FUNCTIONS ---
 def generate_analysis_report(limiting_speed, stress_events, g_factor, limiting_arc_details):
     report_lines = []
     report_lines.append("--- Path Analysis Report ---")
@@ -253,7 +1956,7 @@ def generate_analysis_report(limiting_speed, stress_events, g_factor, limiting_a
     else:
         report_lines.append("No arcs found; could not determine a limiting process speed.")
     report_lines.append("")
-    test_types = ['Line-to-Line', 'Line-Arc Stress', 'Arc-to-Arc Stress']
+    test_types = ['Line-to-Line', 'Line-Arc Stress', 'Arc-to-Arc Stress', 'Path Intersection', 'Trace Spacing']
     for test_type in test_types:
         report_lines.append(f"[--- {test_type} Analysis ---]")
         events = [e for e in stress_events if e['type'] == test_type]
@@ -268,139 +1971,99 @@ def generate_analysis_report(limiting_speed, stress_events, g_factor, limiting_a
     return "\n".join(report_lines)
 
 
+ANNOTATION_PREFIXES = {EVENT_CATEGORY_STRESS: "! [STRESS WARNING]", EVENT_CATEGORY_INFO: "! [INFO]"}
+
+
+def _collect_annotations(stress_events, arc_info_events):
+    """Groups annotation comments by line number, classifying each event by its category tag."""
+    annotations = {}
+    for events, default_category in ((stress_events, EVENT_CATEGORY_STRESS), (arc_info_events, EVENT_CATEGORY_INFO)):
+        for event in events:
+            prefix = ANNOTATION_PREFIXES[event.get('category', default_category)]
+            annotations.setdefault(event['line_num'], []).append(f"{prefix} {event['message']}\n")
+    return annotations
+
+
+def iter_annotated_prg(source, limiting_speed, stress_events, arc_info_events, g_factor, limiting_arc_details):
+    """
+    Generator over the text of the annotated program: the analysis summary header, then the original
+    lines with the annotation comments merged in after the line they refer to. `source` may be a
+    path, a file object or the raw bytes of the program, so nothing has to be written to disk.
+    """
+    annotations = _collect_annotations(stress_events, arc_info_events)
+    yield "! --- ANALYSIS SUMMARY ---\n"
+    if limiting_speed:
+        accel_limit = g_factor * 9800.0
+        yield f"! Max Safe Process Speed (for G-Factor={g_factor}): {limiting_speed:.2f} mm/s\n"
+        if limiting_arc_details:
+            yield f"! -> Limited by arc with radius {limiting_arc_details['radius']:.4f} mm in Feature {limiting_arc_details['feature_num']}.\n"
+        yield f"! Corresponding Max Centripetal Acceleration: {accel_limit:.1f} mm/s^2\n"
+    else:
+        yield "! No arcs found in design to calculate a limiting speed.\n"
+    yield "! Geometric stress warnings are independent of speed.\n"
+    yield "! Arc acceleration info is calculated using the max safe speed.\n"
+    yield "! ------------------------\n\n"
+    infile, should_close = _open_prg_source(source)
+    try:
+        for i, line in enumerate(infile, 1):
+            yield line
+            if i in annotations:
+                yield from annotations[i]
+    finally:
+        if should_close:
+            infile.close()
+
+
+@timed_stage('annotate')
 def create_annotated_prg_file(original_filename, annotated_filename, limiting_speed, stress_events, arc_info_events,
                               g_factor, limiting_arc_details):
-    annotations = {}
-    for event in stress_events + arc_info_events:
-        line_num = event['line_num']
-        prefix = "! [STRESS WARNING]" if event in stress_events else "! [INFO]"
-        message = f"{prefix} {event['message']}"
-        if line_num not in annotations: annotations[line_num] = []
-        annotations[line_num].append(message)
     try:
-        with open(original_filename, 'r') as infile, open(annotated_filename, 'w') as outfile:
-            outfile.write("! --- ANALYSIS SUMMARY ---\n")
-            if limiting_speed:
-                accel_limit = g_factor * 9800.0
-                outfile.write(f"! Max Safe Process Speed (for G-Factor={g_factor}): {limiting_speed:.2f} mm/s\n")
-                if limiting_arc_details:
-                    outfile.write(
-                        f"! -> Limited by arc with radius {limiting_arc_details['radius']:.4f} mm in Feature {limiting_arc_details['feature_num']}.\n")
-                outfile.write(f"! Corresponding Max Centripetal Acceleration: {accel_limit:.1f} mm/s^2\n")
-            else:
-                outfile.write("! No arcs found in design to calculate a limiting speed.\n")
-            outfile.write("! Geometric stress warnings are independent of speed.\n")
-            outfile.write("! Arc acceleration info is calculated using the max safe speed.\n")
-            outfile.write("! ------------------------\n\n")
-            for i, line in enumerate(infile, 1):
-                outfile.write(line)
-                if i in annotations:
-                    for msg in annotations[i]:
-                        outfile.write(f"{msg}\n")
+        with open(annotated_filename, 'w') as outfile:
+            outfile.writelines(iter_annotated_prg(original_filename, limiting_speed, stress_events, arc_info_events,
+                                                  g_factor, limiting_arc_details))
     except Exception as e:
         raise Exception(f"Could not create annotated file. Error: {e}")
 
 
-# --- ANIMATION FUNCTIONS (MODIFIED) ---
-def interpolate_arc(start_x, start_y, center_x, center_y, angle_rad, num_points=30):
-    radius = np.sqrt((start_x - center_x) ** 2 + (start_y - center_y) ** 2)
-    if radius < 1e-9:
-        return [(start_x, start_y)] * num_points
-    start_angle_rad_calc = np.arctan2(start_y - center_y, start_x - center_x)
-    end_angle_rad_calc = start_angle_rad_calc + angle_rad
-    theta = np.linspace(start_angle_rad_calc, end_angle_rad_calc, num_points)
-    arc_x_points = center_x + radius * np.cos(theta)
-    arc_y_points = center_y + radius * np.sin(theta)
-    return list(zip(arc_x_points, arc_y_points))
-
-
-def animate_printer(filename_to_simulate, limiting_speed, animation_save_path):
-    """
-    Animates the toolpath and saves it to a file.
-    Returns the path to the saved animation file.
-    """
-    segments = parse_prg_file(filename_to_simulate)
-    if not segments:
-        return None  # Return None if no segments to draw
-
-    fig, ax = plt.subplots(figsize=(10, 8))
-    all_x, all_y = [], []
-    for seg in segments:
-        if 'start_x' in seg: all_x.extend([seg['start_x']])
-        if 'start_y' in seg: all_y.extend([seg['start_y']])
-        if seg['type'] == 'ARC2':
-            arc_points = interpolate_arc(seg['start_x'], seg['start_y'], seg['center_x'], seg['center_y'], seg['angle'])
-            if arc_points:
-                all_x.extend([p[0] for p in arc_points]);
-                all_y.extend([p[1] for p in arc_points])
-        elif 'x' in seg:
-            all_x.extend([seg['x']]);
-            all_y.extend([seg['y']])
-
-    if not all_x or not all_y:
-        ax.set_xlim(-5, 10);
-        ax.set_ylim(-2, 10)
-    else:
-        min_x, max_x = min(all_x), max(all_x)
-        min_y, max_y = min(all_y), max(all_y)
-        x_range = max_x - min_x if max_x > min_x else 2.0
-        y_range = max_y - min_y if max_y > min_y else 2.0
-        padding_x = x_range * 0.1;
-        padding_y = y_range * 0.1
-        ax.set_xlim(min_x - max(1.0, padding_x), max_x + max(1.0, padding_x))
-        ax.set_ylim(min_y - max(1.0, padding_y), max_y + max(1.0, padding_y))
-
-    ax.set_xlabel("X Position (mm)");
-    ax.set_ylabel("Y Position (mm)")
-    ax.set_title(f"Aerosol Jet Printer Simulation ({os.path.basename(filename_to_simulate)})")
-    ax.set_aspect('equal', adjustable='box');
-    ax.grid(True, linestyle='--', alpha=0.7)
-
-    head_dot = ax.plot([], [], 'yo', markersize=7, markeredgecolor='k', zorder=10)[0]
-    info_text = ax.text(0.02, 0.98, '', transform=ax.transAxes, fontsize=9, verticalalignment='top',
-                        bbox=dict(boxstyle="round,pad=0.3", fc="lightgoldenrodyellow", alpha=0.85))
-
-    def init():
-        head_dot.set_data([], [])
-        if segments and 'start_x' in segments[0]:
-            head_dot.set_data([segments[0]['start_x']], [segments[0]['start_y']])
-        info_text.set_text('Starting...')
-        return [head_dot, info_text]
-
-    def update(frame_idx):
-        if frame_idx >= len(segments):
-            info_text.set_text('Animation Complete')
-            return [head_dot, info_text]
-        seg = segments[frame_idx]
-        if 'start_x' not in seg: return [head_dot, info_text]
-        end_x, end_y = None, None
-        if seg['type'] == 'ARC2':
-            arc_pts = interpolate_arc(seg['start_x'], seg['start_y'], seg['center_x'], seg['center_y'], seg['angle'])
-            if arc_pts:
-                ax.plot([p[0] for p in arc_pts], [p[1] for p in arc_pts], 'r-' if seg['is_printing'] else 'b--',
-                        linewidth=2.0 if seg['is_printing'] else 1.2, alpha=0.8)
-                end_x, end_y = arc_pts[-1]
-        elif 'x' in seg:
-            ax.plot([seg['start_x'], seg['x']], [seg['start_y'], seg['y']], 'r-' if seg['is_printing'] else 'b--',
-                    linewidth=2.0 if seg['is_printing'] else 1.2, alpha=0.8)
-            end_x, end_y = seg['x'], seg['y']
-        if end_x is not None: head_dot.set_data([end_x], [end_y])
-        speed_display = f"{limiting_speed:.1f} mm/s (Limit)" if seg[
-                                                                    'is_printing'] and limiting_speed is not None else "Default Rapid"
-        status_text = "Printing" if seg['is_printing'] else "Rapid Move"
-        info_text.set_text(f"Feature: {seg.get('feature_num', 'N/A')}\n{status_text}\nSpeed: {speed_display}")
-        return [head_dot, info_text]
-
-    # --- THIS IS THE KEY CHANGE ---
-    # Instead of plt.show(), we create the animation object
-    ani = animation.FuncAnimation(fig, update, frames=len(segments) + 1, init_func=init, blit=False, interval=50,
-                                  repeat=False)
-
-    # And save it to the path provided
-    ani.save(animation_save_path, writer='ffmpeg', fps=15)
-
-    # Close the plot to free up memory on the server
-    plt.close(fig)
-
-    # Return the path to the video file
-    return animation_save_path
\ No newline at end of file
+@timed_stage('annotate')
+def annotate_prg_bytes(source, limiting_speed, stress_events, arc_info_events, g_factor, limiting_arc_details,
+                       compress=False, encoding='utf-8', chunk_lines=8192, compresslevel=6):
+    """
+    Builds the annotated program in memory (e.g. for a download button) straight from the uploaded
+    bytes. With compress=True the output is gzip-compressed as it is streamed.
+    """
+    lines = iter_annotated_prg(source, limiting_speed, stress_events, arc_info_events, g_factor,
+                               limiting_arc_details)
+    try:
+        if not compress:
+            output = "".join(lines).encode(encoding)
+        else:
+            buffer = io.BytesIO()
+            with gzip.GzipFile(fileobj=buffer, mode='wb', compresslevel=compresslevel) as gz:
+                chunk = list(itertools.islice(lines, chunk_lines))
+                while chunk:
+                    gz.write("".join(chunk).encode(encoding))
+                    chunk = list(itertools.islice(lines, chunk_lines))
+            output = buffer.getvalue()
+        record_count('annotated_bytes', len(output))
+        return output
+    except Exception as e:
+        raise Exception(f"Could not create annotated file. Error: {e}")
+
+
+# --- RENDERING ---
+# The animation and preview live in web_analyzer_render, the only module that imports matplotlib. Their
+# names are still available here; the module is imported the first time one of them is looked up.
+_RENDER_NAMES = frozenset({
+    'ANIMATION_FPS', 'PRINTING_STYLE', 'RAPID_STYLE', 'STRESS_MARKER_STYLES',
+    'segment_polylines', 'compute_plot_limits', 'plan_animation_frames',
+    'IncrementalToolpathRenderer', 'render_animation_parallel', 'animate_printer', 'render_toolpath_preview',
+    'render_toolpath_window',
+})
+
+
+def __getattr__(name):
+    if name in _RENDER_NAMES:
+        import web_analyzer_render
+        return getattr(web_analyzer_render, name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
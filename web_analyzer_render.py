@@ -0,0 +1,480 @@
+"""
+Rendering for the .prg analyzer: the toolpath animation and the static preview image.
+
+This is the only module that imports matplotlib. web_analyzer_logic imports it on first use of one of
+its names (e.g. web_analyzer_logic.animate_printer), so parsing and analysis never load matplotlib.
+"""
+import matplotlib
+
+matplotlib.use('Agg')  # Use a non-interactive backend for the server
+import matplotlib.pyplot as plt
+import matplotlib.animation as animation
+from matplotlib.backends.backend_agg import FigureCanvasAgg
+from matplotlib.collections import LineCollection
+from matplotlib.figure import Figure
+import numpy as np
+import os
+import math
+import multiprocessing
+import shutil
+import subprocess
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, wait
+
+from web_analyzer_logic import (SegmentTable, join_tessellated_runs, parse_prg_file, record_count, tessellate_segments,
+                                timed_stage)
+
+
+# --- ANIMATION FUNCTIONS ---
+ANIMATION_FPS = 15
+PROGRESS_INTERVAL = 0.5  # seconds between progress reports of a parallel render
+PRINTING_STYLE = {'color': 'r', 'linestyle': '-', 'linewidth': 2.0, 'alpha': 0.8}
+RAPID_STYLE = {'color': 'b', 'linestyle': '--', 'linewidth': 1.2, 'alpha': 0.8}
+
+
+def segment_polylines(table, start=0, stop=None):
+    """Returns one (k, 2) vertex array per segment in [start, stop), as views into the shared tessellation."""
+    stop = len(table) if stop is None else stop
+    if stop <= start:
+        return []
+    tessellation = tessellate_segments(table)
+    vertices, offsets = tessellation['vertices'], tessellation['offsets']
+    return np.split(vertices[offsets[start]:offsets[stop]], offsets[start + 1:stop] - offsets[start])
+
+
+def compute_plot_limits(table):
+    """Returns (xlim, ylim) covering every vertex of the shared tessellation, with padding."""
+    if not len(table):
+        return (-5, 10), (-2, 10)
+    vertices = tessellate_segments(table)['vertices']
+    min_x, min_y = vertices.min(axis=0)
+    max_x, max_y = vertices.max(axis=0)
+    return _padded_limits(min_x, max_x, min_y, max_y)
+
+
+def _padded_limits(min_x, max_x, min_y, max_y):
+    x_range = max_x - min_x if max_x > min_x else 2.0
+    y_range = max_y - min_y if max_y > min_y else 2.0
+    padding_x = max(1.0, x_range * 0.1)
+    padding_y = max(1.0, y_range * 0.1)
+    return (min_x - padding_x, max_x + padding_x), (min_y - padding_y, max_y + padding_y)
+
+
+def _style_toolpath_axes(ax, xlim, ylim, title):
+    ax.set_xlim(*xlim)
+    ax.set_ylim(*ylim)
+    ax.set_xlabel("X Position (mm)")
+    ax.set_ylabel("Y Position (mm)")
+    ax.set_title(title)
+    ax.set_aspect('equal', adjustable='box')
+    ax.grid(True, linestyle='--', alpha=0.7)
+
+
+def _info_text_for(table, index, limiting_speed):
+    """limiting_speed is the single limit, or an array of planned speeds per segment (plan['peak_speed'])."""
+    printing = table.is_printing[index]
+    if np.ndim(limiting_speed):
+        speed_display = f"{limiting_speed[index]:.1f} mm/s (Planned)"
+    elif printing and limiting_speed is not None:
+        speed_display = f"{limiting_speed:.1f} mm/s (Limit)"
+    else:
+        speed_display = "Default Rapid"
+    status_text = "Printing" if printing else "Rapid Move"
+    return f"Feature: {table.feature_num[index]}\n{status_text}\nSpeed: {speed_display}"
+
+
+def _start_ffmpeg(output_path, frame_size, fps):
+    """Starts an ffmpeg process that encodes raw RGBA frames from its stdin, with matplotlib's ffmpeg settings."""
+    codec = matplotlib.rcParams['animation.codec']
+    args = [animation.FFMpegWriter.bin_path(), '-f', 'rawvideo', '-vcodec', 'rawvideo', '-s', '%dx%d' % frame_size,
+            '-pix_fmt', 'rgba', '-framerate', str(fps), '-loglevel', 'error', '-i', 'pipe:', '-vcodec', codec]
+    extra_args = matplotlib.rcParams['animation.ffmpeg_args']
+    if codec == 'h264' and '-pix_fmt' not in extra_args:
+        args += ['-pix_fmt', 'yuv420p']
+    args += list(extra_args) + ['-y', output_path]
+    try:
+        return subprocess.Popen(args, stdin=subprocess.PIPE, stdout=subprocess.DEVNULL, stderr=subprocess.PIPE)
+    except FileNotFoundError:
+        raise Exception(f"Could not start ffmpeg ({args[0]}). Is it installed?")
+
+
+def _finish_ffmpeg(proc):
+    _, stderr = proc.communicate()
+    if proc.returncode != 0:
+        raise Exception(f"ffmpeg failed to encode the animation. Error: {stderr.decode(errors='replace').strip()}")
+
+
+def plan_animation_frames(segment_count, segments_per_frame=1, max_frames=None):
+    """
+    Returns the number of segments drawn per frame. With max_frames, segments are grouped so that the
+    video has at most max_frames drawing frames (plus the final "complete" frame) whatever the file size.
+    """
+    segments_per_frame = max(1, int(segments_per_frame))
+    if max_frames:
+        segments_per_frame = max(segments_per_frame, math.ceil(segment_count / max_frames))
+    return segments_per_frame
+
+
+class IncrementalToolpathRenderer:
+    """
+    Renders animation frames with a fixed set of artists. Segments that are already drawn live in a
+    cached background bitmap; each frame restores it, draws only its new segments (one LineCollection
+    with per-segment styles, in path order), caches the result and overlays the head marker and info box.
+    The cost of a frame therefore does not grow with the number of segments drawn before it.
+    """
+
+    def __init__(self, table, limiting_speed, title, segments_per_frame=1, xlim=None, ylim=None):
+        self.table = table
+        self.limiting_speed = limiting_speed
+        self.segments_per_frame = segments_per_frame
+        self.frame_count = math.ceil(len(table) / segments_per_frame) + 1  # the last frame shows completion
+        if xlim is None or ylim is None:
+            xlim, ylim = compute_plot_limits(table)
+        self.fig = Figure(figsize=(10, 8))
+        self.canvas = FigureCanvasAgg(self.fig)
+        self.ax = self.fig.add_subplot()
+        _style_toolpath_axes(self.ax, xlim, ylim, title)
+        # 'projecting' caps match the solid Line2D style the classic renderer draws segments with.
+        self.path_collection = LineCollection([], capstyle='projecting', animated=True)
+        self.ax.add_collection(self.path_collection, autolim=False)
+        self.head_dot = self.ax.plot([], [], 'yo', markersize=7, markeredgecolor='k', zorder=10, animated=True)[0]
+        self.info_text = self.ax.text(0.02, 0.98, '', transform=self.ax.transAxes, fontsize=9, verticalalignment='top',
+                                      bbox=dict(boxstyle="round,pad=0.3", fc="lightgoldenrodyellow", alpha=0.85),
+                                      animated=True)
+        self.canvas.draw()
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.drawn_until = 0
+        if len(table):
+            self.head_dot.set_data([table.start_x[0]], [table.start_y[0]])
+
+    @property
+    def frame_size(self):
+        return self.canvas.get_width_height(physical=True)
+
+    def _draw_segments(self, start, stop, batch_size=20000):
+        """Draws segments [start, stop) onto the cached background, in path order."""
+        self.canvas.restore_region(self.background)
+        for batch_start in range(start, stop, batch_size):
+            batch_stop = min(stop, batch_start + batch_size)
+            printing = self.table.is_printing[batch_start:batch_stop]
+            self.path_collection.set_segments(segment_polylines(self.table, batch_start, batch_stop))
+            self.path_collection.set_color([PRINTING_STYLE['color'] if p else RAPID_STYLE['color'] for p in printing])
+            self.path_collection.set_linestyle(
+                [PRINTING_STYLE['linestyle'] if p else RAPID_STYLE['linestyle'] for p in printing])
+            self.path_collection.set_linewidth(
+                [PRINTING_STYLE['linewidth'] if p else RAPID_STYLE['linewidth'] for p in printing])
+            self.path_collection.set_alpha(PRINTING_STYLE['alpha'])
+            self.ax.draw_artist(self.path_collection)
+        self.background = self.canvas.copy_from_bbox(self.fig.bbox)
+        self.drawn_until = stop
+
+    def seek(self, frame_idx):
+        """Draws everything before frame_idx in one pass, so rendering can start from that frame."""
+        self._draw_segments(self.drawn_until, min(len(self.table), frame_idx * self.segments_per_frame))
+        if self.drawn_until:
+            self.head_dot.set_data([self.table.end_x[self.drawn_until - 1]], [self.table.end_y[self.drawn_until - 1]])
+
+    def render_frame(self, frame_idx):
+        """Renders frame frame_idx (frames must be rendered in order) and returns its RGBA buffer."""
+        start = frame_idx * self.segments_per_frame
+        stop = min(len(self.table), start + self.segments_per_frame)
+        if start < len(self.table):
+            self._draw_segments(self.drawn_until, stop)
+            last = stop - 1
+            self.head_dot.set_data([self.table.end_x[last]], [self.table.end_y[last]])
+            self.info_text.set_text(_info_text_for(self.table, last, self.limiting_speed))
+        else:
+            self.canvas.restore_region(self.background)
+            self.info_text.set_text('Animation Complete')
+        self.ax.draw_artist(self.head_dot)
+        self.ax.draw_artist(self.info_text)
+        return self.canvas.buffer_rgba()
+
+    @timed_stage('animation.render_encode')
+    def write_video(self, output_path, frames=None, fps=ANIMATION_FPS, progress=None):
+        """
+        Encodes the given frame range (default: all frames) to output_path with ffmpeg.
+        progress(frames_done, frame_total) is called after every frame.
+        """
+        frames = range(self.frame_count) if frames is None else frames
+        if len(frames):
+            self.seek(frames[0])
+        proc = _start_ffmpeg(output_path, self.frame_size, fps)
+        try:
+            for done, frame_idx in enumerate(frames, 1):
+                proc.stdin.write(self.render_frame(frame_idx))
+                if progress is not None:
+                    progress(done, len(frames))
+        except BrokenPipeError:
+            pass  # ffmpeg exited early; its error is reported below
+        finally:
+            _finish_ffmpeg(proc)
+        return output_path
+
+    def close(self):
+        self.fig.clear()
+
+
+_frames_rendered = None  # in render_animation_parallel workers: the frame counter shared with the parent
+
+
+def _init_render_worker(frames_rendered):
+    global _frames_rendered
+    _frames_rendered = frames_rendered
+
+
+def _count_rendered_frame(frames_done, frame_total):
+    with _frames_rendered.get_lock():
+        _frames_rendered.value += 1
+
+
+def _render_video_chunk(table, limiting_speed, title, segments_per_frame, xlim, ylim, frame_start, frame_stop,
+                        output_path):
+    """Worker for render_animation_parallel: renders frames [frame_start, frame_stop) into their own video file."""
+    renderer = IncrementalToolpathRenderer(table, limiting_speed, title, segments_per_frame, xlim, ylim)
+    try:
+        return renderer.write_video(output_path, range(frame_start, frame_stop),
+                                    progress=_count_rendered_frame if _frames_rendered is not None else None)
+    finally:
+        renderer.close()
+
+
+@timed_stage('animation.concat')
+def _concat_videos(part_paths, output_path):
+    """Joins encoded video parts without re-encoding, using ffmpeg's concat demuxer."""
+    list_path = f"{output_path}.parts.txt"
+    with open(list_path, 'w') as list_file:
+        for part_path in part_paths:
+            escaped = os.path.abspath(part_path).replace("'", "'\\''")
+            list_file.write(f"file '{escaped}'\n")
+    try:
+        result = subprocess.run([animation.FFMpegWriter.bin_path(), '-loglevel', 'error', '-f', 'concat', '-safe', '0',
+                                 '-i', list_path, '-c', 'copy', '-y', output_path], capture_output=True)
+    finally:
+        os.remove(list_path)
+    if result.returncode != 0:
+        raise Exception(f"ffmpeg failed to join the animation parts. Error: {result.stderr.decode(errors='replace').strip()}")
+    return output_path
+
+
+@timed_stage('animation.parallel')
+def render_animation_parallel(table, limiting_speed, output_path, title, segments_per_frame=1, workers=None,
+                              progress=None):
+    """
+    Renders the incremental animation with a process pool. The frame range is split into one chunk per
+    worker; each worker first draws everything before its chunk in one pass (the same pixels the serial
+    renderer has accumulated by then), renders and encodes its frames to a separate file, and the parts
+    are joined losslessly with ffmpeg's concat demuxer. The workers count their frames in a shared
+    counter, which is passed to progress(frames_done, frame_total) every PROGRESS_INTERVAL seconds.
+    """
+    workers = workers or os.cpu_count() or 1
+    xlim, ylim = compute_plot_limits(table)
+    frame_count = math.ceil(len(table) / segments_per_frame) + 1
+    chunk_count = max(1, min(workers, frame_count))
+    bounds = [round(frame_count * i / chunk_count) for i in range(chunk_count + 1)]
+    part_dir = tempfile.mkdtemp(prefix="animation_parts_", dir=os.path.dirname(os.path.abspath(output_path)))
+    try:
+        # 'spawn' for the reason given in web_analyzer_logic.analyze_geometry_parallel.
+        context = multiprocessing.get_context('spawn')
+        frames_rendered = context.Value('q', 0)
+        with ProcessPoolExecutor(max_workers=chunk_count, mp_context=context, initializer=_init_render_worker,
+                                 initargs=(frames_rendered,)) as pool:
+            futures = [pool.submit(_render_video_chunk, table, limiting_speed, title, segments_per_frame, xlim, ylim,
+                                   bounds[i], bounds[i + 1], os.path.join(part_dir, f"part_{i:04d}.mp4"))
+                       for i in range(chunk_count)]
+            while progress is not None and wait(futures, timeout=PROGRESS_INTERVAL).not_done:
+                progress(frames_rendered.value, frame_count)
+            part_paths = [future.result() for future in futures]
+        if progress is not None:
+            progress(frame_count, frame_count)
+        return _concat_videos(part_paths, output_path)
+    finally:
+        shutil.rmtree(part_dir, ignore_errors=True)
+
+
+@timed_stage('animation')
+def animate_printer(filename_to_simulate, limiting_speed, animation_save_path, render_mode='classic',
+                    segments_per_frame=1, max_frames=None, workers=1, segments=None, progress=None):
+    """
+    Animates the toolpath and saves it to a file.
+    Returns the path to the saved animation file.
+    render_mode='classic' adds one Line2D per frame and redraws the whole figure each frame.
+    render_mode='incremental' uses IncrementalToolpathRenderer, whose per-frame cost is constant;
+    segments_per_frame and max_frames group segments into frames to bound the video length.
+    workers > 1 renders and encodes the incremental animation in parallel (see render_animation_parallel).
+    limiting_speed may also be the per-segment planned speeds from plan_velocity_profile.
+    Pass the already parsed `segments` (e.g. a loaded toolpath) to skip parsing; filename_to_simulate
+    then only names the animation. progress(frames_done, frame_total) is called as frames are rendered.
+    """
+    segments = parse_prg_file(filename_to_simulate) if segments is None else SegmentTable.from_segments(segments)
+    if not len(segments):
+        return None  # Return None if no segments to draw
+    title = f"Aerosol Jet Printer Simulation ({os.path.basename(filename_to_simulate)})"
+
+    if render_mode == 'incremental':
+        segments_per_frame = plan_animation_frames(len(segments), segments_per_frame, max_frames)
+        record_count('animation_frames', math.ceil(len(segments) / segments_per_frame) + 1)
+        if workers is None or workers > 1:
+            return render_animation_parallel(segments, limiting_speed, animation_save_path, title, segments_per_frame,
+                                             workers, progress)
+        renderer = IncrementalToolpathRenderer(segments, limiting_speed, title, segments_per_frame)
+        try:
+            return renderer.write_video(animation_save_path, progress=progress)
+        finally:
+            renderer.close()
+    if render_mode != 'classic':
+        raise ValueError(f"Unknown render mode: {render_mode}")
+    if workers is None or workers > 1:
+        raise ValueError("Parallel rendering requires render_mode='incremental'.")
+
+    fig, ax = plt.subplots(figsize=(10, 8))
+    tessellation = tessellate_segments(segments)
+    vertices, offsets = tessellation['vertices'], tessellation['offsets']
+    xlim, ylim = compute_plot_limits(segments)
+    _style_toolpath_axes(ax, xlim, ylim, title)
+
+    head_dot = ax.plot([], [], 'yo', markersize=7, markeredgecolor='k', zorder=10)[0]
+    info_text = ax.text(0.02, 0.98, '', transform=ax.transAxes, fontsize=9, verticalalignment='top',
+                        bbox=dict(boxstyle="round,pad=0.3", fc="lightgoldenrodyellow", alpha=0.85))
+
+    def init():
+        head_dot.set_data([segments.start_x[0]], [segments.start_y[0]])
+        info_text.set_text('Starting...')
+        return [head_dot, info_text]
+
+    def update(frame_idx):
+        if frame_idx >= len(segments):
+            info_text.set_text('Animation Complete')
+            return [head_dot, info_text]
+        points = vertices[offsets[frame_idx]:offsets[frame_idx + 1]]
+        printing = segments.is_printing[frame_idx]
+        ax.plot(points[:, 0], points[:, 1], 'r-' if printing else 'b--', linewidth=2.0 if printing else 1.2, alpha=0.8)
+        head_dot.set_data([points[-1, 0]], [points[-1, 1]])
+        info_text.set_text(_info_text_for(segments, frame_idx, limiting_speed))
+        return [head_dot, info_text]
+
+    # --- THIS IS THE KEY CHANGE ---
+    # Instead of plt.show(), we create the animation object
+    ani = animation.FuncAnimation(fig, update, frames=len(segments) + 1, init_func=init, blit=False, interval=50,
+                                  repeat=False)
+
+    # And save it to the path provided
+    ani.save(animation_save_path, writer='ffmpeg', fps=ANIMATION_FPS,
+             progress_callback=(lambda frame_idx, frame_total: progress(frame_idx + 1, frame_total)) if progress else None)
+
+    # Close the plot to free up memory on the server
+    plt.close(fig)
+
+    # Return the path to the video file
+    return animation_save_path
+
+
+# --- STATIC PREVIEW ---
+STRESS_MARKER_STYLES = {
+    'Line-to-Line': {'color': 'darkorange', 'marker': 'o'},
+    'Line-Arc Stress': {'color': 'magenta', 'marker': 's'},
+    'Arc-to-Arc Stress': {'color': 'purple', 'marker': 'D'},
+    'Path Intersection': {'color': 'black', 'marker': 'X'},
+    'Trace Spacing': {'color': 'gold', 'marker': '^'},
+}
+
+
+def _tessellate_runs(table, tolerance):
+    """
+    Joins the shared tessellation into one polyline per run of consecutive segments with the same
+    printing state, merging consecutive vertices that fall in the same `tolerance`-sized grid cell.
+    Returns (run_polylines, run_is_printing).
+    """
+    joined = join_tessellated_runs(table)
+    x, y = joined['vertices'][:, 0], joined['vertices'][:, 1]
+    # Drop vertices that fall in the same tolerance-sized cell as the previous one; runs keep both ends.
+    cell_x, cell_y = np.floor(x / tolerance), np.floor(y / tolerance)
+    keep = np.ones(len(x), dtype=bool)
+    keep[1:] = (cell_x[1:] != cell_x[:-1]) | (cell_y[1:] != cell_y[:-1])
+    run_first = joined['run_starts'][:-1]
+    keep[run_first] = True
+    keep[np.append(run_first[1:], len(x)) - 1] = True
+    run_lengths = np.add.reduceat(keep, run_first) if len(run_first) else np.zeros(0, dtype=np.int64)
+    run_polylines = np.split(np.column_stack((x[keep], y[keep])), np.cumsum(run_lengths)[:-1])
+    return run_polylines, joined['run_is_printing']
+
+
+@timed_stage('preview')
+def render_toolpath_preview(segments, output, stress_events=(), image_format='png', title="Toolpath Preview"):
+    """
+    Draws the whole toolpath in one pass as a static image (PNG or SVG) and writes it to `output`
+    (a path or a binary file object). Printing and rapid moves are two LineCollections and the
+    stress events are overlaid as scatter markers, at most one per type and pixel. Takes already
+    parsed segments. Returns `output`.
+    """
+    table = SegmentTable.from_segments(segments)
+    fig = Figure(figsize=(10, 8))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    xlim, ylim = (-5, 10), (-2, 10)
+    if len(table):
+        span = max(np.ptp(np.concatenate((table.start_x, table.end_x))),
+                   np.ptp(np.concatenate((table.start_y, table.end_y))), 1e-6)
+        # About half a pixel at this figure size, so arcs look smooth without extra vertices.
+        run_polylines, run_is_printing = _tessellate_runs(table, span / 2000)
+        vertices = np.concatenate(run_polylines)
+        xlim, ylim = _padded_limits(vertices[:, 0].min(), vertices[:, 0].max(), vertices[:, 1].min(),
+                                    vertices[:, 1].max())
+        for style, printing, label in ((RAPID_STYLE, False, "Rapid move"), (PRINTING_STYLE, True, "Printing")):
+            ax.add_collection(LineCollection([run for run, p in zip(run_polylines, run_is_printing) if p == printing],
+                                             colors=style['color'], linestyles=style['linestyle'],
+                                             linewidths=style['linewidth'], alpha=style['alpha'], label=label),
+                              autolim=False)
+    _style_toolpath_axes(ax, xlim, ylim, title)
+    coords_by_type = {}
+    for event in stress_events:
+        coords_by_type.setdefault(event['type'], []).append(event['coords'])
+    # At most one marker per type and pixel: more would be drawn on top of each other.
+    width, height = fig.get_size_inches() * fig.dpi
+    pixel = max((xlim[1] - xlim[0]) / width, (ylim[1] - ylim[0]) / height)
+    for event_type, marker_style in STRESS_MARKER_STYLES.items():
+        coords = coords_by_type.get(event_type)
+        if coords:
+            shown = _one_point_per_cell(np.array(coords, dtype=float), pixel)
+            record_count('preview_markers', len(shown))
+            ax.scatter(shown[:, 0], shown[:, 1], s=30, edgecolors='k', linewidths=0.5, zorder=5,
+                       label=f"{event_type} ({len(coords)})", **marker_style)
+    if ax.get_legend_handles_labels()[0]:
+        ax.legend(loc='upper right', fontsize=8)
+    fig.savefig(output, format=image_format)
+    return output
+
+
+def _one_point_per_cell(points, cell):
+    """The first of the (n, 2) points in every `cell`-sized grid square, in their original order."""
+    cells = np.floor((points - points.min(axis=0)) / cell).astype(np.int64)
+    _, first = np.unique(cells[:, 0] * (cells[:, 1].max() + 1) + cells[:, 1], return_index=True)
+    return points[np.sort(first)]
+
+
+@timed_stage('lod_view')
+def render_toolpath_window(view, lod, output, x_range, y_range, image_format='png', title="Toolpath"):
+    """
+    Draws one window of a level-of-detail pyramid, as returned by lod_window(), and writes it
+    to `output`. x_range and y_range are the window limits. Returns `output`.
+    """
+    fig = Figure(figsize=(8, 8))
+    FigureCanvasAgg(fig)
+    ax = fig.add_subplot()
+    for style, printing, label in ((RAPID_STYLE, False, "Rapid move"), (PRINTING_STYLE, True, "Printing")):
+        lines = view['lines'][view['is_printing'] == printing]
+        if len(lines):
+            ax.add_collection(LineCollection(lines, colors=style['color'], linestyles=style['linestyle'],
+                                             linewidths=style['linewidth'], alpha=style['alpha'], label=label),
+                              autolim=False)
+    _style_toolpath_axes(ax, x_range, y_range, title)
+    event_types = lod['event_type'][view['events']]
+    for event_type, marker_style in STRESS_MARKER_STYLES.items():
+        shown = view['events'][event_types == event_type]
+        if len(shown):
+            ax.scatter(lod['event_x'][shown], lod['event_y'][shown], s=30, edgecolors='k', linewidths=0.5,
+                       zorder=5, label=f"{event_type} ({len(shown)})", **marker_style)
+    if ax.get_legend_handles_labels()[0]:
+        ax.legend(loc='upper right', fontsize=8)
+    fig.savefig(output, format=image_format)
+    return output